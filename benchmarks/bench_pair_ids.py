@@ -0,0 +1,132 @@
+"""
+Benchmark: random (UUIDv4) vs time-ordered (UUIDv7) pair ids
+
+For each id kind, COPYs tens of millions of pairs in batches into a pairs-like
+table (UUID primary key), plus messages for the pairs of each batch into a
+messages-like table indexed on (pair_id, created_at). Reports insert
+throughput overall and for the last tenth of the run (once the indexes no
+longer fit in cache), and the final table and index sizes. Leaf density is
+reported too when the pgstattuple extension is available.
+
+Usage:
+    python benchmarks/bench_pair_ids.py --pairs 20000000 --messages-per-pair 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import asyncpg
+
+from check_query_plans import SCHEMA
+from bot.utils.ids import uuid7
+
+ID_KINDS = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+
+async def create_tables(conn, kind: str):
+    await conn.execute(f"""
+        CREATE TABLE pairs_{kind} (
+            pair_id UUID PRIMARY KEY,
+            user_a BIGINT NOT NULL,
+            user_b BIGINT NOT NULL,
+            started_at TIMESTAMPTZ NOT NULL
+        )
+    """)
+    await conn.execute(f"""
+        CREATE TABLE messages_{kind} (
+            id BIGSERIAL PRIMARY KEY,
+            pair_id UUID NOT NULL,
+            from_id BIGINT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL
+        )
+    """)
+    await conn.execute(f"CREATE INDEX messages_{kind}_pair_created ON messages_{kind} (pair_id, created_at DESC)")
+
+
+async def load(conn, kind: str, pairs: int, batch: int, messages_per_pair: int) -> dict:
+    """COPY pairs and their messages batch by batch; returns timings"""
+    new_id = ID_KINDS[kind]
+    batch_seconds = []
+    for start in range(0, pairs, batch):
+        size = min(batch, pairs - start)
+        now = datetime.now(timezone.utc)
+        pair_rows = [(new_id(), start + i, start + i + 1, now) for i in range(size)]
+        message_rows = [
+            (pair_id, user_a, now)
+            for pair_id, user_a, _, _ in pair_rows
+            for _ in range(messages_per_pair)
+        ]
+        # Messages for live pairs interleave rather than arriving in pair order
+        random.shuffle(message_rows)
+
+        started = time.perf_counter()
+        await conn.copy_records_to_table(f"pairs_{kind}", records=pair_rows)
+        if message_rows:
+            await conn.copy_records_to_table(
+                f"messages_{kind}", records=message_rows, columns=["pair_id", "from_id", "created_at"]
+            )
+        batch_seconds.append((size, time.perf_counter() - started))
+
+    tail = batch_seconds[-max(1, len(batch_seconds) // 10):]
+    return {
+        "rows_per_s": pairs / sum(seconds for _, seconds in batch_seconds),
+        "tail_rows_per_s": sum(size for size, _ in tail) / sum(seconds for _, seconds in tail),
+    }
+
+
+async def sizes(conn, kind: str, stattuple: bool) -> dict:
+    result = {}
+    for relation in (f"pairs_{kind}", f"pairs_{kind}_pkey", f"messages_{kind}_pair_created"):
+        result[relation] = await conn.fetchval("SELECT pg_relation_size($1::regclass)", relation)
+        if stattuple and relation != f"pairs_{kind}":
+            result[f"{relation} leaf density"] = await conn.fetchval(
+                "SELECT avg_leaf_density FROM pgstatindex($1::regclass)", f"{SCHEMA}.{relation}"
+            )
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--pairs", type=int, default=20_000_000)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--messages-per-pair", type=int, default=2)
+    args = parser.parse_args()
+
+    if not args.dsn:
+        print("❌ Set DATABASE_URL or pass --dsn")
+        sys.exit(2)
+
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        await conn.execute(f"SET search_path = {SCHEMA}, public")
+        try:
+            await conn.execute("CREATE EXTENSION IF NOT EXISTS pgstattuple")
+            stattuple = True
+        except asyncpg.PostgresError:
+            stattuple = False
+
+        for kind in ID_KINDS:
+            await create_tables(conn, kind)
+            timings = await load(conn, kind, args.pairs, args.batch, args.messages_per_pair)
+            print(f"\n{kind}: {timings['rows_per_s']:,.0f} pairs/s overall, "
+                  f"{timings['tail_rows_per_s']:,.0f} pairs/s over the last tenth")
+            for relation, value in (await sizes(conn, kind, stattuple)).items():
+                if relation.endswith("density"):
+                    print(f"  {relation:<42} {value:>8.1f}%")
+                else:
+                    print(f"  {relation:<42} {value / 1024 / 1024:>8.0f} MB")
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
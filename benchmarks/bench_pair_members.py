@@ -0,0 +1,91 @@
+"""
+Benchmark: per-user pair lookups, OR predicate on pairs vs pair_members
+
+Seeds a scratch schema (same DDL as init_db.py), then times the old
+`(user_a = $1 OR user_b = $1)` queries against their pair_members equivalents
+for random users.
+
+Usage:
+    python benchmarks/bench_pair_members.py --pairs 1000000 --lookups 5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+import asyncpg
+
+from check_query_plans import SCHEMA, create_schema, register_json_codecs, seed
+
+# (name, before, after)
+QUERIES = [
+    ("active pair", """
+        SELECT pair_id FROM pairs
+        WHERE (user_a = $1 OR user_b = $1) AND is_active = true
+        ORDER BY started_at DESC LIMIT 1
+    """, """
+        SELECT pair_id FROM pair_members
+        WHERE user_id = $1 AND is_active = true
+        ORDER BY started_at DESC LIMIT 1
+    """),
+    ("chat count", """
+        SELECT COUNT(*) FROM pairs WHERE user_a = $1 OR user_b = $1
+    """, """
+        SELECT COUNT(*) FROM pair_members WHERE user_id = $1
+    """),
+]
+
+
+async def time_query(conn, query: str, user_ids: list) -> dict:
+    statement = await conn.prepare(query)
+    latencies = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        await statement.fetch(user_id)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "mean_us": statistics.mean(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--pairs", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    if not args.dsn:
+        print("❌ Set DATABASE_URL or pass --dsn")
+        sys.exit(2)
+
+    conn = await asyncpg.connect(args.dsn)
+    await register_json_codecs(conn)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        await conn.execute(f"SET search_path = {SCHEMA}, public")
+        await create_schema(conn)
+        await seed(conn, args.users, args.pairs, args.messages)
+
+        user_ids = [random.randint(1, args.users) for _ in range(args.lookups)]
+        print(f"\n{'query':<12} {'before mean':>12} {'after mean':>11} {'before p99':>11} {'after p99':>10}")
+        for name, before, after in QUERIES:
+            old = await time_query(conn, before, user_ids)
+            new = await time_query(conn, after, user_ids)
+            print(f"{name:<12} {old['mean_us']:>10.0f}us {new['mean_us']:>9.0f}us "
+                  f"{old['p99_us']:>9.0f}us {new['p99_us']:>8.0f}us")
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
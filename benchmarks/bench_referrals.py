@@ -0,0 +1,152 @@
+"""
+Benchmark: referral processing under a burst of sign-ups through one link
+
+Creates a scratch schema (same DDL as init_db.py) with one referrer and N new
+users, then credits all N referrals to the referrer concurrently, first with
+the old five-round-trip path (exists check, INSERT, count UPDATE, SELECT,
+unlock UPDATE, no transaction) and then with the single referrals.process
+statement. A tenth of the users sign up twice (a repeated /start). Reports wall
+time, per-referral latency, unlock writes, errors and whether the referrer ends
+up with the right count and features.
+
+Usage:
+    python benchmarks/bench_referrals.py --signups 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+
+from check_query_plans import SCHEMA, create_schema, register_json_codecs
+from bot.database.repository import STATEMENTS
+from config.constants import REFERRAL_UNLOCK_THRESHOLD, PARTNER_PREFERENCE_UNLOCK_THRESHOLD
+
+REFERRER_ID = 1
+EXPECTED_FEATURES = {"partner_preference": True, "see_gender": True, "search_by_age": True}
+
+
+async def old_path(conn, referrer_id: int, referree_id: int) -> int:
+    """The previous process_referral: five round trips; returns unlock writes"""
+    existing = await conn.fetchrow(
+        "SELECT id FROM referrals WHERE referrer_id = $1 AND referree_id = $2", referrer_id, referree_id
+    )
+    if existing:
+        return 0
+    await conn.execute(
+        "INSERT INTO referrals (referrer_id, referree_id, created_at) VALUES ($1, $2, NOW())",
+        referrer_id, referree_id
+    )
+    await conn.execute("UPDATE users SET referrals_count = referrals_count + 1 WHERE id = $1", referrer_id)
+    user_data = await conn.fetchrow("SELECT referrals_count, unlocked_features FROM users WHERE id = $1", referrer_id)
+    unlocked = dict(user_data['unlocked_features'] or {})
+    updated = False
+    if user_data['referrals_count'] >= PARTNER_PREFERENCE_UNLOCK_THRESHOLD and not unlocked.get('partner_preference'):
+        unlocked['partner_preference'] = True
+        updated = True
+    if user_data['referrals_count'] >= REFERRAL_UNLOCK_THRESHOLD and not unlocked.get('see_gender'):
+        unlocked['see_gender'] = True
+        unlocked['search_by_age'] = True
+        updated = True
+    if updated:
+        await conn.execute("UPDATE users SET unlocked_features = $1::jsonb WHERE id = $2", unlocked, referrer_id)
+        return 1
+    return 0
+
+
+async def new_path(conn, referrer_id: int, referree_id: int) -> int:
+    """referrals.process: one statement; returns unlock writes (thresholds crossed)"""
+    count = await conn.fetchval(
+        STATEMENTS["referrals.process"].sql, referrer_id, referree_id,
+        PARTNER_PREFERENCE_UNLOCK_THRESHOLD, REFERRAL_UNLOCK_THRESHOLD
+    )
+    return int(count in (PARTNER_PREFERENCE_UNLOCK_THRESHOLD, REFERRAL_UNLOCK_THRESHOLD))
+
+
+async def run_burst(pool, process, signups: int) -> dict:
+    latencies = []
+    unlock_writes = 0
+    errors = 0
+
+    async def signup(referree_id: int):
+        nonlocal unlock_writes, errors
+        async with pool.acquire() as conn:
+            started = time.perf_counter()
+            try:
+                unlock_writes += await process(conn, REFERRER_ID, referree_id)
+            except asyncpg.PostgresError:
+                # The old path loses the exists-then-insert race on a repeated sign-up
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    # Every new user signs up through the same link; a tenth of them twice
+    referrees = list(range(REFERRER_ID + 1, REFERRER_ID + 1 + signups))
+    await asyncio.gather(*(signup(referree_id) for referree_id in referrees + referrees[:signups // 10]))
+    elapsed = time.perf_counter() - started
+
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("SELECT referrals_count, unlocked_features FROM users WHERE id = $1", REFERRER_ID)
+        rows = await conn.fetchval("SELECT COUNT(*) FROM referrals WHERE referrer_id = $1", REFERRER_ID)
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "unlock_writes": unlock_writes,
+        "errors": errors,
+        "count_ok": row['referrals_count'] == rows == signups,
+        "features_ok": (row['unlocked_features'] or {}) == EXPECTED_FEATURES,
+    }
+
+
+async def reset(pool, signups: int):
+    async with pool.acquire() as conn:
+        await conn.execute("TRUNCATE referrals")
+        await conn.execute("DELETE FROM users")
+        await conn.execute(f"""
+            INSERT INTO users (id, display_name, referrals_count, unlocked_features)
+            SELECT g, 'user' || g, 0, '{{}}'::jsonb FROM generate_series(1, {signups + 1}) g
+        """)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--signups", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    if not args.dsn:
+        print("❌ Set DATABASE_URL or pass --dsn")
+        sys.exit(2)
+
+    conn = await asyncpg.connect(args.dsn)
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"SET search_path = {SCHEMA}, public")
+    await create_schema(conn)
+    pool = await asyncpg.create_pool(
+        args.dsn, min_size=args.concurrency, max_size=args.concurrency,
+        server_settings={"search_path": f"{SCHEMA}, public"}, init=register_json_codecs
+    )
+    try:
+        print(f"{'path':<6} {'wall':>8} {'mean':>9} {'p99':>9} {'unlock writes':>14} {'errors':>7} "
+              f"{'count':>6} {'features':>9}")
+        for name, process in (("old", old_path), ("new", new_path)):
+            await reset(pool, args.signups)
+            result = await run_burst(pool, process, args.signups)
+            print(f"{name:<6} {result['elapsed']:>7.2f}s {result['mean_ms']:>7.2f}ms {result['p99_ms']:>7.2f}ms "
+                  f"{result['unlock_writes']:>14} {result['errors']:>7} {'ok' if result['count_ok'] else 'WRONG':>6} "
+                  f"{'ok' if result['features_ok'] else 'WRONG':>9}")
+    finally:
+        await pool.close()
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Benchmark: throughput scaling with uvicorn worker count on one machine
+
+Starts the app with 1, 2, 4... worker processes and drives it with concurrent
+HTTP requests. Requires the same environment as the app (BOT_TOKEN,
+DATABASE_URL, REDIS_URL).
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 15
+    python benchmarks/bench_workers.py --path /webhook   # synthetic no-op updates
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60.0):
+    """Poll /health until the app answers"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(f"{base_url}/health")
+                if response.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("App did not become healthy in time")
+
+
+async def drive(base_url: str, path: str, concurrency: int, duration: float) -> dict:
+    """Fire requests from `concurrency` clients for `duration` seconds"""
+    latencies = []
+    errors = 0
+    update_id = 0
+    deadline = time.monotonic() + duration
+
+    async def client_loop(client: httpx.AsyncClient):
+        nonlocal errors, update_id
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                if path == "/webhook":
+                    # An update with no message/callback: parsed and dispatched, no handler matches
+                    update_id += 1
+                    response = await client.post(f"{base_url}{path}", json={"update_id": update_id})
+                else:
+                    response = await client.get(f"{base_url}{path}")
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except httpx.TransportError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+    }
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    for workers in args.workers:
+        server = start_server(workers, args.port)
+        try:
+            await wait_until_ready(base_url)
+            await drive(base_url, args.path, args.concurrency, 2.0)  # warm-up
+            result = await drive(base_url, args.path, args.concurrency, args.duration)
+            results.append((workers, result))
+            print(f"workers={workers}: {result['rps']:.0f} req/s, "
+                  f"p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms errors={result['errors']}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if results:
+        baseline = results[0][1]["rps"] or 1
+        print("\nworkers  req/s   speedup")
+        for workers, result in results:
+            print(f"{workers:>7}  {result['rps']:>6.0f}  {result['rps'] / baseline:>6.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
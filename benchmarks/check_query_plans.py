@@ -0,0 +1,159 @@
+"""
+Query plan regression check for the hot access paths
+
+Seeds a scratch schema (built with the same DDL as init_db.py) with millions of
+messages, runs EXPLAIN for each hot query and exits non-zero if any of them
+plans a sequential scan. The scratch schema is dropped afterwards.
+
+Usage:
+    python benchmarks/check_query_plans.py --messages 2000000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import asyncpg
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from init_db import create_schema
+from bot.utils.json_codec import register_json_codecs
+
+SCHEMA = "plan_check"
+
+# (name, query, sample argument)
+QUERIES = [
+    ("get_user_pair", """
+        SELECT pair_id FROM pair_members
+        WHERE user_id = $1 AND is_active = true
+        ORDER BY started_at DESC LIMIT 1
+    """, 4242),
+    ("get_user_pair_info", """
+        SELECT p.pair_id, p.user_a, p.user_b, p.started_at, p.last_message_at, p.is_active
+        FROM pair_members pm
+        JOIN pairs p ON p.pair_id = pm.pair_id
+        WHERE pm.user_id = $1 AND pm.is_active = true
+        ORDER BY pm.started_at DESC LIMIT 1
+    """, 4242),
+    ("get_user_stats", """
+        SELECT u.id, u.display_name, c.chats_total, c.chats_active, c.messages_sent
+        FROM users u
+        LEFT JOIN user_counters c ON c.user_id = u.id
+        WHERE u.id = $1
+    """, 4242),
+    ("handle_report.excerpt", """
+        SELECT from_id, content, created_at
+        FROM messages
+        WHERE pair_id = (SELECT pair_id FROM pairs ORDER BY pair_id LIMIT 1)
+        ORDER BY created_at DESC
+        LIMIT 20
+    """, None),
+]
+
+
+async def seed(conn, users: int, pairs: int, messages: int):
+    """Fill the scratch schema with a realistic distribution"""
+    started = time.monotonic()
+    await conn.execute(f"""
+        INSERT INTO users (id, display_name)
+        SELECT g, 'user' || g FROM generate_series(1, {users}) g
+    """)
+    # Roughly 1% of pairs are active. A user is in at most one active pair (the
+    # unique index on pair_members enforces it), so active pairs take disjoint
+    # users (2g-1, 2g); ended pairs take any two different users.
+    active = min(pairs // 100, users // 2)
+    await conn.execute(f"""
+        INSERT INTO pairs (pair_id, user_a, user_b, started_at, last_message_at, is_active)
+        SELECT gen_random_uuid(), a,
+               CASE WHEN g <= {active} THEN a + 1
+                    ELSE 1 + (a + floor(random() * ({users} - 1))::bigint) % {users} END,
+               NOW() - random() * INTERVAL '30 days', NOW() - random() * INTERVAL '7 days', g <= {active}
+        FROM (
+            SELECT g, CASE WHEN g <= {active} THEN 2 * g - 1
+                           ELSE 1 + floor(random() * {users})::bigint END AS a
+            FROM generate_series(1, {pairs}) g
+        ) seeded
+    """)
+    await conn.execute("""
+        INSERT INTO pair_members (pair_id, user_id, is_active, started_at)
+        SELECT pair_id, user_a, is_active, started_at FROM pairs
+        UNION
+        SELECT pair_id, user_b, is_active, started_at FROM pairs
+    """)
+    await conn.execute("""
+        INSERT INTO user_counters (user_id, chats_total, chats_active)
+        SELECT user_id, COUNT(*), COUNT(*) FILTER (WHERE is_active) FROM pair_members GROUP BY user_id
+    """)
+    await conn.execute("CREATE TEMP TABLE seed_pairs AS SELECT row_number() OVER () AS n, pair_id, user_a FROM pairs")
+    await conn.execute(f"""
+        INSERT INTO messages (pair_id, from_id, content, created_at)
+        SELECT p.pair_id, p.user_a, 'message ' || g, NOW() - random() * INTERVAL '7 days'
+        FROM generate_series(1, {messages}) g
+        JOIN seed_pairs p ON p.n = 1 + (g % {pairs})
+    """)
+    await conn.execute(f"""
+        INSERT INTO reports (pair_id, reported_by, reported_user, status)
+        SELECT pair_id, user_a, user_a, CASE WHEN random() < 0.02 THEN 'pending' ELSE 'resolved' END
+        FROM pairs LIMIT {max(1, pairs // 20)}
+    """)
+    await conn.execute("ANALYZE")
+    print(f"Seeded {users} users, {pairs} pairs, {messages} messages in {time.monotonic() - started:.1f}s")
+
+
+def find_seq_scans(plan: dict) -> list:
+    """Collect relations read by Seq Scan nodes"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child))
+    return found
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--pairs", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    if not args.dsn:
+        print("❌ Set DATABASE_URL or pass --dsn")
+        sys.exit(2)
+
+    conn = await asyncpg.connect(args.dsn)
+    await register_json_codecs(conn)
+    failures = []
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        await conn.execute(f"SET search_path = {SCHEMA}, public")
+        await create_schema(conn)
+        await seed(conn, args.users, args.pairs, args.messages)
+
+        for name, query, arg in QUERIES:
+            explain = f"EXPLAIN (FORMAT JSON) {query}"
+            plan_json = await conn.fetchval(explain, arg) if arg is not None else await conn.fetchval(explain)
+            plan = plan_json[0]["Plan"]
+            seq_scans = find_seq_scans(plan)
+            if seq_scans:
+                failures.append(name)
+                print(f"❌ {name}: sequential scan on {', '.join(seq_scans)}")
+            else:
+                print(f"✅ {name}: {plan['Node Type']} (cost {plan['Total Cost']:.0f})")
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+    if failures:
+        print(f"\n{len(failures)} queries fall back to sequential scans")
+        sys.exit(1)
+    print("\nAll hot queries use indexes")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+"""
+Redis Cluster check for the key layout in bot/services/redis_keys.py
+
+Runs the bot's multi-key operations against a real cluster (e.g. a local
+six-node cluster from redis/utils/create-cluster): the pending input MGET and
+a multi-key DEL of every key of a user, a two-key script on the routing keys,
+and a queue claim (LRANGE + LREM in one script) on every matchmaking queue. A
+cross-slot layout fails with CROSSSLOT. Also prints how the queues spread
+over slots and nodes. Exits non-zero on any failure; keys are deleted after.
+
+This only checks slot placement. The bot itself uses a single-node client, and
+pair create/end and queue joins are not atomic across slots (see redis_keys).
+
+Usage:
+    python benchmarks/check_redis_cluster.py --url redis://127.0.0.1:30001
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+from redis.asyncio.cluster import RedisCluster
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bot.services import redis_keys
+
+# Same shape as a heartbeat: both routing keys updated together
+ROUTING_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return redis.call('HLEN', KEYS[1])
+"""
+
+# Atomic form of a queue claim: peek at the oldest entry and remove it
+CLAIM_SCRIPT = """
+local oldest = redis.call('LRANGE', KEYS[1], -1, -1)[1]
+if oldest then redis.call('LREM', KEYS[1], 1, oldest) end
+return oldest
+"""
+
+
+async def check_users(client: RedisCluster, users: int) -> list:
+    failures = []
+    for user_id in range(1, users + 1):
+        keys = redis_keys.user_keys(user_id)
+        try:
+            await client.mset({key: "1" for key in keys})
+            values = await client.mget(redis_keys.pending_input(user_id))
+            if values != ["1"] * len(values):
+                failures.append(f"user {user_id}: MGET returned {values}")
+            await client.delete(*keys)
+        except Exception as e:
+            failures.append(f"user {user_id}: {e}")
+    return failures
+
+
+async def check_routing(client: RedisCluster) -> list:
+    try:
+        keys = [redis_keys.routing_workers("check-host"), redis_keys.routing_heartbeat("check-host")]
+        await client.eval(ROUTING_SCRIPT, 2, *keys, "check-worker", "/tmp/check.sock", 0)
+        await client.delete(*keys)
+        return []
+    except Exception as e:
+        return [f"routing keys: {e}"]
+
+
+async def check_queues(client: RedisCluster) -> list:
+    failures = []
+    slots = set()
+    nodes = Counter()
+    for gender, language, key in redis_keys.all_queues():
+        try:
+            await client.lpush(key, "1", "2")
+            claimed = await client.eval(CLAIM_SCRIPT, 1, key)
+            if claimed != "1":
+                failures.append(f"queue {key}: claimed {claimed!r}, expected the oldest entry")
+            await client.delete(key)
+        except Exception as e:
+            failures.append(f"queue {key}: {e}")
+        slots.add(client.keyslot(key))
+        nodes[client.get_node_from_key(key).name] += 1
+    print(f"{sum(nodes.values())} queues over {len(slots)} slots:")
+    for node, count in sorted(nodes.items()):
+        print(f"  {node:<24} {count:>3} queues")
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("REDIS_CLUSTER_URL"))
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    if not args.url:
+        print("❌ Set REDIS_CLUSTER_URL or pass --url")
+        sys.exit(2)
+
+    client = RedisCluster.from_url(args.url, decode_responses=True)
+    try:
+        await client.initialize()
+        print(f"Cluster with {len(client.get_primaries())} primaries")
+        failures = await check_users(client, args.users)
+        failures += await check_routing(client)
+        failures += await check_queues(client)
+    finally:
+        await client.close()
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ All multi-key operations stayed on one slot")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,20 +1,83 @@
 """
 Database connection and pool management
+
+The primary pool serves all writes and most reads. When DATABASE_REPLICA_URL is
+set, a second pool serves statements marked as replica reads; a periodic
+health check measures replica lag, and reads go back to the primary while the
+replica is lagging, unreachable or failing.
 """
+import asyncio
+import os
+import time
 import asyncpg
-from typing import Optional
-from config.settings import settings
+from typing import Optional, Tuple
+from config.settings import settings, per_worker_share
+from config.constants import DATABASE_REPLICA_CHECK_INTERVAL, DATABASE_REPLICA_CHECK_TIMEOUT
+from bot.utils.json_codec import register_json_codecs
+from bot.database import repository
+from bot.database.repository import prepare_statements, PRIMARY, REPLICA
+from bot.database.pool import InstrumentedPool
+from bot.services import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Global connection pool
-_pool: Optional[asyncpg.Pool] = None
+# Per-process connection pools (recreated if the process forks after creating them)
+_pool: Optional[InstrumentedPool] = None
+_pool_pid: Optional[int] = None
+_replica_pool: Optional[InstrumentedPool] = None
+_replica_pid: Optional[int] = None
+
+# Replica routing state: why reads currently go where they go
+_replica_status = "starting"  # ok | starting | lagging | unhealthy
+_replica_checked_at = 0.0
+_replica_check_task: Optional[asyncio.Task] = None
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """Set up each new pooled connection"""
+    await register_json_codecs(conn)
+    await prepare_statements(conn)
+
+
+async def _init_replica_connection(conn: asyncpg.Connection):
+    """Set up each new replica connection"""
+    await register_json_codecs(conn)
+    await prepare_statements(conn, REPLICA)
+
 
+async def _create_pool(dsn: str, role: str, budget: int, init) -> InstrumentedPool:
+    """Create a pool sized from this worker's share of a connection budget"""
+    max_size = per_worker_share(budget)
+    if settings.database_pool_min_size is not None:
+        min_size = min(settings.database_pool_min_size, max_size)
+    else:
+        min_size = max(1, max_size // 2)
+    pool = await InstrumentedPool(
+        dsn,
+        role=role,
+        acquire_timeout=settings.database_pool_acquire_timeout,
+        adaptive=settings.database_pool_adaptive,
+        min_size=min_size,
+        max_size=max_size,
+        command_timeout=settings.database_command_timeout,
+        statement_cache_size=settings.database_statement_cache_size,
+        max_inactive_connection_lifetime=settings.database_max_inactive_lifetime,
+        init=init
+    )
+    logger.info(
+        f"Database {role} pool created (min_size={min_size}, max_size={max_size}, "
+        f"adaptive={settings.database_pool_adaptive}, pid={os.getpid()})"
+    )
+    return pool
 
-async def get_pool() -> asyncpg.Pool:
+
+async def get_pool() -> InstrumentedPool:
     """Get or create the database connection pool"""
-    global _pool
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid != os.getpid():
+        # Inherited from the parent process: never share its sockets
+        _pool = None
     if _pool is None:
         if not settings.database_url:
             error_msg = (
@@ -30,41 +93,106 @@ async def get_pool() -> asyncpg.Pool:
             logger.error(error_msg)
             raise ValueError(error_msg)
         
-        _pool = await asyncpg.create_pool(
-            settings.database_url,
-            min_size=5,
-            max_size=10,
-            command_timeout=60
-        )
-        logger.info("Database connection pool created")
+        # Each worker gets its share of the total connection budget
+        _pool = await _create_pool(settings.database_url, PRIMARY, settings.database_pool_budget, _init_connection)
+        _pool_pid = os.getpid()
     return _pool
 
 
+async def get_replica_pool() -> Optional[InstrumentedPool]:
+    """Get or create the replica pool (None if no replica is configured)"""
+    global _replica_pool, _replica_pid
+    if not settings.database_replica_url:
+        return None
+    if _replica_pool is not None and _replica_pid != os.getpid():
+        _replica_pool = None
+    if _replica_pool is None:
+        _replica_pool = await _create_pool(
+            settings.database_replica_url, REPLICA, settings.database_replica_pool_budget, _init_replica_connection
+        )
+        _replica_pid = os.getpid()
+    return _replica_pool
+
+
+def _set_replica_status(status: str):
+    global _replica_status
+    if status != _replica_status:
+        log = logger.info if status == "ok" else logger.warning
+        log(f"Read replica status: {_replica_status} -> {status}")
+    _replica_status = status
+    metrics.set_gauge("db_replica_available", 1 if status == "ok" else 0)
+
+
+async def check_replica():
+    """Measure replica lag and decide whether reads may use it"""
+    global _replica_checked_at
+    _replica_checked_at = time.monotonic()
+    try:
+        pool = await asyncio.wait_for(get_replica_pool(), DATABASE_REPLICA_CHECK_TIMEOUT)
+        async with pool.acquire(timeout=DATABASE_REPLICA_CHECK_TIMEOUT) as conn:
+            lag = await repository.fetchval("health.replica_lag", conn=conn)
+        metrics.set_gauge("db_replica_lag_seconds", lag)
+        _set_replica_status("ok" if lag <= settings.database_replica_max_lag else "lagging")
+    except Exception as e:
+        logger.error(f"Replica health check failed: {e}")
+        _set_replica_status("unhealthy")
+
+
+def _schedule_replica_check():
+    global _replica_check_task
+    if _replica_check_task is not None and not _replica_check_task.done():
+        return
+    if time.monotonic() - _replica_checked_at >= DATABASE_REPLICA_CHECK_INTERVAL:
+        _replica_check_task = asyncio.create_task(check_replica())
+
+
+async def get_read_pool() -> Tuple[InstrumentedPool, str]:
+    """
+    Pool for a read-only, staleness-tolerant statement
+    Returns (pool, role): the replica while it is healthy and caught up, otherwise the primary
+    """
+    if settings.database_replica_url:
+        # Checks run in the background; reads never wait for one
+        _schedule_replica_check()
+        if _replica_status == "ok" and _replica_pool is not None and _replica_pid == os.getpid():
+            metrics.increment("db_read_routing_total", target=REPLICA, reason="ok")
+            return _replica_pool, REPLICA
+        metrics.increment("db_read_routing_total", target=PRIMARY, reason=_replica_status)
+    return await get_pool(), PRIMARY
+
+
+def mark_replica_failed(error: Exception):
+    """Send reads to the primary until the next successful health check"""
+    global _replica_checked_at
+    logger.error(f"Replica read failed, retrying on primary: {error}")
+    metrics.increment("db_replica_errors_total")
+    _replica_checked_at = time.monotonic()
+    _set_replica_status("unhealthy")
+
+
 async def close_pool():
-    """Close the database connection pool"""
-    global _pool
+    """Close the database connection pools"""
+    global _pool, _replica_pool
     if _pool:
         await _pool.close()
         _pool = None
         logger.info("Database connection pool closed")
+    if _replica_pool:
+        await _replica_pool.close()
+        _replica_pool = None
+        logger.info("Replica connection pool closed")
 
 
-async def execute_query(query: str, *args):
-    """Execute a query and return results"""
-    pool = await get_pool()
-    return await pool.execute(query, *args)
-
-
-async def fetch_query(query: str, *args):
-    """Fetch a single row"""
-    pool = await get_pool()
-    row = await pool.fetchrow(query, *args)
-    # Convert asyncpg.Record to dict-like access (asyncpg already supports this, but ensure compatibility)
-    return row
 
+def get_pool_metrics() -> dict:
+    """Size, in-use, idle and limit gauges for this process's pools"""
+    collected = {}
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        collected.update(_pool.collect_metrics())
+    if _replica_pool is not None and _replica_pid == pid:
+        collected.update(_replica_pool.collect_metrics())
+    return collected
 
-async def fetch_all(query: str, *args):
-    """Fetch all rows"""
-    pool = await get_pool()
-    return await pool.fetch(query, *args)
 
+metrics.register_collector(get_pool_metrics)
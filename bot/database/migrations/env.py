@@ -17,9 +17,14 @@ from config.settings import settings
 # this is the Alembic Config object
 config = context.config
 
-# Set the sqlalchemy.url from environment
-if not config.get_main_option("sqlalchemy.url"):
-    config.set_main_option("sqlalchemy.url", settings.database_url or "")
+# DATABASE_URL wins over the placeholder in alembic.ini. Migrations run on the
+# synchronous psycopg2 driver; "postgres://" is not accepted by SQLAlchemy, and
+# "%" must be escaped for the ini parser.
+if settings.database_url:
+    url = settings.database_url
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
 
 # Interpret the config file for Python logging.
 if config.config_file_name is not None:
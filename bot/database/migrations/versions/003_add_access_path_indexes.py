@@ -0,0 +1,48 @@
+"""Add indexes for the pairs, messages and reports access paths
+
+Revision ID: 003_add_access_path_indexes
+Revises: 002_add_gender_preference
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003_add_access_path_indexes'
+down_revision = '002_add_gender_preference'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    # Active pair lookup by member (get_user_pair, get_user_pair_info)
+    "idx_pairs_user_a_active ON pairs(user_a, started_at DESC) WHERE is_active",
+    "idx_pairs_user_b_active ON pairs(user_b, started_at DESC) WHERE is_active",
+    # All pairs by member (get_user_stats, get_user_chat_count)
+    "idx_pairs_user_a ON pairs(user_a)",
+    "idx_pairs_user_b ON pairs(user_b)",
+    # Active pairs by last activity (admin stats, inactivity checks)
+    "idx_pairs_active_last_message ON pairs(last_message_at) WHERE is_active",
+    # Messages sent by a user (get_user_stats, get_user_message_count)
+    "idx_messages_from_id ON messages(from_id)",
+    # Latest messages of a pair (report excerpts)
+    "idx_messages_pair_created ON messages(pair_id, created_at DESC)",
+    # Pending reports (admin stats)
+    "idx_reports_pending ON reports(created_at) WHERE status = 'pending'",
+]
+
+
+def upgrade() -> None:
+    # Build without blocking writes; CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for index in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index in reversed(INDEXES):
+            name = index.split()[0]
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
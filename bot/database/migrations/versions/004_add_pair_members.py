@@ -0,0 +1,71 @@
+"""Add pair_members table for index-friendly user to pair lookups
+
+Revision ID: 004_add_pair_members
+Revises: 003_add_access_path_indexes
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004_add_pair_members'
+down_revision = '003_add_access_path_indexes'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS pair_members (
+            pair_id UUID NOT NULL REFERENCES pairs(pair_id),
+            user_id BIGINT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT true,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (pair_id, user_id)
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pair_members_user
+        ON pair_members(user_id, started_at DESC)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pair_members_user_active
+        ON pair_members(user_id, started_at DESC) WHERE is_active
+    """)
+
+    # Backfill in keyset batches, each committed on its own so the table stays writable.
+    # Safe to re-run: existing members are refreshed, missing ones inserted.
+    conn = op.get_bind()
+    with op.get_context().autocommit_block():
+        last_pair_id = None
+        while True:
+            last_pair_id = conn.execute(sa.text("""
+                WITH batch AS (
+                    SELECT pair_id, user_a, user_b, is_active, started_at
+                    FROM pairs
+                    WHERE CAST(:last_pair_id AS uuid) IS NULL OR pair_id > CAST(:last_pair_id AS uuid)
+                    ORDER BY pair_id
+                    LIMIT :batch_size
+                ),
+                members AS (
+                    INSERT INTO pair_members (pair_id, user_id, is_active, started_at)
+                    SELECT pair_id, user_a, COALESCE(is_active, false), COALESCE(started_at, NOW())
+                    FROM batch WHERE user_a IS NOT NULL
+                    UNION
+                    SELECT pair_id, user_b, COALESCE(is_active, false), COALESCE(started_at, NOW())
+                    FROM batch WHERE user_b IS NOT NULL
+                    ON CONFLICT (pair_id, user_id) DO UPDATE SET is_active = EXCLUDED.is_active
+                )
+                SELECT pair_id FROM batch ORDER BY pair_id DESC LIMIT 1
+            """), {"last_pair_id": last_pair_id, "batch_size": BACKFILL_BATCH_SIZE}).scalar()
+            if last_pair_id is None:
+                break
+            last_pair_id = str(last_pair_id)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS pair_members")
@@ -0,0 +1,64 @@
+"""Add user_blocks table and move blocked_users JSONB data into it
+
+Revision ID: 005_add_user_blocks
+Revises: 004_add_pair_members
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005_add_user_blocks'
+down_revision = '004_add_pair_members'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS user_blocks (
+            blocker_id BIGINT NOT NULL,
+            blocked_id BIGINT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (blocker_id, blocked_id)
+        )
+    """)
+    # Reverse direction: "who has blocked this user"
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_blocks_blocked
+        ON user_blocks(blocked_id, blocker_id)
+    """)
+
+    # blocked_users was written both as a list and as a dict of ids
+    op.execute("""
+        INSERT INTO user_blocks (blocker_id, blocked_id)
+        SELECT u.id, v.value::bigint
+        FROM users u
+        CROSS JOIN LATERAL (
+            SELECT value FROM jsonb_array_elements_text(
+                CASE WHEN jsonb_typeof(u.blocked_users) = 'array' THEN u.blocked_users ELSE '[]'::jsonb END
+            )
+            UNION ALL
+            SELECT value FROM jsonb_each_text(
+                CASE WHEN jsonb_typeof(u.blocked_users) = 'object' THEN u.blocked_users ELSE '{}'::jsonb END
+            )
+        ) v
+        WHERE v.value ~ '^-?[0-9]+$'
+        ON CONFLICT (blocker_id, blocked_id) DO NOTHING
+    """)
+    # users.blocked_users is kept for rollback but is no longer read or written
+
+
+def downgrade() -> None:
+    op.execute("""
+        UPDATE users u
+        SET blocked_users = b.blocked
+        FROM (
+            SELECT blocker_id, jsonb_agg(blocked_id ORDER BY created_at) AS blocked
+            FROM user_blocks GROUP BY blocker_id
+        ) b
+        WHERE u.id = b.blocker_id
+    """)
+    op.execute("DROP TABLE IF EXISTS user_blocks")
@@ -0,0 +1,105 @@
+"""Partition messages by day so retention drops partitions instead of deleting rows
+
+Revision ID: 006_partition_messages
+Revises: 005_add_user_blocks
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from config.constants import MESSAGE_RETENTION_DAYS, MESSAGE_PARTITION_DAYS_AHEAD
+
+
+# revision identifiers, used by Alembic.
+revision = '006_partition_messages'
+down_revision = '005_add_user_blocks'
+branch_labels = None
+depends_on = None
+
+# Same as the messages entries in ACCESS_PATH_INDEXES (init_db.py)
+MESSAGE_INDEXES = [
+    "idx_messages_from_id ON messages(from_id)",
+    "idx_messages_pair_created ON messages(pair_id, created_at DESC)",
+]
+
+
+def upgrade() -> None:
+    # Only the retention window is copied; older rows were due for deletion anyway
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    op.execute("DROP INDEX IF EXISTS idx_messages_created_at")
+    op.execute("DROP INDEX IF EXISTS idx_messages_from_id")
+    op.execute("DROP INDEX IF EXISTS idx_messages_pair_created")
+
+    op.execute("""
+        CREATE TABLE messages (
+            id BIGINT NOT NULL DEFAULT nextval('messages_id_seq'),
+            pair_id UUID REFERENCES pairs(pair_id),
+            from_id BIGINT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+    op.execute(f"""
+        DO $$
+        DECLARE
+            day DATE;
+        BEGIN
+            FOR day IN
+                SELECT generate_series(
+                    (NOW() AT TIME ZONE 'UTC')::date - {MESSAGE_RETENTION_DAYS},
+                    (NOW() AT TIME ZONE 'UTC')::date + {MESSAGE_PARTITION_DAYS_AHEAD},
+                    INTERVAL '1 day'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                    'messages_p' || to_char(day, 'YYYYMMDD'),
+                    day::text || ' 00:00:00+00',
+                    (day + 1)::text || ' 00:00:00+00'
+                );
+            END LOOP;
+        END $$
+    """)
+
+    op.execute(f"""
+        INSERT INTO messages (id, pair_id, from_id, content, created_at)
+        SELECT id, pair_id, from_id, content, COALESCE(created_at, NOW())
+        FROM messages_legacy
+        WHERE created_at IS NULL
+           OR created_at >= ((NOW() AT TIME ZONE 'UTC')::date - {MESSAGE_RETENTION_DAYS})::timestamp AT TIME ZONE 'UTC'
+    """)
+    op.execute("DROP TABLE messages_legacy")
+
+    # Created on the parent, so every current and future partition gets them
+    for index in MESSAGE_INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    for index in MESSAGE_INDEXES:
+        name = index.split()[0]
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+
+    op.execute("""
+        CREATE TABLE messages (
+            id BIGINT PRIMARY KEY DEFAULT nextval('messages_id_seq'),
+            pair_id UUID REFERENCES pairs(pair_id),
+            from_id BIGINT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute("""
+        INSERT INTO messages (id, pair_id, from_id, content, created_at)
+        SELECT id, pair_id, from_id, content, created_at FROM messages_partitioned
+    """)
+    op.execute("DROP TABLE messages_partitioned")
+
+    op.execute("CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at)")
+    for index in MESSAGE_INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {index}")
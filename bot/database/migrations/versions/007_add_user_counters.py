@@ -0,0 +1,48 @@
+"""Add user_counters table for O(1) per-user statistics
+
+Revision ID: 007_add_user_counters
+Revises: 006_partition_messages
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007_add_user_counters'
+down_revision = '006_partition_messages'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS user_counters (
+            user_id BIGINT PRIMARY KEY,
+            chats_total BIGINT NOT NULL DEFAULT 0,
+            chats_active INT NOT NULL DEFAULT 0,
+            messages_sent BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Chats come from the full pair history. Messages older than the retention
+    # window are already gone, so messages_sent starts from what is retained.
+    op.execute("""
+        INSERT INTO user_counters (user_id, chats_total, chats_active, messages_sent)
+        SELECT user_id, SUM(chats_total), SUM(chats_active), SUM(messages_sent)
+        FROM (
+            SELECT user_id, COUNT(*) AS chats_total,
+                   COUNT(*) FILTER (WHERE is_active) AS chats_active,
+                   0 AS messages_sent
+            FROM pair_members GROUP BY user_id
+            UNION ALL
+            SELECT from_id, 0, 0, COUNT(*) FROM messages GROUP BY from_id
+        ) counts
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS user_counters")
@@ -0,0 +1,117 @@
+"""Add trigger-maintained global counters for admin statistics
+
+Revision ID: 008_add_global_counters
+Revises: 007_add_user_counters
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008_add_global_counters'
+down_revision = '007_add_user_counters'
+branch_labels = None
+depends_on = None
+
+# (table, total counter, subset counter, subset predicate)
+COUNTED_TABLES = [
+    ("users", "users_total", "users_banned", "is_banned"),
+    ("pairs", "pairs_total", "pairs_active", "is_active"),
+    ("reports", "reports_total", "reports_pending", "status = 'pending'"),
+]
+
+
+def upgrade() -> None:
+    # Each counter is spread over 16 shard rows (picked by backend pid) so
+    # concurrent writers rarely update the same row; readers sum the shards.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS global_counters (
+            name TEXT NOT NULL,
+            shard SMALLINT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, shard)
+        )
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_global_counter(counter TEXT, delta BIGINT) RETURNS void
+        LANGUAGE sql AS $$
+            INSERT INTO global_counters (name, shard, value)
+            VALUES (counter, pg_backend_pid() % 16, delta)
+            ON CONFLICT (name, shard) DO UPDATE SET value = global_counters.value + EXCLUDED.value
+        $$
+    """)
+    # Statement-level trigger: one counter update per statement, not per row
+    # (the reaper ends hundreds of pairs in one UPDATE)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION count_global_rows() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            total_delta BIGINT := 0;
+            subset_delta BIGINT := 0;
+            rows_total BIGINT;
+            rows_subset BIGINT;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                EXECUTE format('SELECT COUNT(*), COUNT(*) FILTER (WHERE %s) FROM new_rows', TG_ARGV[2])
+                    INTO rows_total, rows_subset;
+                total_delta := total_delta + rows_total;
+                subset_delta := subset_delta + rows_subset;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                EXECUTE format('SELECT COUNT(*), COUNT(*) FILTER (WHERE %s) FROM old_rows', TG_ARGV[2])
+                    INTO rows_total, rows_subset;
+                total_delta := total_delta - rows_total;
+                subset_delta := subset_delta - rows_subset;
+            END IF;
+            IF total_delta <> 0 THEN
+                PERFORM bump_global_counter(TG_ARGV[0], total_delta);
+            END IF;
+            IF subset_delta <> 0 THEN
+                PERFORM bump_global_counter(TG_ARGV[1], subset_delta);
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+
+    transitions = {
+        "INSERT": "NEW TABLE AS new_rows",
+        "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        "DELETE": "OLD TABLE AS old_rows",
+    }
+    for table, total, subset, predicate in COUNTED_TABLES:
+        for event, referencing in transitions.items():
+            trigger = f"{table}_global_counters_{event.lower()}"
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+            op.execute(f"""
+                CREATE TRIGGER {trigger}
+                AFTER {event} ON {table}
+                REFERENCING {referencing}
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION count_global_rows('{total}', '{subset}', '{predicate.replace("'", "''")}')
+            """)
+
+    # CREATE TRIGGER holds a lock that blocks writes until this transaction
+    # commits, so the baseline below cannot miss or double-count a write
+    for table, total, subset, predicate in COUNTED_TABLES:
+        op.execute(f"""
+            INSERT INTO global_counters (name, shard, value)
+            SELECT counts.name, 0, counts.value
+            FROM (
+                SELECT '{total}' AS name, COUNT(*) AS value FROM {table}
+                UNION ALL
+                SELECT '{subset}', COUNT(*) FILTER (WHERE {predicate}) FROM {table}
+            ) counts
+            WHERE NOT EXISTS (SELECT 1 FROM global_counters g WHERE g.name = counts.name)
+        """)
+
+
+def downgrade() -> None:
+    for table, _, _, _ in COUNTED_TABLES:
+        for event in ("insert", "update", "delete"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_global_counters_{event} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS count_global_rows()")
+    op.execute("DROP FUNCTION IF EXISTS bump_global_counter(TEXT, BIGINT)")
+    op.execute("DROP TABLE IF EXISTS global_counters")
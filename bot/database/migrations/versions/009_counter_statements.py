@@ -0,0 +1,50 @@
+"""Drop the UPDATE counter triggers on users and pairs
+
+users_banned and pairs_active are now kept by the statements that ban users
+and end pairs, so profile edits and the per-flush pairs.touch no longer fire
+a trigger.
+
+Revision ID: 009_counter_statements
+Revises: 008_add_global_counters
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009_counter_statements'
+down_revision = '008_add_global_counters'
+branch_labels = None
+depends_on = None
+
+# (table, subset counter, subset predicate)
+UPDATE_COUNTED_TABLES = [
+    ("users", "users_banned", "is_banned"),
+    ("pairs", "pairs_active", "is_active"),
+]
+
+
+def upgrade() -> None:
+    for table, subset, predicate in UPDATE_COUNTED_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_global_counters_update ON {table}")
+        # Re-baseline from the table, with writes blocked, in case anything
+        # changed the subset without going through the counting statements
+        op.execute(f"LOCK TABLE {table} IN SHARE MODE")
+        op.execute(f"DELETE FROM global_counters WHERE name = '{subset}'")
+        op.execute(f"""
+            INSERT INTO global_counters (name, shard, value)
+            SELECT '{subset}', 0, COUNT(*) FILTER (WHERE {predicate}) FROM {table}
+        """)
+
+
+def downgrade() -> None:
+    for table, subset, predicate in UPDATE_COUNTED_TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_global_counters_update
+            AFTER UPDATE ON {table}
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION count_global_rows('{table}_total', '{subset}', '{predicate}')
+        """)
@@ -0,0 +1,78 @@
+"""Enforce one active pair per user with a unique partial index
+
+004 created idx_pair_members_user_active as a plain index; this ends all but
+each user's newest active pair and rebuilds it as UNIQUE (user_id). Databases
+created by init_db already have the unique index, so there is nothing to do.
+
+Revision ID: 010_unique_active_member
+Revises: 009_counter_statements
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010_unique_active_member'
+down_revision = '009_counter_statements'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    unique = conn.execute(sa.text("""
+        SELECT indisunique FROM pg_index
+        WHERE indexrelid = to_regclass('idx_pair_members_user_active')
+    """)).scalar()
+    if unique:
+        return
+
+    with op.get_context().autocommit_block():
+        # Keep each user's newest active pair and end the others, with the
+        # same counter updates as pairs.end_idle
+        conn.execute(sa.text("""
+            WITH ranked AS (
+                SELECT pair_id, row_number() OVER (
+                    PARTITION BY user_id ORDER BY started_at DESC, pair_id DESC
+                ) AS position
+                FROM pair_members
+                WHERE is_active
+            ), stale AS (
+                SELECT DISTINCT pair_id FROM ranked WHERE position > 1
+            ), ended AS (
+                UPDATE pairs SET is_active = false
+                WHERE pair_id IN (SELECT pair_id FROM stale) AND is_active
+                RETURNING pair_id
+            ), members AS (
+                UPDATE pair_members SET is_active = false
+                WHERE pair_id IN (SELECT pair_id FROM stale) AND is_active
+                RETURNING user_id
+            ), counters AS (
+                UPDATE user_counters c SET chats_active = GREATEST(c.chats_active - m.ended, 0)
+                FROM (SELECT user_id, COUNT(*) AS ended FROM members GROUP BY user_id) m
+                WHERE c.user_id = m.user_id
+            )
+            INSERT INTO global_counters (name, shard, value)
+            SELECT 'pairs_active', pg_backend_pid() % 16, -COUNT(*) FROM ended HAVING COUNT(*) > 0
+            ON CONFLICT (name, shard) DO UPDATE SET value = global_counters.value + EXCLUDED.value
+        """))
+        # A failed earlier run leaves an invalid index behind. If a duplicate
+        # slips in while the index builds, the build fails and so does the
+        # migration; run it again.
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_pair_members_user_active_unique")
+        op.execute("""
+            CREATE UNIQUE INDEX CONCURRENTLY idx_pair_members_user_active_unique
+            ON pair_members(user_id) WHERE is_active
+        """)
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_pair_members_user_active")
+        op.execute("ALTER INDEX idx_pair_members_user_active_unique RENAME TO idx_pair_members_user_active")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_pair_members_user_active")
+    op.execute("""
+        CREATE INDEX idx_pair_members_user_active
+        ON pair_members(user_id, started_at DESC) WHERE is_active
+    """)
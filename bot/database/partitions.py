@@ -0,0 +1,146 @@
+"""
+Daily range partitions for the messages table
+
+Partitions are named messages_pYYYYMMDD and cover one UTC day each. The
+maintenance job creates partitions ahead of time and enforces retention by
+detaching and dropping whole partitions instead of deleting rows. Rows written
+before their day's partition existed land in messages_default; they are moved
+into the partition when it is created. Each day and each step is handled on
+its own, so one failure never stops retention.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+import asyncpg
+from bot.database.connection import get_pool
+from bot.database import repository
+from config.constants import MESSAGE_RETENTION_DAYS, MESSAGE_PARTITION_DAYS_AHEAD
+import logging
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "messages_p"
+DEFAULT_PARTITION = "messages_default"
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> Optional[date]:
+    """Day covered by a partition, or None if the name isn't a daily partition"""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+async def list_message_partitions(conn) -> List[str]:
+    """Names of the partitions currently attached to messages"""
+    rows = await repository.fetch("messages.list_partitions", conn=conn)
+    return [row['relname'] for row in rows]
+
+
+async def create_message_partitions(conn, first_day: date, last_day: date) -> int:
+    """
+    Create daily partitions for first_day..last_day (inclusive) if missing
+    Returns the number of partitions created
+    """
+    existing = set(await list_message_partitions(conn))
+    created = 0
+    day = first_day
+    while day <= last_day:
+        name = partition_name(day)
+        if name not in existing:
+            try:
+                await create_message_partition(conn, day)
+                created += 1
+            except Exception as e:
+                logger.error(f"Error creating messages partition {name}: {e}")
+        day += timedelta(days=1)
+    return created
+
+
+async def create_message_partition(conn, day: date):
+    """Create one day's partition, moving that day's rows out of the default partition if needed"""
+    name = partition_name(day)
+    # Identifiers and bounds come from dates, never from user input
+    bounds = (
+        f"FROM ('{day.isoformat()} 00:00:00+00') "
+        f"TO ('{(day + timedelta(days=1)).isoformat()} 00:00:00+00')"
+    )
+    try:
+        await conn.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages FOR VALUES {bounds}")
+        return
+    except asyncpg.CheckViolationError:
+        # messages_default already holds rows for this day (clock skew or a missed run)
+        pass
+    async with conn.transaction():
+        await conn.execute("SET LOCAL lock_timeout = '5s'")
+        await conn.execute(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS)")
+        moved = await conn.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= $1 AND created_at < $2
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            day_start(day), day_start(day + timedelta(days=1))
+        )
+        await conn.execute(f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES {bounds}")
+    logger.warning(f"Created messages partition {name} from the default partition ({moved})")
+
+
+async def drop_expired_message_partitions(conn, retention_days: int) -> List[str]:
+    """
+    Detach and drop partitions whose whole day is older than the retention window
+    Returns the names of dropped partitions
+    """
+    cutoff = utc_today() - timedelta(days=retention_days)
+    dropped = []
+    for name in sorted(await list_message_partitions(conn)):
+        day = partition_day(name)
+        if day is None or day >= cutoff:
+            continue
+        try:
+            async with conn.transaction():
+                # Don't queue behind long-running readers while holding up inserts
+                await conn.execute("SET LOCAL lock_timeout = '5s'")
+                await conn.execute(f"ALTER TABLE messages DETACH PARTITION {name}")
+                await conn.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+        except Exception as e:
+            logger.error(f"Error dropping messages partition {name}: {e}")
+    # The default partition only catches rows written before their day existed
+    await repository.execute("messages.purge_default_partition", day_start(cutoff), conn=conn)
+    return dropped
+
+
+async def maintain_message_partitions(retention_days: int = MESSAGE_RETENTION_DAYS,
+                                      days_ahead: int = MESSAGE_PARTITION_DAYS_AHEAD):
+    """Create upcoming partitions and drop expired ones (the drop step runs even if creation fails)"""
+    created, dropped = 0, []
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            today = utc_today()
+            try:
+                created = await create_message_partitions(conn, today, today + timedelta(days=days_ahead))
+            except Exception as e:
+                logger.error(f"Error creating messages partitions: {e}")
+            dropped = await drop_expired_message_partitions(conn, retention_days)
+    except Exception as e:
+        logger.error(f"Error maintaining messages partitions: {e}")
+    if created or dropped:
+        logger.info(f"Messages partitions: created {created}, dropped {len(dropped)} ({', '.join(dropped) or '-'})")
@@ -0,0 +1,162 @@
+"""
+Instrumented asyncpg pool
+
+Every checkout goes through Pool._acquire, so this subclass records how long
+callers wait for a connection, counts acquire timeouts and applies a default
+acquire timeout (asyncpg waits forever by default). In-use and idle counts are
+exported per pool at scrape time.
+
+In adaptive mode the pool is created at its upper bound, but concurrent
+checkouts are capped by a limit that moves between the lower and upper bound:
+it grows while callers wait longer than the target, and shrinks while the pool
+has headroom. Connections left idle above the limit are closed by asyncpg once
+they exceed the max inactive lifetime.
+"""
+import asyncio
+import time
+from typing import Optional
+import asyncpg
+from bot.services import metrics
+from config.constants import (
+    DATABASE_POOL_WAIT_BUCKETS, DATABASE_POOL_ADAPT_INTERVAL,
+    DATABASE_POOL_GROW_WAIT, DATABASE_POOL_SHRINK_WAIT
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection(asyncpg.Connection):
+    """Connection that carries its own prepared statements (filled by the pool init hook)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = {}
+
+
+class InstrumentedPool(asyncpg.Pool):
+    """asyncpg pool with acquire metrics, a default acquire timeout and optional adaptive sizing"""
+
+    def __init__(self, dsn: str, *, role: str, acquire_timeout: Optional[float],
+                 adaptive: bool = False, **pool_kwargs):
+        super().__init__(
+            dsn,
+            max_queries=50000,
+            setup=None,
+            loop=None,
+            connection_class=PooledConnection,
+            record_class=asyncpg.Record,
+            **pool_kwargs
+        )
+        self.role = role
+        self.acquire_timeout = acquire_timeout or None
+        self.adaptive = adaptive
+        self.limit = pool_kwargs["max_size"]
+        self._lower = max(1, pool_kwargs["min_size"])
+        self._gate = asyncio.Condition()
+        self._checked_out = 0
+        # Current adaptation window
+        self._window_started = time.monotonic()
+        self._window_wait = 0.0
+        self._window_acquires = 0
+        self._window_timeouts = 0
+        self._window_peak = 0
+        if adaptive:
+            self.limit = self._lower
+
+    async def _acquire(self, timeout):
+        if timeout is None:
+            timeout = self.acquire_timeout
+        started = time.monotonic()
+        try:
+            if self.adaptive:
+                await self._wait_gate(timeout)
+                if timeout is not None:
+                    timeout = max(0.001, timeout - (time.monotonic() - started))
+            try:
+                connection = await super()._acquire(timeout)
+            except BaseException:
+                if self.adaptive:
+                    await self._leave_gate()
+                raise
+        except asyncio.TimeoutError:
+            metrics.increment("db_pool_acquire_timeouts_total", pool=self.role)
+            self._window_timeouts += 1
+            raise
+        finally:
+            waited = time.monotonic() - started
+            metrics.observe("db_pool_acquire_seconds", waited, buckets=DATABASE_POOL_WAIT_BUCKETS, pool=self.role)
+            self._window_wait += waited
+            self._window_acquires += 1
+        if self.adaptive:
+            self._adapt()
+        return connection
+
+    async def release(self, connection, *, timeout=None):
+        try:
+            await super().release(connection, timeout=timeout)
+        finally:
+            if self.adaptive:
+                await self._leave_gate()
+
+    async def _enter_gate(self):
+        async with self._gate:
+            await self._gate.wait_for(lambda: self._checked_out < self.limit)
+            self._checked_out += 1
+            self._window_peak = max(self._window_peak, self._checked_out)
+
+    async def _wait_gate(self, timeout):
+        entered = asyncio.ensure_future(self._enter_gate())
+        try:
+            await asyncio.wait_for(entered, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Entered just as the wait was abandoned: give the slot back
+            if entered.done() and not entered.cancelled():
+                await self._leave_gate()
+            raise
+
+    async def _leave_gate(self):
+        async with self._gate:
+            self._checked_out -= 1
+            self._gate.notify()
+
+    def _adapt(self):
+        """Move the checkout limit once per window based on the mean acquire wait"""
+        now = time.monotonic()
+        if now - self._window_started < DATABASE_POOL_ADAPT_INTERVAL:
+            return
+        mean_wait = self._window_wait / self._window_acquires if self._window_acquires else 0.0
+        upper = self.get_max_size()
+        limit = self.limit
+        if (mean_wait > DATABASE_POOL_GROW_WAIT or self._window_timeouts) and limit < upper:
+            # Grow by a quarter so a spike is absorbed in a few windows
+            limit = min(upper, limit + max(1, limit // 4))
+        elif mean_wait < DATABASE_POOL_SHRINK_WAIT and self._window_peak < limit and limit > self._lower:
+            limit -= 1
+        if limit != self.limit:
+            logger.info(
+                f"Adjusting {self.role} pool limit {self.limit} -> {limit} "
+                f"(mean acquire wait {mean_wait * 1000:.1f}ms, {self._window_timeouts} timeouts)"
+            )
+            self.limit = limit
+            asyncio.create_task(self._wake_waiters())
+        self._window_started = now
+        self._window_wait = 0.0
+        self._window_acquires = 0
+        self._window_timeouts = 0
+        self._window_peak = self._checked_out
+
+    async def _wake_waiters(self):
+        async with self._gate:
+            self._gate.notify_all()
+
+    def collect_metrics(self) -> dict:
+        """In-use, idle and limit gauges for this pool"""
+        size = self.get_size()
+        idle = self.get_idle_size()
+        return {
+            metrics.series("db_pool_size", pool=self.role): size,
+            metrics.series("db_pool_in_use", pool=self.role): size - idle,
+            metrics.series("db_pool_idle", pool=self.role): idle,
+            metrics.series("db_pool_limit", pool=self.role): self.limit,
+        }
@@ -0,0 +1,406 @@
+"""
+Repository of named SQL statements
+
+Every query the bot runs lives here under a stable name and takes bound
+parameters only, so the SQL text is constant and plans are reused. Hot
+statements are prepared on each pooled connection by the pool's init hook;
+the rest go through asyncpg's per-connection statement cache. Statements
+marked replica are read-only and tolerate staleness, so they are served from
+the read replica when one is configured and healthy. Call counts, errors and
+latency are recorded per statement.
+"""
+import asyncio
+import time
+from typing import Dict, Iterable
+import asyncpg
+from bot.services import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Statement:
+    """A named SQL statement"""
+
+    __slots__ = ("name", "sql", "hot", "replica")
+
+    def __init__(self, name: str, sql: str, hot: bool = False, replica: bool = False):
+        self.name = name
+        self.sql = sql
+        self.hot = hot
+        self.replica = replica
+
+
+STATEMENTS: Dict[str, Statement] = {}
+
+
+def statement(name: str, sql: str, hot: bool = False, replica: bool = False):
+    """
+    Register a named statement
+    Hot statements are prepared on every connection; replica statements may be
+    served from the read replica
+    """
+    if name in STATEMENTS:
+        raise ValueError(f"Duplicate statement name: {name}")
+    STATEMENTS[name] = Statement(name, sql, hot, replica)
+
+
+# Users
+statement("users.cache_profile", """
+    SELECT id, username, display_name, gender, gender_preference, language_preference,
+           age_range, is_banned, referrals_count, unlocked_features
+    FROM users WHERE id = $1
+""", hot=True)
+statement("users.insert", """
+    INSERT INTO users (
+        id, username, display_name, gender, language_preference, age_range,
+        created_at, last_active, referral_by
+    ) VALUES ($1, $2, $3, $4, $5, $6, NOW(), NOW(), $7)
+""")
+statement("users.stats_profile", """
+    SELECT
+        u.id, u.username, u.display_name, u.created_at, u.last_active,
+        u.referrals_count, u.unlocked_features, u.is_banned,
+        COALESCE(c.chats_total, 0) AS chats_total,
+        COALESCE(c.chats_active, 0) AS chats_active,
+        COALESCE(c.messages_sent, 0) AS messages_sent
+    FROM users u
+    LEFT JOIN user_counters c ON c.user_id = u.id
+    WHERE u.id = $1
+""", hot=True, replica=True)
+statement("users.ban_status_many", "SELECT id, is_banned FROM users WHERE id = ANY($1::bigint[])", hot=True)
+statement("users.set_display_name", "UPDATE users SET display_name = $1 WHERE id = $2")
+statement("users.set_gender", "UPDATE users SET gender = $1 WHERE id = $2")
+statement("users.set_gender_preference", "UPDATE users SET gender_preference = $1 WHERE id = $2")
+statement("users.set_language", "UPDATE users SET language_preference = $1 WHERE id = $2")
+statement("users.set_age_range", "UPDATE users SET age_range = $1 WHERE id = $2")
+# users_banned is kept here rather than by an UPDATE trigger on users, which
+# would fire on every profile edit
+statement("users.set_banned", """
+    WITH changed AS (
+        UPDATE users SET is_banned = $1
+        WHERE id = $2 AND COALESCE(is_banned, false) <> $1
+        RETURNING id
+    )
+    INSERT INTO global_counters (name, shard, value)
+    SELECT 'users_banned', pg_backend_pid() % 16, CASE WHEN $1 THEN 1 ELSE -1 END FROM changed
+    ON CONFLICT (name, shard) DO UPDATE SET value = global_counters.value + EXCLUDED.value
+""")
+
+# Admin sessions and audit log
+statement("users.admin_session", "SELECT is_admin, admin_session_expiry FROM users WHERE id = $1")
+statement("users.grant_admin", """
+    UPDATE users
+    SET is_admin = true, admin_session_expiry = $1
+    WHERE id = $2
+""")
+statement("users.revoke_admin", "UPDATE users SET is_admin = false, admin_session_expiry = NULL WHERE id = $1")
+statement("admin_logs.insert", """
+    INSERT INTO admin_logs (admin_id, action, metadata, created_at)
+    VALUES ($1, $2, $3::jsonb, NOW())
+""")
+
+# Referrals
+# Records the referral and credits the referrer atomically: a repeated referral
+# inserts nothing and returns no row. The referrer's row lock serialises
+# concurrent sign-ups, and unlocks are merged into the existing JSONB at the
+# thresholds ($3: partner preference, $4: premium features).
+statement("referrals.process", """
+    WITH new_referral AS (
+        INSERT INTO referrals (referrer_id, referree_id, created_at)
+        SELECT $1, $2, NOW()
+        WHERE EXISTS (SELECT 1 FROM users WHERE id = $1)
+        ON CONFLICT (referrer_id, referree_id) DO NOTHING
+        RETURNING referrer_id
+    )
+    UPDATE users u
+    SET referrals_count = COALESCE(u.referrals_count, 0) + 1,
+        unlocked_features = COALESCE(u.unlocked_features, '{}'::jsonb)
+            || CASE WHEN COALESCE(u.referrals_count, 0) + 1 >= $3
+                    THEN '{"partner_preference": true}'::jsonb ELSE '{}'::jsonb END
+            || CASE WHEN COALESCE(u.referrals_count, 0) + 1 >= $4
+                    THEN '{"see_gender": true, "search_by_age": true}'::jsonb ELSE '{}'::jsonb END
+    FROM new_referral
+    WHERE u.id = new_referral.referrer_id
+    RETURNING u.referrals_count
+""")
+
+# Blocks
+statement("blocks.insert", """
+    INSERT INTO user_blocks (blocker_id, blocked_id, created_at)
+    VALUES ($1, $2, NOW())
+    ON CONFLICT (blocker_id, blocked_id) DO NOTHING
+""")
+statement("blocks.conflicts", """
+    SELECT blocked_id AS other_id FROM user_blocks
+    WHERE blocker_id = $1 AND blocked_id = ANY($2::bigint[])
+    UNION
+    SELECT blocker_id FROM user_blocks
+    WHERE blocked_id = $1 AND blocker_id = ANY($2::bigint[])
+""", hot=True)
+
+# Pairs
+# Returns the pair id, or no row if either user is already in an active pair.
+# NOT EXISTS only skips the common case cheaply; two concurrent creates can both
+# pass it, and the unique index on active pair_members then fails one of them
+# with a unique violation (see create_pair).
+statement("pairs.create", """
+    WITH new_pair AS (
+        INSERT INTO pairs (pair_id, user_a, user_b, language_used, started_at, last_message_at)
+        SELECT $1::uuid, $2, $3, $4, NOW(), NOW()
+        WHERE NOT EXISTS (
+            SELECT 1 FROM pair_members
+            WHERE user_id = ANY(ARRAY[$2, $3]::bigint[]) AND is_active
+        )
+        ON CONFLICT (pair_id) DO NOTHING
+        RETURNING pair_id, started_at
+    ), members AS (
+        INSERT INTO pair_members (pair_id, user_id, is_active, started_at)
+        SELECT DISTINCT new_pair.pair_id, member.user_id, true, new_pair.started_at
+        FROM new_pair, unnest(ARRAY[$2, $3]::bigint[]) AS member(user_id)
+        RETURNING user_id
+    ), counters AS (
+        INSERT INTO user_counters (user_id, chats_total, chats_active)
+        SELECT user_id, 1, 1 FROM members
+        ON CONFLICT (user_id) DO UPDATE
+        SET chats_total = user_counters.chats_total + 1,
+            chats_active = user_counters.chats_active + 1
+    )
+    SELECT pair_id FROM new_pair
+""")
+# Returns the members, or no row if the pair was already ended.
+# pairs_active is kept by pairs.end / pairs.end_idle rather than by an UPDATE
+# trigger on pairs, which would also fire on every pairs.touch.
+statement("pairs.end", """
+    WITH ended AS (
+        UPDATE pairs SET is_active = false
+        WHERE pair_id = $1 AND is_active
+        RETURNING pair_id, user_a, user_b
+    ), members AS (
+        UPDATE pair_members SET is_active = false
+        WHERE pair_id IN (SELECT pair_id FROM ended)
+        RETURNING user_id
+    ), counters AS (
+        UPDATE user_counters c SET chats_active = GREATEST(c.chats_active - 1, 0)
+        FROM members
+        WHERE c.user_id = members.user_id
+    ), global_count AS (
+        INSERT INTO global_counters (name, shard, value)
+        SELECT 'pairs_active', pg_backend_pid() % 16, -1 FROM ended
+        ON CONFLICT (name, shard) DO UPDATE SET value = global_counters.value + EXCLUDED.value
+    )
+    SELECT user_a, user_b FROM ended
+""")
+statement("pairs.end_idle", """
+    WITH idle AS (
+        SELECT pair_id FROM pairs
+        WHERE is_active
+          AND (last_message_at < NOW() - make_interval(mins => $1)
+               OR started_at < NOW() - make_interval(hours => $2))
+        ORDER BY last_message_at
+        LIMIT $3
+        FOR UPDATE SKIP LOCKED
+    ), ended AS (
+        UPDATE pairs p SET is_active = false
+        FROM idle
+        WHERE p.pair_id = idle.pair_id AND p.is_active
+        RETURNING p.pair_id, p.user_a, p.user_b, p.started_at
+    ), members AS (
+        UPDATE pair_members pm SET is_active = false
+        FROM ended
+        WHERE pm.pair_id = ended.pair_id
+        RETURNING pm.user_id
+    ), counters AS (
+        UPDATE user_counters c SET chats_active = GREATEST(c.chats_active - m.ended, 0)
+        FROM (SELECT user_id, COUNT(*) AS ended FROM members GROUP BY user_id) m
+        WHERE c.user_id = m.user_id
+    ), global_count AS (
+        INSERT INTO global_counters (name, shard, value)
+        SELECT 'pairs_active', pg_backend_pid() % 16, -COUNT(*) FROM ended HAVING COUNT(*) > 0
+        ON CONFLICT (name, shard) DO UPDATE SET value = global_counters.value + EXCLUDED.value
+    )
+    SELECT pair_id, user_a, user_b,
+           CASE WHEN started_at < NOW() - make_interval(hours => $2) THEN $4 ELSE $5 END AS reason
+    FROM ended
+""")
+statement("pairs.members", "SELECT user_a, user_b FROM pairs WHERE pair_id = $1", hot=True)
+statement("pairs.session", "SELECT user_a, user_b, is_active FROM pairs WHERE pair_id = $1", hot=True)
+statement("pairs.touch", "UPDATE pairs SET last_message_at = $2 WHERE pair_id = $1::uuid")
+statement("pair_members.active_pair", """
+    SELECT pair_id FROM pair_members
+    WHERE user_id = $1 AND is_active = true
+    ORDER BY started_at DESC LIMIT 1
+""", hot=True)
+statement("pair_members.active_pair_info", """
+    SELECT p.pair_id, p.user_a, p.user_b, p.started_at, p.last_message_at, p.is_active
+    FROM pair_members pm
+    JOIN pairs p ON p.pair_id = pm.pair_id
+    WHERE pm.user_id = $1 AND pm.is_active = true
+    ORDER BY pm.started_at DESC LIMIT 1
+""", replica=True)
+
+# Per-user counters
+statement("user_counters.get", """
+    SELECT chats_total, chats_active, messages_sent FROM user_counters WHERE user_id = $1
+""", hot=True)
+statement("user_counters.add_messages", """
+    INSERT INTO user_counters (user_id, messages_sent) VALUES ($1, $2)
+    ON CONFLICT (user_id) DO UPDATE
+    SET messages_sent = user_counters.messages_sent + EXCLUDED.messages_sent
+""")
+
+# Messages
+statement("messages.insert", """
+    INSERT INTO messages (pair_id, from_id, content, created_at)
+    VALUES ($1::uuid, $2, $3, $4)
+""")
+statement("messages.recent_for_pair", """
+    SELECT from_id, content, created_at
+    FROM messages
+    WHERE pair_id = $1
+    ORDER BY created_at DESC
+    LIMIT $2
+""", replica=True)
+statement("messages.list_partitions", """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.oid = 'messages'::regclass
+""")
+statement("messages.purge_default_partition", "DELETE FROM messages_default WHERE created_at < $1")
+
+# Reports
+statement("reports.insert", """
+    INSERT INTO reports (pair_id, reported_by, reported_user, conversation_excerpt, status, created_at)
+    VALUES ($1, $2, $3, $4::jsonb, 'pending', NOW())
+""")
+
+# Global counters (maintained by triggers on users, pairs and reports)
+statement("global_counters.all", """
+    SELECT name, SUM(value)::bigint AS value FROM global_counters GROUP BY name
+""", hot=True, replica=True)
+statement("global_counters.estimate_totals", """
+    SELECT relname, reltuples::bigint AS estimate
+    FROM pg_class
+    WHERE oid IN ('users'::regclass, 'pairs'::regclass, 'reports'::regclass)
+""", replica=True)
+
+# Health and schema
+statement("health.ping", "SELECT 1")
+# Seconds the replica is behind; 0 when caught up or not a standby
+statement("health.replica_lag", """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+    END::float8
+""")
+statement("schema.version", "SELECT version_num FROM alembic_version")
+statement("schema.table_exists", """
+    SELECT EXISTS (
+        SELECT FROM information_schema.tables
+        WHERE table_schema = 'public'
+        AND table_name = $1
+    )
+""")
+# Runs once per database; the lock keeps concurrent workers from racing
+statement("schema.stamp", """
+    WITH lock AS (SELECT pg_advisory_xact_lock(hashtext('alembic_version')))
+    INSERT INTO alembic_version (version_num)
+    SELECT $1 FROM lock WHERE NOT EXISTS (SELECT 1 FROM alembic_version)
+""")
+
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+# Errors after which a replica read is retried on the primary
+REPLICA_FAILOVER_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.SerializationError,  # canceled by a conflict with recovery
+)
+
+async def prepare_statements(conn, role: str = PRIMARY):
+    """
+    Prepare the hot statements on a new pooled connection (pool init hook)
+    They are kept on the connection itself, so they go away with it
+    """
+    prepared = conn.prepared_statements
+    prepared.clear()
+    for stmt in STATEMENTS.values():
+        if not stmt.hot or (role == REPLICA and not stmt.replica):
+            continue
+        try:
+            prepared[stmt.name] = await conn.prepare(stmt.sql)
+        except Exception as e:
+            # e.g. schema not created yet on first start; falls back to the statement cache
+            logger.warning(f"Could not prepare statement {stmt.name}: {e}")
+
+
+def _get_prepared(conn, name: str):
+    # Connections opened outside the pools (init_db, scripts) carry no prepared statements
+    prepared = getattr(conn, "prepared_statements", None)
+    return prepared.get(name) if prepared else None
+
+
+async def _run(method: str, name: str, args: tuple, conn=None):
+    stmt = STATEMENTS[name]
+    started = time.monotonic()
+    try:
+        if conn is not None:
+            return await _call(conn, method, stmt, args)
+        from bot.database.connection import get_pool, get_read_pool, mark_replica_failed
+        if stmt.replica:
+            pool, role = await get_read_pool()
+            if role == REPLICA:
+                try:
+                    async with pool.acquire() as pooled:
+                        return await _call(pooled, method, stmt, args)
+                except REPLICA_FAILOVER_ERRORS as e:
+                    mark_replica_failed(e)
+        pool = await get_pool()
+        async with pool.acquire() as pooled:
+            return await _call(pooled, method, stmt, args)
+    except Exception:
+        metrics.increment("db_statement_errors_total", statement=name)
+        raise
+    finally:
+        metrics.increment("db_statement_calls_total", statement=name)
+        metrics.observe("db_statement_seconds", time.monotonic() - started, statement=name)
+
+
+async def _call(conn, method: str, stmt: Statement, args: tuple):
+    # PreparedStatement has fetch/fetchrow/fetchval; other calls use the statement cache
+    prepared = _get_prepared(conn, stmt.name) if stmt.hot and method != "execute" else None
+    if prepared is not None:
+        return await getattr(prepared, method)(*args)
+    return await getattr(conn, method)(stmt.sql, *args)
+
+
+async def fetchrow(name: str, *args, conn=None):
+    """Fetch a single row of a named statement"""
+    return await _run("fetchrow", name, args, conn)
+
+
+async def fetch(name: str, *args, conn=None):
+    """Fetch all rows of a named statement"""
+    return await _run("fetch", name, args, conn)
+
+
+async def fetchval(name: str, *args, conn=None):
+    """Fetch the first column of the first row of a named statement"""
+    return await _run("fetchval", name, args, conn)
+
+
+async def execute(name: str, *args, conn=None):
+    """Execute a named statement and return its status"""
+    return await _run("execute", name, args, conn)
+
+
+async def executemany(name: str, rows: Iterable[tuple], conn=None):
+    """Execute a named statement once per row in a single round trip"""
+    return await _run("executemany", name, (rows,), conn)
@@ -9,9 +9,11 @@ from bot.services.admin_service import (
     ban_user, unban_user
 )
 from bot.services.matchmaking import end_pair, get_user_pair
+from bot.services.global_counters import get_global_counts
 from bot.utils.security import verify_admin_secret
 from bot.utils.keyboards import get_admin_keyboard
 from config.settings import settings
+from config.constants import PRESENCE_ONLINE_MINUTES
 import logging
 
 logger = logging.getLogger(__name__)
@@ -90,6 +92,7 @@ async def handle_admin_list_online(update: Update, context: ContextTypes.DEFAULT
     stats = await get_online_stats()
     
     message = "📊 Online Statistics:\n\n"
+    message += f"Online (last {PRESENCE_ONLINE_MINUTES} min): {stats.get('online_users', 0)}\n"
     message += f"Waiting users: {stats.get('waiting_users', 0)}\n"
     message += f"Chatting users: {stats.get('chatting_users', 0)}\n"
     message += f"Active pairs: {stats.get('active_pairs', 0)}\n\n"
@@ -221,26 +224,14 @@ async def handle_admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Handle /admin stats"""
     user_id = update.effective_user.id
     
-    from bot.database.connection import fetch_query, fetch_all
-    
     # Get basic statistics
-    total_users_row = await fetch_query("SELECT COUNT(*) as count FROM users")
-    total_users_count = total_users_row['count'] if total_users_row else 0
-    
-    active_pairs_row = await fetch_query("SELECT COUNT(*) as count FROM pairs WHERE is_active = true")
-    active_pairs_count = active_pairs_row['count'] if active_pairs_row else 0
-    
-    banned_users_row = await fetch_query("SELECT COUNT(*) as count FROM users WHERE is_banned = true")
-    banned_users_count = banned_users_row['count'] if banned_users_row else 0
-    
-    pending_reports_row = await fetch_query("SELECT COUNT(*) as count FROM reports WHERE status = 'pending'")
-    pending_reports_count = pending_reports_row['count'] if pending_reports_row else 0
+    counts = await get_global_counts()
     
     message = "📈 Statistics:\n\n"
-    message += f"Total users: {total_users_count}\n"
-    message += f"Active pairs: {active_pairs_count}\n"
-    message += f"Banned users: {banned_users_count}\n"
-    message += f"Pending reports: {pending_reports_count}\n"
+    message += f"Total users: {counts['users_total']}\n"
+    message += f"Active pairs: {counts['pairs_active']}\n"
+    message += f"Banned users: {counts['users_banned']}\n"
+    message += f"Pending reports: {counts['reports_pending']}\n"
     
     await update.message.reply_text(message)
     await log_admin_action(user_id, "stats", {})
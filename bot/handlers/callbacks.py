@@ -3,9 +3,15 @@ Callback query handlers for inline buttons
 """
 from telegram import Update
 from telegram.ext import ContextTypes
-from bot.database.connection import fetch_query, execute_query
-from bot.services.matchmaking import add_to_queue, try_match, remove_from_queue, get_user_pair, end_pair, create_pair
+from bot.database import repository
+from bot.services.user_cache import get_user_profile, user_exists, invalidate_user
+from bot.services.matchmaking import (
+    add_to_queue, try_match, requeue_candidate, remove_from_queue, get_user_pair, end_pair, create_pair
+)
 from bot.services.admin_service import check_admin_access
+from bot.services.blocks import block_user
+from bot.services.global_counters import get_global_counts
+from bot.services import redis_keys
 from bot.handlers.onboarding import get_onboarding_state, set_onboarding_state, complete_onboarding, clear_onboarding_state
 from bot.handlers.callbacks_profile import handle_profile_edit, handle_partner_preference, handle_profile_edit_field
 from bot.utils.keyboards import (
@@ -16,7 +22,7 @@ from bot.utils.keyboards import (
 from config.constants import (
     GENDER_UNKNOWN, GENDER_MALE, GENDER_FEMALE, GENDER_OTHER, GENDER_PREFER_NOT_SAY,
     LANGUAGE_MALAYALAM, LANGUAGE_ENGLISH, LANGUAGE_HINDI, LANGUAGE_ANY,
-    USER_STATE_WAITING, GENDER_MAP
+    USER_STATE_WAITING, GENDER_MAP, REDIS_PROMPT_TTL
 )
 import logging
 
@@ -124,23 +130,20 @@ async def handle_gender_callback(query, context, data):
     # Check if this is for partner preference
     from bot.services.redis_client import get_redis
     redis_client = await get_redis()
-    is_partner_pref = await redis_client.get(f"editing_partner_pref:{user_id}")
+    is_partner_pref, is_profile_edit = await redis_client.mget(
+        redis_keys.editing("partner_pref", user_id), redis_keys.editing("profile_gender", user_id)
+    )
     
     if is_partner_pref:
         # Update partner preference
-        await redis_client.delete(f"editing_partner_pref:{user_id}")
-        await execute_query(
-            "UPDATE users SET gender_preference = $1 WHERE id = $2",
-            gender, user_id
-        )
+        await redis_client.delete(redis_keys.editing("partner_pref", user_id))
+        await repository.execute("users.set_gender_preference", gender, user_id)
+        await invalidate_user(user_id)
         # Get updated settings keyboard
-        user_data = await fetch_query("SELECT unlocked_features FROM users WHERE id = $1", user_id)
+        user_data = await get_user_profile(user_id)
         has_partner_pref = False
         if user_data:
             unlocked = user_data.get('unlocked_features') or {}
-            if isinstance(unlocked, str):
-                import json
-                unlocked = json.loads(unlocked) if unlocked else {}
             has_partner_pref = unlocked.get('partner_preference', False)
         await query.edit_message_text(
             f"✅ Partner preference updated to {GENDER_MAP.get(gender, 'Unknown')}!\n\n"
@@ -150,13 +153,10 @@ async def handle_gender_callback(query, context, data):
         return
     
     # Check if this is for profile editing
-    is_profile_edit = await redis_client.get(f"editing_profile_gender:{user_id}")
     if is_profile_edit:
-        await redis_client.delete(f"editing_profile_gender:{user_id}")
-        await execute_query(
-            "UPDATE users SET gender = $1 WHERE id = $2",
-            gender, user_id
-        )
+        await redis_client.delete(redis_keys.editing("profile_gender", user_id))
+        await repository.execute("users.set_gender", gender, user_id)
+        await invalidate_user(user_id)
         await query.edit_message_text(
             f"✅ Gender updated to {GENDER_MAP.get(gender, 'Unknown')}!\n\n"
             "Choose an option:",
@@ -209,13 +209,10 @@ async def handle_language_callback(query, context, data):
         )
     else:
         # User is updating language from settings
-        user_data = await fetch_query("SELECT id FROM users WHERE id = $1", user_id)
-        if user_data:
+        if await user_exists(user_id):
             # Update user's language preference
-            await execute_query(
-                "UPDATE users SET language_preference = $1 WHERE id = $2",
-                language, user_id
-            )
+            await repository.execute("users.set_language", language, user_id)
+            await invalidate_user(user_id)
             lang_names = {
                 LANGUAGE_MALAYALAM: "Malayalam",
                 LANGUAGE_ENGLISH: "English",
@@ -238,20 +235,18 @@ async def handle_age_callback(query, context, data):
     # Check if this is for profile editing
     from bot.services.redis_client import get_redis
     redis_client = await get_redis()
-    is_profile_edit = await redis_client.get(f"editing_profile_age:{user_id}")
+    is_profile_edit = await redis_client.get(redis_keys.editing("profile_age", user_id))
     
     if is_profile_edit:
-        await redis_client.delete(f"editing_profile_age:{user_id}")
+        await redis_client.delete(redis_keys.editing("profile_age", user_id))
         
         if data == "age_any":
             age_range = None
         else:
             age_range = data.replace("age_", "")
         
-        await execute_query(
-            "UPDATE users SET age_range = $1 WHERE id = $2",
-            age_range, user_id
-        )
+        await repository.execute("users.set_age_range", age_range, user_id)
+        await invalidate_user(user_id)
         
         age_text = age_range if age_range else "Any"
         await query.edit_message_text(
@@ -307,18 +302,12 @@ async def complete_onboarding_callback(query, context, state):
     user_id = query.from_user.id
     
     try:
-        from bot.database.connection import execute_query
         from bot.services.referrals import process_referral
         from config.constants import GENDER_UNKNOWN, LANGUAGE_ANY, REFERRAL_PAYLOAD_PREFIX
         
         # Create user in database
-        await execute_query(
-            """
-            INSERT INTO users (
-                id, username, display_name, gender, language_preference, age_range,
-                created_at, last_active, referral_by
-            ) VALUES ($1, $2, $3, $4, $5, $6, NOW(), NOW(), $7)
-            """,
+        await repository.execute(
+            "users.insert",
             user_id,
             query.from_user.username,
             state.get("display_name"),
@@ -341,7 +330,9 @@ async def complete_onboarding_callback(query, context, state):
         # Set user state to idle
         from bot.services.redis_client import get_redis
         redis_client = await get_redis()
-        await redis_client.setex(f"user_state:{user_id}", 300, "idle")
+        async with redis_client.pipeline(transaction=False) as pipe:
+            redis_keys.set_idle(pipe, user_id)
+            await pipe.execute()
         
         await query.edit_message_text(
             "✅ Registration complete!\n\n"
@@ -362,7 +353,7 @@ async def handle_find_chat(query, context):
     user_id = query.from_user.id
     
     # Check if user exists
-    user_data = await fetch_query("SELECT * FROM users WHERE id = $1", user_id)
+    user_data = await get_user_profile(user_id)
     if not user_data:
         await query.edit_message_text("Please start with /start to register first.")
         return
@@ -397,10 +388,10 @@ async def handle_find_chat(query, context):
     )
     
     # Try to match immediately
-    matched_id = await try_match(user_id, gender_filter, language_preference)
-    if matched_id:
+    match = await try_match(user_id, gender_filter, language_preference)
+    if match:
         # Create pair
-        from bot.services.matchmaking import create_pair
+        matched_id, queue_key = match
         pair_id = await create_pair(user_id, matched_id, language_preference)
         if pair_id:
             await query.edit_message_text(
@@ -409,11 +400,9 @@ async def handle_find_chat(query, context):
                 reply_markup=get_chat_actions_keyboard()
             )
         else:
-            await query.edit_message_text(
-                "✅ Found someone! Start chatting now!\n\n"
-                "Use the buttons below to manage your chat:",
-                reply_markup=get_chat_actions_keyboard()
-            )
+            # The claimed partner already left their queue: give them their place back.
+            # This user stays queued, so the searching message above still holds.
+            await requeue_candidate(matched_id, queue_key)
 
 
 async def handle_main_menu(query, context):
@@ -477,10 +466,7 @@ async def handle_block_user(query, context):
         return
     
     # Get partner ID
-    pair_data = await fetch_query(
-        "SELECT user_a, user_b FROM pairs WHERE pair_id = $1",
-        pair_id
-    )
+    pair_data = await repository.fetchrow("pairs.members", pair_id)
     
     if not pair_data:
         await query.answer("Chat not found.", show_alert=True)
@@ -489,15 +475,7 @@ async def handle_block_user(query, context):
     partner_id = pair_data['user_b'] if pair_data['user_a'] == user_id else pair_data['user_a']
     
     # Block user
-    user_data = await fetch_query("SELECT blocked_users FROM users WHERE id = $1", user_id)
-    blocked = user_data.get('blocked_users', []) if user_data else []
-    
-    if partner_id not in blocked:
-        blocked.append(partner_id)
-        await execute_query(
-            "UPDATE users SET blocked_users = $1 WHERE id = $2",
-            blocked, user_id
-        )
+    await block_user(user_id, partner_id)
     
     # End chat
     await end_pair(pair_id)
@@ -538,9 +516,11 @@ async def handle_admin_callback(query, context, data):
         # Handle different admin actions
         if data == "admin_list_online":
             from bot.services.admin_service import get_online_stats
+            from config.constants import PRESENCE_ONLINE_MINUTES
             stats = await get_online_stats()
             
             message = "📊 Online Statistics:\n\n"
+            message += f"🟢 Online (last {PRESENCE_ONLINE_MINUTES} min): {stats.get('online_users', 0)}\n"
             message += f"⏳ Waiting users: {stats.get('waiting_users', 0)}\n"
             message += f"💬 Chatting users: {stats.get('chatting_users', 0)}\n"
             message += f"🔗 Active pairs: {stats.get('active_pairs', 0)}\n"
@@ -564,26 +544,15 @@ async def handle_admin_callback(query, context, data):
                 )
         
         elif data == "admin_stats":
-            from bot.database.connection import fetch_query
             
             # Get basic statistics
-            total_users_row = await fetch_query("SELECT COUNT(*) as count FROM users")
-            total_users_count = total_users_row['count'] if total_users_row else 0
-            
-            active_pairs_row = await fetch_query("SELECT COUNT(*) as count FROM pairs WHERE is_active = true")
-            active_pairs_count = active_pairs_row['count'] if active_pairs_row else 0
-            
-            banned_users_row = await fetch_query("SELECT COUNT(*) as count FROM users WHERE is_banned = true")
-            banned_users_count = banned_users_row['count'] if banned_users_row else 0
-            
-            pending_reports_row = await fetch_query("SELECT COUNT(*) as count FROM reports WHERE status = 'pending'")
-            pending_reports_count = pending_reports_row['count'] if pending_reports_row else 0
+            counts = await get_global_counts()
             
             message = "📈 Statistics:\n\n"
-            message += f"👥 Total users: {total_users_count}\n"
-            message += f"🔗 Active pairs: {active_pairs_count}\n"
-            message += f"🚫 Banned users: {banned_users_count}\n"
-            message += f"⚠️ Pending reports: {pending_reports_count}\n"
+            message += f"👥 Total users: {counts['users_total']}\n"
+            message += f"🔗 Active pairs: {counts['pairs_active']}\n"
+            message += f"🚫 Banned users: {counts['users_banned']}\n"
+            message += f"⚠️ Pending reports: {counts['reports_pending']}\n"
             
             try:
                 await query.edit_message_text(
@@ -601,7 +570,7 @@ async def handle_admin_callback(query, context, data):
             # Store pending action in Redis
             from bot.services.redis_client import get_redis
             redis_client = await get_redis()
-            await redis_client.setex(f"admin_pending:{user_id}", 300, "view_pair")
+            await redis_client.setex(redis_keys.admin_pending(user_id), REDIS_PROMPT_TTL, "view_pair")
             
             try:
                 await query.edit_message_text(
@@ -621,7 +590,7 @@ async def handle_admin_callback(query, context, data):
             # Store pending action
             from bot.services.redis_client import get_redis
             redis_client = await get_redis()
-            await redis_client.setex(f"admin_pending:{user_id}", 300, "force_pair")
+            await redis_client.setex(redis_keys.admin_pending(user_id), REDIS_PROMPT_TTL, "force_pair")
             
             try:
                 await query.edit_message_text(
@@ -645,7 +614,7 @@ async def handle_admin_callback(query, context, data):
             # Store pending action
             from bot.services.redis_client import get_redis
             redis_client = await get_redis()
-            await redis_client.setex(f"admin_pending:{user_id}", 300, "ban")
+            await redis_client.setex(redis_keys.admin_pending(user_id), REDIS_PROMPT_TTL, "ban")
             
             try:
                 await query.edit_message_text(
@@ -665,7 +634,7 @@ async def handle_admin_callback(query, context, data):
             # Store pending action
             from bot.services.redis_client import get_redis
             redis_client = await get_redis()
-            await redis_client.setex(f"admin_pending:{user_id}", 300, "unban")
+            await redis_client.setex(redis_keys.admin_pending(user_id), REDIS_PROMPT_TTL, "unban")
             
             try:
                 await query.edit_message_text(
@@ -685,7 +654,7 @@ async def handle_admin_callback(query, context, data):
             # Store pending action
             from bot.services.redis_client import get_redis
             redis_client = await get_redis()
-            await redis_client.setex(f"admin_pending:{user_id}", 300, "disconnect")
+            await redis_client.setex(redis_keys.admin_pending(user_id), REDIS_PROMPT_TTL, "disconnect")
             
             try:
                 await query.edit_message_text(
@@ -736,16 +705,10 @@ async def handle_settings(query, context):
     user_id = query.from_user.id
     
     # Check if user has partner preference unlocked
-    user_data = await fetch_query(
-        "SELECT unlocked_features FROM users WHERE id = $1",
-        user_id
-    )
+    user_data = await get_user_profile(user_id)
     has_partner_preference = False
     if user_data:
         unlocked = user_data.get('unlocked_features') or {}
-        if isinstance(unlocked, str):
-            import json
-            unlocked = json.loads(unlocked) if unlocked else {}
         has_partner_preference = unlocked.get('partner_preference', False)
     
     await query.edit_message_text(
@@ -775,8 +738,7 @@ async def handle_my_stats(query, context):
     user_id = query.from_user.id
     
     # Check if user exists
-    user_data = await fetch_query("SELECT id FROM users WHERE id = $1", user_id)
-    if not user_data:
+    if not await user_exists(user_id):
         await query.edit_message_text("Please start with /start to register first.")
         return
     
@@ -821,8 +783,7 @@ async def handle_invite_callback(query, context):
     
     try:
         # Check if user exists
-        user_data = await fetch_query("SELECT id FROM users WHERE id = $1", user_id)
-        if not user_data:
+        if not await user_exists(user_id):
             try:
                 await query.edit_message_text("Please start with /start to register first.")
             except:
@@ -2,9 +2,10 @@
 Profile editing handlers for callbacks
 """
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from bot.database.connection import fetch_query, execute_query
+from bot.services.user_cache import get_user_profile
+from bot.services import redis_keys
 from bot.utils.keyboards import get_gender_keyboard, get_age_range_keyboard, get_settings_keyboard
-from config.constants import GENDER_MAP
+from config.constants import GENDER_MAP, REDIS_PROMPT_TTL
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,13 +16,7 @@ async def handle_profile_edit(query, context):
     user_id = query.from_user.id
     
     # Get current profile
-    user_data = await fetch_query(
-        """
-        SELECT display_name, gender, age_range 
-        FROM users WHERE id = $1
-        """,
-        user_id
-    )
+    user_data = await get_user_profile(user_id)
     
     if not user_data:
         await query.edit_message_text("Please start with /start to register first.")
@@ -63,19 +58,13 @@ async def handle_partner_preference(query, context):
     user_id = query.from_user.id
     
     # Check if unlocked
-    user_data = await fetch_query(
-        "SELECT unlocked_features FROM users WHERE id = $1",
-        user_id
-    )
+    user_data = await get_user_profile(user_id)
     
     if not user_data:
         await query.edit_message_text("Please start with /start to register first.")
         return
     
     unlocked = user_data.get('unlocked_features') or {}
-    if isinstance(unlocked, str):
-        import json
-        unlocked = json.loads(unlocked) if unlocked else {}
     
     if not unlocked.get('partner_preference', False):
         await query.edit_message_text(
@@ -87,10 +76,7 @@ async def handle_partner_preference(query, context):
         return
     
     # Get current preference
-    user_pref_data = await fetch_query(
-        "SELECT gender_preference FROM users WHERE id = $1",
-        user_id
-    )
+    user_pref_data = await get_user_profile(user_id)
     current_pref = user_pref_data.get('gender_preference', 0) if user_pref_data else 0
     
     current_text = GENDER_MAP.get(current_pref, "Any")
@@ -105,7 +91,7 @@ async def handle_partner_preference(query, context):
     # Store that this is for partner preference
     from bot.services.redis_client import get_redis
     redis_client = await get_redis()
-    await redis_client.setex(f"editing_partner_pref:{user_id}", 300, "1")
+    await redis_client.setex(redis_keys.editing("partner_pref", user_id), REDIS_PROMPT_TTL, "1")
 
 
 async def handle_profile_edit_field(query, context, data):
@@ -116,7 +102,7 @@ async def handle_profile_edit_field(query, context, data):
         # Store editing state
         from bot.services.redis_client import get_redis
         redis_client = await get_redis()
-        await redis_client.setex(f"editing_profile_name:{user_id}", 300, "1")
+        await redis_client.setex(redis_keys.editing("profile_name", user_id), REDIS_PROMPT_TTL, "1")
         
         await query.edit_message_text(
             "✏️ Edit Display Name\n\n"
@@ -127,7 +113,7 @@ async def handle_profile_edit_field(query, context, data):
         # Store editing state
         from bot.services.redis_client import get_redis
         redis_client = await get_redis()
-        await redis_client.setex(f"editing_profile_gender:{user_id}", 300, "1")
+        await redis_client.setex(redis_keys.editing("profile_gender", user_id), REDIS_PROMPT_TTL, "1")
         
         await query.edit_message_text(
             "👤 Edit Gender\n\n"
@@ -138,7 +124,7 @@ async def handle_profile_edit_field(query, context, data):
         # Store editing state
         from bot.services.redis_client import get_redis
         redis_client = await get_redis()
-        await redis_client.setex(f"editing_profile_age:{user_id}", 300, "1")
+        await redis_client.setex(redis_keys.editing("profile_age", user_id), REDIS_PROMPT_TTL, "1")
         
         await query.edit_message_text(
             "📅 Edit Age Range\n\n"
@@ -3,9 +3,14 @@ Command handlers for bot commands
 """
 from telegram import Update
 from telegram.ext import ContextTypes
-from bot.database.connection import fetch_query, fetch_all, execute_query
-from bot.services.matchmaking import add_to_queue, try_match, create_pair, remove_from_queue, get_user_pair, end_pair
+from bot.database import repository
+from bot.services.user_cache import get_user_profile, user_exists, invalidate_user
+from bot.services.matchmaking import (
+    add_to_queue, try_match, requeue_candidate, create_pair, remove_from_queue, get_user_pair, end_pair
+)
 from bot.services.redis_client import get_redis
+from bot.services.pair_sessions import get_session, get_recent_messages, flush_pending_messages
+from bot.services.blocks import block_user
 from bot.services.referrals import generate_referral_link, get_referral_count, get_unlocked_features
 from bot.services.rate_limiter import check_rate_limit
 from bot.handlers.onboarding import get_onboarding_state, handle_onboarding_message
@@ -34,7 +39,7 @@ async def handle_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Check if user exists
-    user_data = await fetch_query("SELECT * FROM users WHERE id = $1", user_id)
+    user_data = await get_user_profile(user_id)
     if not user_data:
         await update.message.reply_text("Please start with /start to register first.")
         return
@@ -64,25 +69,22 @@ async def handle_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Check if user has partner preference unlocked
     unlocked = user_data.get('unlocked_features') or {}
-    if isinstance(unlocked, str):
-        import json
-        unlocked = json.loads(unlocked) if unlocked else {}
-    
     use_gender_pref = unlocked.get('partner_preference', False)
     
     # Add to queue
     await add_to_queue(user_id, gender_filter, language_preference, use_gender_preference=use_gender_pref)
     
     # Try immediate match
-    matched_id = await try_match(user_id, gender_filter, language_preference)
+    match = await try_match(user_id, gender_filter, language_preference)
     
-    if matched_id:
+    if match:
         # Create pair
+        matched_id, queue_key = match
         pair_id = await create_pair(user_id, matched_id, language_preference)
         if pair_id:
-            # Get matched user's display name if available
-            matched_user = await fetch_query("SELECT display_name FROM users WHERE id = $1", matched_id)
-            matched_name = matched_user.get('display_name') if matched_user and matched_user.get('display_name') else "Anonymous"
+            # Get matched user's display name if available (loaded with the pair)
+            session = get_session(pair_id)
+            matched_name = (session.display_name(matched_id) if session else None) or "Anonymous"
             
             from bot.utils.keyboards import get_chat_actions_keyboard
             await update.message.reply_text(
@@ -103,6 +105,8 @@ async def handle_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception as e:
                 logger.error(f"Error notifying matched user: {e}")
         else:
+            # The claimed partner already left their queue: give them their place back
+            await requeue_candidate(matched_id, queue_key)
             await update.message.reply_text("❌ Error creating pair. Please try /next again.")
     else:
         from bot.utils.keyboards import get_waiting_keyboard
@@ -133,17 +137,12 @@ async def handle_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("You're not in a chat or waiting queue.")
         return
     
-    # End the pair
-    await end_pair(pair_id, user_id)
-    
-    # Get partner ID
-    pair_data = await fetch_query(
-        "SELECT user_a, user_b FROM pairs WHERE pair_id = $1",
-        pair_id
-    )
+    # End the pair (returns the members only if this call ended it)
+    members = await end_pair(pair_id, user_id)
     
-    if pair_data:
-        partner_id = pair_data['user_b'] if pair_data['user_a'] == user_id else pair_data['user_a']
+    if members:
+        user_a, user_b = members
+        partner_id = user_b if user_a == user_id else user_a
         
         # Notify partner
         try:
@@ -176,46 +175,36 @@ async def handle_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Get partner
-    pair_data = await fetch_query(
-        "SELECT user_a, user_b FROM pairs WHERE pair_id = $1",
-        pair_id
-    )
+    pair_data = await repository.fetchrow("pairs.members", pair_id)
     if not pair_data:
         await update.message.reply_text("Error: Pair not found.")
         return
     
     reported_user_id = pair_data['user_b'] if pair_data['user_a'] == user_id else pair_data['user_a']
     
-    # Get conversation excerpt (last N messages)
-    import json
-    messages = await fetch_all(
-        f"""
-        SELECT from_id, content, created_at
-        FROM messages
-        WHERE pair_id = $1
-        ORDER BY created_at DESC
-        LIMIT {REPORT_CONVERSATION_EXCERPT_SIZE}
-        """,
-        pair_id
-    )
-    
-    # Convert to JSON-serializable format
-    excerpt = []
-    for msg in messages:
-        excerpt.append({
-            "from_id": msg['from_id'],
-            "content": msg['content'],
-            "created_at": msg['created_at'].isoformat() if hasattr(msg['created_at'], 'isoformat') else str(msg['created_at'])
-        })
+    # Get conversation excerpt (last N messages) from the pair's Redis ring,
+    # after pushing out anything this worker still has queued
+    await flush_pending_messages()
+    try:
+        excerpt = await get_recent_messages(pair_id, REPORT_CONVERSATION_EXCERPT_SIZE)
+    except Exception as e:
+        logger.error(f"Error reading recent messages for pair {pair_id}: {e}")
+        excerpt = []
+    
+    if not excerpt:
+        # Ring lost (e.g. Redis restarted): fall back to the stored messages
+        messages = await repository.fetch("messages.recent_for_pair", pair_id, REPORT_CONVERSATION_EXCERPT_SIZE)
+        excerpt = [
+            {
+                "from_id": msg['from_id'],
+                "content": msg['content'],
+                "created_at": msg['created_at'].isoformat()
+            }
+            for msg in messages
+        ]
     
     # Create report
-    await execute_query(
-        """
-        INSERT INTO reports (pair_id, reported_by, reported_user, conversation_excerpt, status, created_at)
-        VALUES ($1, $2, $3, $4::jsonb, 'pending', NOW())
-        """,
-        pair_id, user_id, reported_user_id, json.dumps(excerpt)
-    )
+    await repository.execute("reports.insert", pair_id, user_id, reported_user_id, excerpt)
     
     # End the pair
     await end_pair(pair_id, user_id)
@@ -243,38 +232,16 @@ async def handle_block(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Get partner
-    pair_data = await fetch_query(
-        "SELECT user_a, user_b FROM pairs WHERE pair_id = $1",
-        pair_id
-    )
+    pair_data = await repository.fetchrow("pairs.members", pair_id)
     if not pair_data:
         await update.message.reply_text("Error: Pair not found.")
         return
     
     blocked_user_id = pair_data['user_b'] if pair_data['user_a'] == user_id else pair_data['user_a']
     
-    # Get current blocked users
-    user_data = await fetch_query("SELECT blocked_users FROM users WHERE id = $1", user_id)
-    blocked_users = user_data.get('blocked_users') if user_data else None
-    
-    # Handle JSONB format (can be list or dict)
-    if blocked_users is None:
-        blocked_users = []
-    elif isinstance(blocked_users, dict):
-        blocked_users = list(blocked_users.values()) if blocked_users else []
-    elif not isinstance(blocked_users, list):
-        blocked_users = []
-    
-    if blocked_user_id not in blocked_users:
-        blocked_users.append(blocked_user_id)
-        
-        # Update blocked users
-        import json
-        await execute_query(
-            "UPDATE users SET blocked_users = $1::jsonb WHERE id = $2",
-            json.dumps(blocked_users), user_id
-        )
-    
+    # Record the block
+    await block_user(user_id, blocked_user_id)
+
     # End the pair
     await end_pair(pair_id, user_id)
     
@@ -295,8 +262,7 @@ async def handle_invite(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     
     # Check if user exists
-    user_data = await fetch_query("SELECT id FROM users WHERE id = $1", user_id)
-    if not user_data:
+    if not await user_exists(user_id):
         await update.message.reply_text("Please start with /start to register first.")
         return
     
@@ -339,8 +305,7 @@ async def handle_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     
     # Check if user exists
-    user_data = await fetch_query("SELECT id FROM users WHERE id = $1", user_id)
-    if not user_data:
+    if not await user_exists(user_id):
         await update.message.reply_text("Please start with /start to register first.")
         return
     
@@ -360,10 +325,8 @@ async def handle_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if choice in lang_map:
         new_lang = lang_map[choice]
-        await execute_query(
-            "UPDATE users SET language_preference = $1 WHERE id = $2",
-            new_lang, user_id
-        )
+        await repository.execute("users.set_language", new_lang, user_id)
+        await invalidate_user(user_id)
         await update.message.reply_text(f"✅ Language preference updated to {new_lang.capitalize()}.")
     else:
         await update.message.reply_text("Please choose 1, 2, 3, or 4.")
@@ -5,32 +5,30 @@ from datetime import datetime
 from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
-from bot.database.connection import execute_query, fetch_query
+from bot.database import repository
+from bot.services.user_cache import user_exists
 from bot.services.referrals import process_referral
 from bot.services.redis_client import get_redis
+from bot.services import redis_keys
+from bot.utils import json_codec
 from bot.utils.validators import validate_display_name, validate_age_range
 from bot.utils.keyboards import get_gender_keyboard, get_skip_keyboard, get_main_menu_keyboard
 from config.constants import (
     GENDER_UNKNOWN, GENDER_MALE, GENDER_FEMALE, GENDER_OTHER, GENDER_PREFER_NOT_SAY,
     LANGUAGE_MALAYALAM, LANGUAGE_ENGLISH, LANGUAGE_HINDI, LANGUAGE_ANY,
-    REFERRAL_PAYLOAD_PREFIX, ADMIN_PAYLOAD_PREFIX, USER_STATE_ONBOARDING
+    REFERRAL_PAYLOAD_PREFIX, ADMIN_PAYLOAD_PREFIX, USER_STATE_ONBOARDING, REDIS_ONBOARDING_TTL
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Onboarding state storage in Redis (temporary, expires after 1 hour)
-ONBOARDING_STATE_PREFIX = "onboarding:"
-
-
 async def get_onboarding_state(user_id: int) -> Optional[dict]:
     """Get user's onboarding state from Redis"""
     try:
         redis_client = await get_redis()
-        state_json = await redis_client.get(f"{ONBOARDING_STATE_PREFIX}{user_id}")
+        state_json = await redis_client.get(redis_keys.onboarding(user_id))
         if state_json:
-            import json
-            return json.loads(state_json)
+            return json_codec.loads(state_json)
         return None
     except Exception as e:
         logger.error(f"Error getting onboarding state: {e}")
@@ -41,12 +39,7 @@ async def set_onboarding_state(user_id: int, state: dict):
     """Set user's onboarding state in Redis"""
     try:
         redis_client = await get_redis()
-        import json
-        await redis_client.setex(
-            f"{ONBOARDING_STATE_PREFIX}{user_id}",
-            3600,  # 1 hour TTL
-            json.dumps(state)
-        )
+        await redis_client.setex(redis_keys.onboarding(user_id), REDIS_ONBOARDING_TTL, json_codec.dumps(state))
     except Exception as e:
         logger.error(f"Error setting onboarding state: {e}")
 
@@ -55,7 +48,7 @@ async def clear_onboarding_state(user_id: int):
     """Clear user's onboarding state"""
     try:
         redis_client = await get_redis()
-        await redis_client.delete(f"{ONBOARDING_STATE_PREFIX}{user_id}")
+        await redis_client.delete(redis_keys.onboarding(user_id))
     except Exception as e:
         logger.error(f"Error clearing onboarding state: {e}")
 
@@ -76,12 +69,7 @@ async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         payload = context.args[0]
     
     # Check if user already exists
-    existing_user = await fetch_query(
-        "SELECT id FROM users WHERE id = $1",
-        user_id
-    )
-    
-    if existing_user:
+    if await user_exists(user_id):
         # User already registered - show main menu immediately
         from bot.utils.keyboards import get_main_menu_keyboard
         await update.message.reply_text(
@@ -227,13 +215,8 @@ async def complete_onboarding(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         # Create user in database
-        await execute_query(
-            """
-            INSERT INTO users (
-                id, username, display_name, gender, language_preference, age_range,
-                created_at, last_active, referral_by
-            ) VALUES ($1, $2, $3, $4, $5, $6, NOW(), NOW(), $7)
-            """,
+        await repository.execute(
+            "users.insert",
             user_id,
             username,
             state.get("display_name"),
@@ -256,7 +239,9 @@ async def complete_onboarding(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # Set user state to idle
         redis_client = await get_redis()
-        await redis_client.setex(f"user_state:{user_id}", 300, "idle")
+        async with redis_client.pipeline(transaction=False) as pipe:
+            redis_keys.set_idle(pipe, user_id)
+            await pipe.execute()
         
         from bot.utils.keyboards import get_main_menu_keyboard
         await update.message.reply_text(
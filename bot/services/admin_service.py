@@ -3,12 +3,13 @@ Admin service for admin operations
 """
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from bot.database.connection import execute_query, fetch_query, fetch_all
-from bot.services.redis_client import get_redis
-from bot.services.matchmaking import get_queue_size, create_pair
+from bot.database import repository
+from bot.services.user_cache import invalidate_user
+from bot.services.global_counters import get_global_counts
+from bot.services.matchmaking import get_queue_sizes, create_pair
+from bot.services.presence import get_presence_counts
 from config.constants import (
-    ADMIN_SESSION_DURATION_HOURS, GENDER_UNKNOWN, LANGUAGE_ANY,
-    USER_STATE_WAITING, USER_STATE_CHATTING, USER_STATE_IDLE
+    ADMIN_SESSION_DURATION_HOURS, LANGUAGE_ANY, USER_STATE_IDLE
 )
 import logging
 
@@ -19,14 +20,7 @@ async def grant_admin_access(user_id: int) -> bool:
     """Grant admin access to a user (2 hour session)"""
     try:
         expiry = datetime.utcnow() + timedelta(hours=ADMIN_SESSION_DURATION_HOURS)
-        await execute_query(
-            """
-            UPDATE users
-            SET is_admin = true, admin_session_expiry = $1
-            WHERE id = $2
-            """,
-            expiry, user_id
-        )
+        await repository.execute("users.grant_admin", expiry, user_id)
         logger.info(f"Granted admin access to user {user_id}")
         return True
     except Exception as e:
@@ -37,10 +31,7 @@ async def grant_admin_access(user_id: int) -> bool:
 async def check_admin_access(user_id: int) -> bool:
     """Check if user has valid admin access"""
     try:
-        user_data = await fetch_query(
-            "SELECT is_admin, admin_session_expiry FROM users WHERE id = $1",
-            user_id
-        )
+        user_data = await repository.fetchrow("users.admin_session", user_id)
         
         if not user_data or not user_data['is_admin']:
             return False
@@ -50,10 +41,7 @@ async def check_admin_access(user_id: int) -> bool:
             expiry = user_data['admin_session_expiry']
             if datetime.utcnow() > expiry:
                 # Revoke admin access
-                await execute_query(
-                    "UPDATE users SET is_admin = false, admin_session_expiry = NULL WHERE id = $1",
-                    user_id
-                )
+                await repository.execute("users.revoke_admin", user_id)
                 return False
         
         return True
@@ -65,15 +53,7 @@ async def check_admin_access(user_id: int) -> bool:
 async def log_admin_action(admin_id: int, action: str, metadata: Dict = None):
     """Log an admin action"""
     try:
-        import json
-        meta_json = json.dumps(metadata or {})
-        await execute_query(
-            """
-            INSERT INTO admin_logs (admin_id, action, metadata, created_at)
-            VALUES ($1, $2, $3::jsonb, NOW())
-            """,
-            admin_id, action, meta_json
-        )
+        await repository.execute("admin_logs.insert", admin_id, action, metadata or {})
     except Exception as e:
         logger.error(f"Error logging admin action: {e}")
 
@@ -81,41 +61,26 @@ async def log_admin_action(admin_id: int, action: str, metadata: Dict = None):
 async def get_online_stats() -> Dict:
     """Get online user statistics"""
     try:
-        redis_client = await get_redis()
-        
-        # Count users in different states
-        waiting_keys = await redis_client.keys("user_state:*")
-        waiting_count = 0
-        chatting_count = 0
-        
-        for key in waiting_keys:
-            state = await redis_client.get(key)
-            if state == USER_STATE_WAITING:
-                waiting_count += 1
-            elif state == USER_STATE_CHATTING:
-                chatting_count += 1
+        # Online, waiting and chatting users from the presence sets
+        presence = await get_presence_counts()
         
         # Get queue sizes
         queue_sizes = {}
         try:
-            for gender in [GENDER_UNKNOWN, 1, 2, 3]:
-                for lang in ['any', 'malayalam', 'english', 'hindi']:
-                    size = await get_queue_size(gender, lang)
-                    if size > 0:
-                        queue_sizes[f"gender_{gender}_lang_{lang}"] = size
+            for (gender, lang), size in (await get_queue_sizes()).items():
+                if size > 0:
+                    queue_sizes[f"gender_{gender}_lang_{lang}"] = size
         except Exception as e:
             logger.error(f"Error getting queue sizes: {e}")
         
         # Get total active pairs
-        from bot.database.connection import fetch_query
-        pairs_data = await fetch_query(
-            "SELECT COUNT(*) as count FROM pairs WHERE is_active = true"
-        )
-        active_pairs = pairs_data['count'] if pairs_data else 0
+        counts = await get_global_counts(estimate=False)
+        active_pairs = counts['pairs_active']
         
         return {
-            "waiting_users": waiting_count,
-            "chatting_users": chatting_count,
+            "online_users": presence["online"],
+            "waiting_users": presence["waiting"],
+            "chatting_users": presence["chatting"],
             "active_pairs": active_pairs,
             "queue_sizes": queue_sizes
         }
@@ -127,15 +92,7 @@ async def get_online_stats() -> Dict:
 async def get_user_pair_info(user_id: int) -> Optional[Dict]:
     """Get pair information for a user (for admin)"""
     try:
-        pair_data = await fetch_query(
-            """
-            SELECT pair_id, user_a, user_b, started_at, last_message_at, is_active
-            FROM pairs
-            WHERE (user_a = $1 OR user_b = $1) AND is_active = true
-            ORDER BY started_at DESC LIMIT 1
-            """,
-            user_id
-        )
+        pair_data = await repository.fetchrow("pair_members.active_pair_info", user_id)
         
         if pair_data:
             return {
@@ -171,10 +128,8 @@ async def force_pair_users(user_a: int, user_b: int, language: str = LANGUAGE_AN
 async def ban_user(user_id: int, admin_id: int) -> bool:
     """Ban a user"""
     try:
-        await execute_query(
-            "UPDATE users SET is_banned = true WHERE id = $1",
-            user_id
-        )
+        await repository.execute("users.set_banned", True, user_id)
+        await invalidate_user(user_id)
         await log_admin_action(admin_id, "ban", {"user_id": user_id})
         logger.info(f"User {user_id} banned by admin {admin_id}")
         return True
@@ -186,10 +141,8 @@ async def ban_user(user_id: int, admin_id: int) -> bool:
 async def unban_user(user_id: int, admin_id: int) -> bool:
     """Unban a user"""
     try:
-        await execute_query(
-            "UPDATE users SET is_banned = false WHERE id = $1",
-            user_id
-        )
+        await repository.execute("users.set_banned", False, user_id)
+        await invalidate_user(user_id)
         await log_admin_action(admin_id, "unban", {"user_id": user_id})
         logger.info(f"User {user_id} unbanned by admin {admin_id}")
         return True
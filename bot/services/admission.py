@@ -0,0 +1,180 @@
+"""
+Webhook admission control: concurrency cap, short priority queue and load shedding
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+from bot.services import metrics
+from config.constants import WEBHOOK_BUSY_MESSAGE, HIGH_PRIORITY_COMMANDS, HIGH_PRIORITY_CALLBACKS
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = "high"
+PRIORITY_LOW = "low"
+
+
+def classify_update(data: dict) -> str:
+    """
+    Classify a raw Telegram update by priority
+    In-chat messages and /stop are high priority, menu navigation is low
+    """
+    message = data.get("message") or data.get("edited_message")
+    if message:
+        text = message.get("text") or ""
+        if not text.startswith("/"):
+            return PRIORITY_HIGH
+        command = text.split(maxsplit=1)[0].split("@", 1)[0].lower()
+        return PRIORITY_HIGH if command in HIGH_PRIORITY_COMMANDS else PRIORITY_LOW
+
+    callback_query = data.get("callback_query")
+    if callback_query:
+        return PRIORITY_HIGH if callback_query.get("data") in HIGH_PRIORITY_CALLBACKS else PRIORITY_LOW
+
+    return PRIORITY_LOW
+
+
+def build_busy_response(data: dict) -> dict:
+    """
+    Build a cheap "busy" reply for a shed update
+    Returned as the webhook response body, so no extra Bot API call is made
+    """
+    message = data.get("message") or data.get("edited_message")
+    if message and message.get("chat"):
+        return {
+            "method": "sendMessage",
+            "chat_id": message["chat"]["id"],
+            "text": WEBHOOK_BUSY_MESSAGE
+        }
+
+    callback_query = data.get("callback_query")
+    if callback_query and callback_query.get("id"):
+        return {
+            "method": "answerCallbackQuery",
+            "callback_query_id": callback_query["id"],
+            "text": WEBHOOK_BUSY_MESSAGE
+        }
+
+    return {"status": "busy"}
+
+
+class AdmissionController:
+    """
+    Caps concurrent update processing with a short two-level queue
+    High priority waiters are always served first; low priority work may only
+    use part of the queue and is evicted to make room for high priority work
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, low_priority_queue_share: float = 0.5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.low_priority_queue_limit = max(0, int(max_queue * low_priority_queue_share))
+        self._active = 0
+        self._high = deque()
+        self._low = deque()
+        metrics.register_collector(self.collect_metrics)
+
+    @property
+    def queued(self) -> int:
+        return len(self._high) + len(self._low)
+
+    def collect_metrics(self) -> dict:
+        return {
+            "webhook_inflight": self._active,
+            "webhook_queued": self.queued,
+            "webhook_max_concurrency": self.max_concurrency
+        }
+
+    def _make_room(self, priority: str) -> bool:
+        """Check whether a new waiter of this priority may join the queue"""
+        if priority == PRIORITY_LOW:
+            return len(self._low) < self.low_priority_queue_limit and self.queued < self.max_queue
+
+        if self.queued < self.max_queue:
+            return True
+
+        # Queue is full: evict the newest low priority waiter
+        while self._low:
+            waiter = self._low.pop()
+            if not waiter.done():
+                waiter.set_result(False)
+                return True
+        return False
+
+    async def acquire(self, priority: str) -> bool:
+        """
+        Wait for a processing slot
+        Returns False if the update should be shed
+        """
+        if self._active < self.max_concurrency and not self.queued:
+            self._active += 1
+            metrics.increment("webhook_admitted_total", priority=priority)
+            return True
+
+        if not self._make_room(priority):
+            self._shed(priority, "queue_full")
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._high if priority == PRIORITY_HIGH else self._low
+        queue.append(waiter)
+        started = time.monotonic()
+        timed_out = False
+        try:
+            granted = await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # A slot handed over just as the timeout fired is still ours: give it back
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            granted = False
+            timed_out = True
+        except asyncio.CancelledError:
+            # Hand back a slot that was granted just before the request went away
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            raise
+        finally:
+            try:
+                queue.remove(waiter)
+            except ValueError:
+                pass
+        metrics.observe("webhook_queue_wait_seconds", time.monotonic() - started, priority=priority)
+
+        if not granted:
+            self._shed(priority, "timeout" if timed_out else "evicted")
+            return False
+        metrics.increment("webhook_admitted_total", priority=priority)
+        return True
+
+    def release(self):
+        """Release a slot, handing it directly to the next waiter if any"""
+        for queue in (self._high, self._low):
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    # Slot is transferred, active count stays the same
+                    waiter.set_result(True)
+                    return
+        self._active -= 1
+
+    def _shed(self, priority: str, reason: str):
+        metrics.increment("webhook_shed_total", priority=priority, reason=reason)
+        logger.debug(f"Shedding {priority} priority update ({reason})")
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the webhook admission controller"""
+    global _controller
+    if _controller is None:
+        from config.settings import settings
+        _controller = AdmissionController(
+            max_concurrency=settings.webhook_max_concurrency,
+            max_queue=settings.webhook_max_queue,
+            queue_timeout=settings.webhook_queue_timeout
+        )
+    return _controller
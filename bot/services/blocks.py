@@ -0,0 +1,33 @@
+"""
+User blocking service backed by the user_blocks table
+"""
+from typing import Iterable, Set
+from bot.database import repository
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def block_user(blocker_id: int, blocked_id: int) -> bool:
+    """
+    Record that blocker_id blocked blocked_id (idempotent)
+    Returns True if stored successfully
+    """
+    try:
+        await repository.execute("blocks.insert", blocker_id, blocked_id)
+        return True
+    except Exception as e:
+        logger.error(f"Error blocking user: {e}")
+        return False
+
+
+async def get_block_conflicts(user_id: int, candidate_ids: Iterable[int]) -> Set[int]:
+    """
+    Return the candidates that user_id has blocked or that have blocked user_id
+    One query for the whole batch
+    """
+    candidate_ids = list(candidate_ids)
+    if not candidate_ids:
+        return set()
+    rows = await repository.fetch("blocks.conflicts", user_id, candidate_ids)
+    return {row['other_id'] for row in rows}
@@ -0,0 +1,47 @@
+"""
+Global counters for admin statistics
+
+Totals and the banned / active / pending subsets of users, pairs and reports
+are kept in the global_counters table in the same transaction as the write:
+by statement-level triggers on INSERT/DELETE (and UPDATE of reports), and by
+the users.set_banned, pairs.end and pairs.end_idle statements themselves, so
+hot UPDATEs such as pairs.touch fire no trigger. Each counter is a handful of shard rows, so reading them costs
+the same at any table size. With ADMIN_STATS_ESTIMATES set, table totals come
+from the planner's pg_class.reltuples estimate instead.
+"""
+from typing import Dict, Optional
+from bot.database import repository
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+COUNTER_NAMES = (
+    "users_total", "users_banned",
+    "pairs_total", "pairs_active",
+    "reports_total", "reports_pending",
+)
+
+# Table whose reltuples estimate can stand in for each total
+_ESTIMATED_TOTALS = {"users": "users_total", "pairs": "pairs_total", "reports": "reports_total"}
+
+
+async def get_global_counts(estimate: Optional[bool] = None) -> Dict[str, int]:
+    """
+    Get all global counters
+    Totals are estimates when estimate is true (defaults to ADMIN_STATS_ESTIMATES)
+    """
+    if estimate is None:
+        estimate = settings.admin_stats_estimates
+    counts = dict.fromkeys(COUNTER_NAMES, 0)
+    try:
+        rows = await repository.fetch("global_counters.all")
+        counts.update({row['name']: row['value'] for row in rows})
+        if estimate:
+            for row in await repository.fetch("global_counters.estimate_totals"):
+                # reltuples is -1 until the table has been vacuumed or analyzed
+                if row['estimate'] >= 0:
+                    counts[_ESTIMATED_TOTALS[row['relname']]] = row['estimate']
+    except Exception as e:
+        logger.error(f"Error getting global counters: {e}")
+    return counts
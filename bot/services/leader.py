@@ -0,0 +1,102 @@
+"""
+Leader election across worker processes and replicas using a Redis lock
+Only the elected process registers the webhook and runs periodic jobs
+"""
+import asyncio
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, List
+from bot.services.redis_client import get_redis
+from bot.services import metrics
+from bot.services.redis_keys import LEADER_KEY
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Extend the lock only if we still own it
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Release the lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderElection:
+    """
+    Campaigns for a Redis lock with a TTL and renews it while alive
+    If the leader dies, the lock expires and another process takes over
+    """
+
+    def __init__(self, ttl_seconds: int = 30):
+        self.ttl_seconds = ttl_seconds
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._on_elected: List[Callable[[], Awaitable[None]]] = []
+        self._task = None
+        metrics.register_collector(lambda: {"leader": 1 if self.is_leader else 0})
+
+    def on_elected(self, callback: Callable[[], Awaitable[None]]):
+        """Register a coroutine function to run each time this process becomes leader"""
+        self._on_elected.append(callback)
+
+    async def _campaign_once(self) -> bool:
+        if settings.state_backend == "memory":
+            # Single-node mode: this is the only process
+            return True
+        redis_client = await get_redis()
+        if self.is_leader:
+            renewed = await redis_client.eval(_RENEW_SCRIPT, 1, LEADER_KEY, self.identity, self.ttl_seconds)
+            return bool(renewed)
+        acquired = await redis_client.set(LEADER_KEY, self.identity, nx=True, ex=self.ttl_seconds)
+        return bool(acquired)
+
+    async def _run(self):
+        while True:
+            try:
+                leader = await self._campaign_once()
+            except Exception as e:
+                logger.error(f"Leader election error: {e}")
+                leader = False
+
+            if leader and not self.is_leader:
+                self.is_leader = True
+                logger.info(f"Process {self.identity} elected leader")
+                for callback in self._on_elected:
+                    try:
+                        await callback()
+                    except Exception as e:
+                        logger.error(f"Error in leader callback: {e}")
+            elif not leader and self.is_leader:
+                self.is_leader = False
+                logger.warning(f"Process {self.identity} lost leadership")
+
+            await asyncio.sleep(self.ttl_seconds / 3)
+
+    def start(self):
+        """Start campaigning in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop campaigning and release the lock so another process can take over quickly"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.is_leader and settings.state_backend != "memory":
+            try:
+                redis_client = await get_redis()
+                await redis_client.eval(_RELEASE_SCRIPT, 1, LEADER_KEY, self.identity)
+            except Exception as e:
+                logger.error(f"Error releasing leadership: {e}")
+        self.is_leader = False
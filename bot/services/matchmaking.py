@@ -1,23 +1,26 @@
 """
 Matchmaking service for pairing users
 """
-import uuid
+import asyncio
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
+import asyncpg
 from bot.services.redis_client import get_redis
-from bot.database.connection import execute_query, fetch_query, fetch_all
+from bot.services import redis_keys
+from bot.database import repository
+from bot.services.user_cache import get_user_profile
+from bot.services.pair_sessions import open_session, close_session
+from bot.services.blocks import get_block_conflicts
+from bot.utils.ids import uuid7
 from config.constants import (
-    REDIS_QUEUE_PREFIX, MATCH_TIMEOUT_SECONDS, GENDER_UNKNOWN,
-    USER_STATE_WAITING, USER_STATE_CHATTING, LANGUAGE_ANY
+    MATCH_TIMEOUT_SECONDS, GENDER_UNKNOWN, LANGUAGE_ANY, USER_STATE_WAITING
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
-
-def get_queue_key(gender: int, language: str) -> str:
-    """Generate Redis queue key for gender and language combination"""
-    return f"{REDIS_QUEUE_PREFIX}:gender:{gender}:lang:{language}"
+# Unique index allowing one active pair per user
+ACTIVE_MEMBER_INDEX = "idx_pair_members_user_active"
 
 
 async def add_to_queue(user_id: int, gender_filter: int, language_preference: str, use_gender_preference: bool = False) -> bool:
@@ -36,33 +39,27 @@ async def add_to_queue(user_id: int, gender_filter: int, language_preference: st
         
         # If use_gender_preference is True, get user's gender_preference
         if use_gender_preference:
-            from bot.database.connection import fetch_query
-            user_data = await fetch_query(
-                "SELECT gender_preference, unlocked_features FROM users WHERE id = $1",
-                user_id
-            )
+            user_data = await get_user_profile(user_id)
             if user_data:
                 unlocked = user_data.get('unlocked_features') or {}
-                if isinstance(unlocked, str):
-                    import json
-                    unlocked = json.loads(unlocked) if unlocked else {}
-                
                 if unlocked.get('partner_preference', False):
                     gender_pref = user_data.get('gender_preference', 0) or 0
                     if gender_pref > 0:  # Only use if set (not 0/any)
                         gender_filter = gender_pref
         
-        queue_key = get_queue_key(gender_filter, language_preference)
+        queue_key = redis_keys.queue(gender_filter, language_preference)
         
-        # Check if user is already in any queue
-        existing_queues = await redis_client.keys(f"{REDIS_QUEUE_PREFIX}:*")
-        for queue in existing_queues:
-            if await redis_client.lrem(queue, 0, str(user_id)) > 0:
+        # Leave any queue the user is already in and join the new one, in one round trip
+        # (queues are in different slots, so this is a plain pipeline)
+        queues = [key for _, _, key in redis_keys.all_queues()]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for queue in queues:
+                pipe.lrem(queue, 0, str(user_id))
+            redis_keys.set_waiting(pipe, user_id, queue_key)
+            removed = await pipe.execute()
+        for queue, count in zip(queues, removed):
+            if count > 0:
                 logger.info(f"Removed user {user_id} from existing queue {queue}")
-        
-        # Add to new queue
-        await redis_client.lpush(queue_key, str(user_id))
-        await redis_client.setex(f"user_state:{user_id}", 300, USER_STATE_WAITING)  # 5 min TTL
         logger.info(f"Added user {user_id} to queue {queue_key}")
         return True
     except Exception as e:
@@ -74,130 +71,146 @@ async def remove_from_queue(user_id: int) -> bool:
     """Remove user from all queues"""
     try:
         redis_client = await get_redis()
-        queues = await redis_client.keys(f"{REDIS_QUEUE_PREFIX}:*")
-        removed = False
-        for queue in queues:
-            if await redis_client.lrem(queue, 0, str(user_id)) > 0:
-                removed = True
+        queues = [key for _, _, key in redis_keys.all_queues()]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for queue in queues:
+                pipe.lrem(queue, 0, str(user_id))
+            redis_keys.clear_waiting(pipe, user_id)
+            removed = (await pipe.execute())[:len(queues)]
+        for queue, count in zip(queues, removed):
+            if count > 0:
                 logger.info(f"Removed user {user_id} from queue {queue}")
-        return removed
+        return any(removed)
     except Exception as e:
         logger.error(f"Error removing user from queue: {e}")
         return False
 
 
-async def try_match(user_id: int, gender_filter: int, language_preference: str) -> Optional[int]:
+async def try_match(user_id: int, gender_filter: int, language_preference: str) -> Optional[Tuple[int, str]]:
     """
     Try to find a match for the user
-    Returns matched user_id if found, None otherwise
+    Returns (matched user_id, queue it was claimed from) if found, None otherwise
     """
     redis_client = await get_redis()
     
     # Primary queue (exact match)
-    primary_key = get_queue_key(gender_filter, language_preference)
+    primary_key = redis_keys.queue(gender_filter, language_preference)
     matched_id = await try_match_from_queue(redis_client, primary_key, user_id)
     if matched_id:
-        return matched_id
+        return matched_id, primary_key
     
     # Fallback: try 'any' language with same gender
     if language_preference != LANGUAGE_ANY:
-        fallback_key = get_queue_key(gender_filter, LANGUAGE_ANY)
+        fallback_key = redis_keys.queue(gender_filter, LANGUAGE_ANY)
         matched_id = await try_match_from_queue(redis_client, fallback_key, user_id)
         if matched_id:
-            return matched_id
+            return matched_id, fallback_key
     
     # Fallback: try 'any' gender with same language
     if gender_filter != GENDER_UNKNOWN:
-        fallback_key = get_queue_key(GENDER_UNKNOWN, language_preference)
+        fallback_key = redis_keys.queue(GENDER_UNKNOWN, language_preference)
         matched_id = await try_match_from_queue(redis_client, fallback_key, user_id)
         if matched_id:
-            return matched_id
+            return matched_id, fallback_key
     
     # Final fallback: any gender, any language
     if gender_filter != GENDER_UNKNOWN or language_preference != LANGUAGE_ANY:
-        fallback_key = get_queue_key(GENDER_UNKNOWN, LANGUAGE_ANY)
+        fallback_key = redis_keys.queue(GENDER_UNKNOWN, LANGUAGE_ANY)
         matched_id = await try_match_from_queue(redis_client, fallback_key, user_id)
         if matched_id:
-            return matched_id
+            return matched_id, fallback_key
     
     return None
 
 
 async def try_match_from_queue(redis_client, queue_key: str, user_id: int) -> Optional[int]:
-    """Try to pop a user from the queue (excluding self)"""
+    """Try to claim a user from the queue (excluding self, banned and blocked users)"""
     try:
-        # Get queue length
-        queue_len = await redis_client.llen(queue_key)
-        if queue_len == 0:
+        # Peek at the oldest candidates (max 10); they stay queued until claimed
+        tail = await redis_client.lrange(queue_key, -10, -1)
+        candidate_ids = []
+        for candidate_id_str in reversed(tail):
+            candidate_id = int(candidate_id_str)
+            if candidate_id != user_id and candidate_id not in candidate_ids:
+                candidate_ids.append(candidate_id)
+        if not candidate_ids:
             return None
         
-        # Pop and check users until we find a valid match
-        for _ in range(min(queue_len, 10)):  # Check max 10 users
-            candidate_id_str = await redis_client.rpop(queue_key)
-            if not candidate_id_str:
-                break
-            
-            candidate_id = int(candidate_id_str)
-            
-            # Skip self
-            if candidate_id == user_id:
-                await redis_client.lpush(queue_key, candidate_id_str)  # Put back
+        # Check ban status and blocks for the whole batch at once
+        rows = await repository.fetch("users.ban_status_many", candidate_ids)
+        banned = {row['id'] for row in rows if row['is_banned']}
+        unknown = set(candidate_ids) - {row['id'] for row in rows}
+        blocked = await get_block_conflicts(user_id, candidate_ids)
+        
+        for candidate_id in candidate_ids:
+            if candidate_id in banned or candidate_id in unknown:
+                # Banned or deleted users never match; drop them from the queue
+                await redis_client.lrem(queue_key, 0, str(candidate_id))
                 continue
-            
-            # Check if user is banned or blocked
-            user_data = await fetch_query(
-                "SELECT is_banned, blocked_users FROM users WHERE id = $1",
-                candidate_id
-            )
-            
-            if not user_data or user_data.get('is_banned'):
+            if candidate_id in blocked:
+                # Blocked for this user only; leave them queued for others
                 continue
-            
-            # Check if current user blocked this candidate
-            current_user_data = await fetch_query(
-                "SELECT blocked_users FROM users WHERE id = $1",
-                user_id
-            )
-            if current_user_data:
-                blocked = current_user_data.get('blocked_users') or []
-                # Handle both list and JSONB format
-                if isinstance(blocked, list) and candidate_id in blocked:
-                    continue
-                elif isinstance(blocked, dict) and candidate_id in blocked.values():
-                    continue
-            
-            # Valid match found
-            return candidate_id
+            # Claim the candidate; another worker may have taken them first
+            if await redis_client.lrem(queue_key, 1, str(candidate_id)):
+                return candidate_id
         
-        # No valid match found, put back the popped users
         return None
     except Exception as e:
         logger.error(f"Error trying match from queue {queue_key}: {e}")
         return None
 
 
+async def requeue_candidate(candidate_id: int, queue_key: str):
+    """
+    Put back a claimed candidate that could not be paired, as the oldest entry of its queue
+    Skipped if the candidate is chatting or no longer waiting (a leftover queue entry)
+    """
+    try:
+        redis_client = await get_redis()
+        state, pair_id = await redis_client.mget(
+            redis_keys.user_state(candidate_id), redis_keys.user_pair(candidate_id)
+        )
+        if state != USER_STATE_WAITING or pair_id:
+            logger.info(f"Not requeueing {candidate_id}: no longer waiting")
+            return
+        await redis_client.rpush(queue_key, str(candidate_id))
+        logger.info(f"Requeued {candidate_id} at the front of {queue_key}")
+    except Exception as e:
+        logger.error(f"Error requeueing {candidate_id}: {e}")
+
+
 async def create_pair(user_a: int, user_b: int, language_used: str) -> Optional[str]:
     """
     Create a pair record in database
-    Returns pair_id if successful
+    Returns pair_id if successful, None if either user is already paired
     """
     try:
-        import uuid
-        pair_id = str(uuid.uuid4())
-        await execute_query(
-            """
-            INSERT INTO pairs (pair_id, user_a, user_b, language_used, started_at, last_message_at)
-            VALUES ($1::uuid, $2, $3, $4, NOW(), NOW())
-            """,
-            pair_id, user_a, user_b, language_used
+        # Pair, members and counters are written by one statement (one transaction).
+        # Time-ordered ids keep pairs/messages index inserts on the rightmost pages.
+        try:
+            pair_id = await repository.fetchval("pairs.create", str(uuid7()), user_a, user_b, language_used)
+        except asyncpg.UniqueViolationError as e:
+            if e.constraint_name != ACTIVE_MEMBER_INDEX:
+                raise
+            # Lost a race with another create for one of the users
+            pair_id = None
+        if pair_id is None:
+            logger.warning(f"Not pairing {user_a} and {user_b}: one of them is already in a chat")
+            return None
+        pair_id = str(pair_id)
+        # Display names come from the profile cache (both users just looked themselves up)
+        profile_a, profile_b = await asyncio.gather(get_user_profile(user_a), get_user_profile(user_b))
+        open_session(
+            pair_id, user_a, user_b,
+            profile_a.display_name if profile_a else None,
+            profile_b.display_name if profile_b else None
         )
         
         # Update user states in Redis
         redis_client = await get_redis()
-        await redis_client.setex(f"user_state:{user_a}", 3600, USER_STATE_CHATTING)
-        await redis_client.setex(f"user_state:{user_b}", 3600, USER_STATE_CHATTING)
-        await redis_client.set(f"user_pair:{user_a}", pair_id, ex=3600)
-        await redis_client.set(f"user_pair:{user_b}", pair_id, ex=3600)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            redis_keys.set_pair_state(pipe, user_a, user_b, pair_id)
+            await pipe.execute()
         
         logger.info(f"Created pair {pair_id} between users {user_a} and {user_b}")
         return pair_id
@@ -210,19 +223,12 @@ async def get_user_pair(user_id: int) -> Optional[str]:
     """Get the active pair_id for a user"""
     try:
         redis_client = await get_redis()
-        pair_id = await redis_client.get(f"user_pair:{user_id}")
+        pair_id = await redis_client.get(redis_keys.user_pair(user_id))
         if pair_id:
             return pair_id
         
         # Fallback to database
-        pair_data = await fetch_query(
-            """
-            SELECT pair_id FROM pairs
-            WHERE (user_a = $1 OR user_b = $1) AND is_active = true
-            ORDER BY started_at DESC LIMIT 1
-            """,
-            user_id
-        )
+        pair_data = await repository.fetchrow("pair_members.active_pair", user_id)
         if pair_data:
             return pair_data['pair_id']
         return None
@@ -231,38 +237,43 @@ async def get_user_pair(user_id: int) -> Optional[str]:
         return None
 
 
-async def end_pair(pair_id: str, user_id: Optional[int] = None):
-    """End a pair (mark as inactive)"""
+async def end_pair(pair_id: str, user_id: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """
+    End a pair (mark as inactive)
+    Returns (user_a, user_b) if this call ended it, None if it was already ended.
+    Safe to repeat: ending an ended pair only clears user_id's leftover Redis state.
+    """
     try:
-        await execute_query(
-            "UPDATE pairs SET is_active = false WHERE pair_id = $1",
-            pair_id
-        )
+        pair_data = await repository.fetchrow("pairs.end", pair_id)
+        close_session(pair_id)
         
-        # Clear Redis state for both users
+        # Clear Redis state and tell other workers to drop the session, in one round trip
         redis_client = await get_redis()
-        pair_data = await fetch_query(
-            "SELECT user_a, user_b FROM pairs WHERE pair_id = $1",
-            pair_id
-        )
-        
-        if pair_data:
-            await redis_client.delete(f"user_pair:{pair_data['user_a']}")
-            await redis_client.delete(f"user_pair:{pair_data['user_b']}")
-            await redis_client.delete(f"user_state:{pair_data['user_a']}")
-            await redis_client.delete(f"user_state:{pair_data['user_b']}")
+        async with redis_client.pipeline(transaction=False) as pipe:
+            if pair_data:
+                user_a, user_b = pair_data['user_a'], pair_data['user_b']
+                redis_keys.delete_pair_state(pipe, user_a, user_b, pair_id)
+                pipe.publish(redis_keys.SESSION_CLOSED_CHANNEL, pair_id)
+            elif user_id is not None:
+                redis_keys.delete_user_state(pipe, user_id)
+            await pipe.execute()
         
+        if not pair_data:
+            return None
         logger.info(f"Ended pair {pair_id}")
+        return user_a, user_b
     except Exception as e:
         logger.error(f"Error ending pair: {e}")
+        return None
 
 
-async def get_queue_size(gender: int, language: str) -> int:
-    """Get the size of a specific queue"""
-    try:
-        redis_client = await get_redis()
-        queue_key = get_queue_key(gender, language)
-        return await redis_client.llen(queue_key)
-    except:
-        return 0
+async def get_queue_sizes() -> Dict[Tuple[int, str], int]:
+    """Sizes of every matchmaking queue, keyed by (gender, language), in one round trip"""
+    redis_client = await get_redis()
+    queues = list(redis_keys.all_queues())
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for _, _, key in queues:
+            pipe.llen(key)
+        sizes = await pipe.execute()
+    return {(gender, language): size for (gender, language, _), size in zip(queues, sizes)}
 
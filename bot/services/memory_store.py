@@ -0,0 +1,473 @@
+"""
+In-process state backend for single-node deployments
+
+MemoryStore implements the part of the redis.asyncio.Redis API the bot uses
+(strings, lists, hashes, sets, sorted sets, TTLs, pipelines and pub/sub), so
+handlers and services run unchanged with STATE_BACKEND=memory: get_redis()
+returns a MemoryStore instead of a Redis client and state is served without a
+network hop. Values come back as strings, as with decode_responses=True.
+
+State lives in one process, so this backend requires WEB_CONCURRENCY=1.
+Commands run without awaiting, so each command and each pipeline is atomic
+with respect to other tasks.
+
+- TTLs are checked on access and swept every STATE_MEMORY_SWEEP_INTERVAL
+- The key count is capped at STATE_MEMORY_MAX_KEYS; the least recently used
+  key is evicted first (like Redis' allkeys-lru)
+- With STATE_SNAPSHOT_PATH set, state is loaded from that file at startup and
+  written back every STATE_SNAPSHOT_INTERVAL and on shutdown
+"""
+import asyncio
+import fnmatch
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+from redis.exceptions import ResponseError
+from bot.services import metrics
+from bot.utils import json_codec
+from config.constants import STATE_MEMORY_SWEEP_INTERVAL, STATE_SNAPSHOT_INTERVAL
+import logging
+
+logger = logging.getLogger(__name__)
+
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+
+def _encode(value: Any) -> str:
+    """Store values the way redis-py sends them"""
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _score_bound(value: Any) -> float:
+    if isinstance(value, str):
+        if value in ("-inf", "+inf", "inf"):
+            return float(value)
+        if value.startswith("("):
+            # Exclusive bounds are treated as inclusive; scores here are timestamps
+            return float(value[1:])
+    return float(value)
+
+
+def _list_or_args(keys, args) -> List[str]:
+    keys = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+    return keys + list(args)
+
+
+class MemoryPipeline:
+    """Queues commands and runs them back to back on execute()"""
+
+    def __init__(self, store: "MemoryStore"):
+        self._store = store
+        self._commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self._store, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        commands, self._commands = self._commands, []
+        results = []
+        for command, args, kwargs in commands:
+            try:
+                results.append(await command(*args, **kwargs))
+            except ResponseError as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+
+class MemoryPubSub:
+    """Channel subscription fed by MemoryStore.publish"""
+
+    def __init__(self, store: "MemoryStore"):
+        self._store = store
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.channels = set()
+
+    async def subscribe(self, *channels):
+        for channel in channels:
+            self.channels.add(channel)
+            self._store._subscribers.setdefault(channel, set()).add(self)
+            self._queue.put_nowait({"type": "subscribe", "channel": channel, "data": len(self.channels)})
+
+    async def unsubscribe(self, *channels):
+        for channel in channels or list(self.channels):
+            self.channels.discard(channel)
+            self._store._subscribers.get(channel, set()).discard(self)
+
+    async def listen(self):
+        while True:
+            yield await self._queue.get()
+
+    async def close(self):
+        await self.unsubscribe()
+
+    aclose = close
+
+
+class MemoryStore:
+    """Redis-compatible in-process key/value store with TTLs, LRU bound and snapshots"""
+
+    def __init__(self, max_keys: int, snapshot_path: Optional[str] = None):
+        self.max_keys = max_keys
+        self.snapshot_path = snapshot_path
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._expires: Dict[str, float] = {}
+        self._subscribers: Dict[str, set] = {}
+        self._task: Optional[asyncio.Task] = None
+        if snapshot_path:
+            self._load_snapshot()
+
+    # Lifecycle
+
+    def start(self):
+        """Start the TTL sweep (and snapshot) loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self):
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(STATE_MEMORY_SWEEP_INTERVAL)
+            try:
+                self._sweep()
+                if self.snapshot_path and time.monotonic() - last_snapshot >= STATE_SNAPSHOT_INTERVAL:
+                    await self.snapshot()
+                    last_snapshot = time.monotonic()
+            except Exception as e:
+                logger.error(f"Memory store maintenance error: {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.snapshot_path:
+            await self.snapshot()
+
+    aclose = close
+
+    async def ping(self) -> bool:
+        return True
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> MemoryPipeline:
+        return MemoryPipeline(self)
+
+    def pubsub(self) -> MemoryPubSub:
+        return MemoryPubSub(self)
+
+    # Key space
+
+    def _expired(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._data.pop(key, None)
+            del self._expires[key]
+            return True
+        return False
+
+    def _lookup(self, key: str, kind: type) -> Any:
+        if key not in self._data or self._expired(key):
+            return None
+        value = self._data[key]
+        if type(value) is not kind:
+            raise ResponseError(WRONGTYPE)
+        self._data.move_to_end(key)
+        return value
+
+    def _create(self, key: str, kind: type) -> Any:
+        value = self._lookup(key, kind)
+        if value is None:
+            value = kind()
+            self._store(key, value)
+        return value
+
+    def _store(self, key: str, value: Any, keep_ttl: bool = False):
+        if not keep_ttl:
+            self._expires.pop(key, None)
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_keys:
+            evicted, _ = self._data.popitem(last=False)
+            self._expires.pop(evicted, None)
+            metrics.increment("state_memory_evictions_total")
+
+    def _drop_if_empty(self, key: str, value: Any):
+        if not value:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    def _sweep(self):
+        now = time.time()
+        for key in [key for key, expires_at in self._expires.items() if expires_at <= now]:
+            self._data.pop(key, None)
+            del self._expires[key]
+
+    async def delete(self, *keys) -> int:
+        deleted = 0
+        for key in keys:
+            if key in self._data and not self._expired(key):
+                del self._data[key]
+                self._expires.pop(key, None)
+                deleted += 1
+        return deleted
+
+    async def exists(self, *keys) -> int:
+        return sum(1 for key in keys if key in self._data and not self._expired(key))
+
+    async def expire(self, key: str, time_seconds: int) -> bool:
+        if key not in self._data or self._expired(key):
+            return False
+        self._expires[key] = time.time() + int(time_seconds)
+        return True
+
+    async def ttl(self, key: str) -> int:
+        if key not in self._data or self._expired(key):
+            return -2
+        expires_at = self._expires.get(key)
+        return -1 if expires_at is None else max(0, round(expires_at - time.time()))
+
+    async def keys(self, pattern: str = "*") -> List[str]:
+        self._sweep()
+        return [key for key in self._data if fnmatch.fnmatchcase(key, pattern)]
+
+    # Strings
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._lookup(key, str)
+
+    async def mget(self, keys, *args) -> List[Optional[str]]:
+        values = []
+        for key in _list_or_args(keys, args):
+            value = self._data.get(key) if not self._expired(key) else None
+            values.append(value if type(value) is str else None)
+        return values
+
+    async def set(self, key: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        if nx and key in self._data and not self._expired(key):
+            return None
+        self._store(key, _encode(value))
+        if ex is not None:
+            self._expires[key] = time.time() + int(ex)
+        return True
+
+    async def setex(self, key: str, time_seconds: int, value: Any) -> bool:
+        return await self.set(key, value, ex=time_seconds)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        current = self._lookup(key, str)
+        try:
+            value = int(current or 0) + amount
+        except ValueError:
+            raise ResponseError("value is not an integer or out of range")
+        self._store(key, str(value), keep_ttl=True)
+        return value
+
+    # Lists (index 0 is the head)
+
+    async def lpush(self, key: str, *values) -> int:
+        items = self._create(key, deque)
+        for value in values:
+            items.appendleft(_encode(value))
+        return len(items)
+
+    async def rpush(self, key: str, *values) -> int:
+        items = self._create(key, deque)
+        items.extend(_encode(value) for value in values)
+        return len(items)
+
+    async def llen(self, key: str) -> int:
+        return len(self._lookup(key, deque) or ())
+
+    async def lrange(self, key: str, start: int, end: int) -> List[str]:
+        items = list(self._lookup(key, deque) or ())
+        end = len(items) if end == -1 else (end + 1 if end >= 0 else len(items) + end + 1)
+        return items[start if start >= 0 else max(0, len(items) + start):end]
+
+    async def ltrim(self, key: str, start: int, end: int) -> bool:
+        items = self._lookup(key, deque)
+        if items is not None:
+            kept = await self.lrange(key, start, end)
+            items.clear()
+            items.extend(kept)
+            self._drop_if_empty(key, items)
+        return True
+
+    async def lrem(self, key: str, count: int, value: Any) -> int:
+        items = self._lookup(key, deque)
+        if not items:
+            return 0
+        value = _encode(value)
+        ordered = list(items) if count >= 0 else list(reversed(items))
+        kept, removed = [], 0
+        for item in ordered:
+            if item == value and (count == 0 or removed < abs(count)):
+                removed += 1
+            else:
+                kept.append(item)
+        items.clear()
+        items.extend(kept if count >= 0 else reversed(kept))
+        self._drop_if_empty(key, items)
+        return removed
+
+    # Hashes
+
+    async def hset(self, name: str, key: Any = None, value: Any = None, mapping: Optional[dict] = None) -> int:
+        fields = dict(mapping or {})
+        if key is not None:
+            fields[key] = value
+        hash_ = self._create(name, dict)
+        added = sum(1 for field in fields if _encode(field) not in hash_)
+        hash_.update({_encode(field): _encode(value) for field, value in fields.items()})
+        return added
+
+    async def hgetall(self, name: str) -> Dict[str, str]:
+        return dict(self._lookup(name, dict) or {})
+
+    async def hdel(self, name: str, *keys) -> int:
+        hash_ = self._lookup(name, dict)
+        if not hash_:
+            return 0
+        deleted = sum(1 for key in keys if hash_.pop(_encode(key), None) is not None)
+        self._drop_if_empty(name, hash_)
+        return deleted
+
+    # Sets
+
+    async def sadd(self, name: str, *values) -> int:
+        members = self._create(name, set)
+        before = len(members)
+        members.update(_encode(value) for value in values)
+        return len(members) - before
+
+    async def srem(self, name: str, *values) -> int:
+        members = self._lookup(name, set)
+        if not members:
+            return 0
+        before = len(members)
+        members.difference_update(_encode(value) for value in values)
+        removed = before - len(members)
+        self._drop_if_empty(name, members)
+        return removed
+
+    async def scard(self, name: str) -> int:
+        return len(self._lookup(name, set) or ())
+
+    async def smembers(self, name: str) -> set:
+        return set(self._lookup(name, set) or ())
+
+    # Sorted sets (member -> score)
+
+    async def zadd(self, name: str, mapping: dict) -> int:
+        scores = self._create(name, _SortedSet)
+        added = sum(1 for member in mapping if _encode(member) not in scores)
+        scores.update({_encode(member): float(score) for member, score in mapping.items()})
+        return added
+
+    async def zrem(self, name: str, *values) -> int:
+        scores = self._lookup(name, _SortedSet)
+        if not scores:
+            return 0
+        removed = sum(1 for value in values if scores.pop(_encode(value), None) is not None)
+        self._drop_if_empty(name, scores)
+        return removed
+
+    async def zcard(self, name: str) -> int:
+        return len(self._lookup(name, _SortedSet) or ())
+
+    async def zcount(self, name: str, min: Any, max: Any) -> int:
+        low, high = _score_bound(min), _score_bound(max)
+        return sum(1 for score in (self._lookup(name, _SortedSet) or {}).values() if low <= score <= high)
+
+    async def zrangebyscore(self, name: str, min: Any, max: Any) -> List[str]:
+        low, high = _score_bound(min), _score_bound(max)
+        scores = self._lookup(name, _SortedSet) or {}
+        return [member for member, score in sorted(scores.items(), key=lambda item: (item[1], item[0]))
+                if low <= score <= high]
+
+    async def zremrangebyscore(self, name: str, min: Any, max: Any) -> int:
+        scores = self._lookup(name, _SortedSet)
+        if not scores:
+            return 0
+        low, high = _score_bound(min), _score_bound(max)
+        stale = [member for member, score in scores.items() if low <= score <= high]
+        for member in stale:
+            del scores[member]
+        self._drop_if_empty(name, scores)
+        return len(stale)
+
+    # Pub/sub
+
+    async def publish(self, channel: str, message: Any) -> int:
+        subscribers = self._subscribers.get(channel, set())
+        for subscriber in subscribers:
+            subscriber._queue.put_nowait({"type": "message", "channel": channel, "data": _encode(message)})
+        return len(subscribers)
+
+    # Snapshots
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = json_codec.loads(f.read())
+            now = time.time()
+            for key, kind, value, expires_at in snapshot["keys"]:
+                if expires_at is not None and expires_at <= now:
+                    continue
+                self._store(key, _SNAPSHOT_TYPES[kind][1](value))
+                if expires_at is not None:
+                    self._expires[key] = expires_at
+            logger.info(f"Loaded {len(self._data)} keys from {self.snapshot_path}")
+        except Exception as e:
+            logger.error(f"Error loading state snapshot {self.snapshot_path}: {e}")
+
+    async def snapshot(self):
+        """Write all live keys to the snapshot file (atomically replaced)"""
+        self._sweep()
+        keys = []
+        for key, value in self._data.items():
+            kind = next(name for name, (type_, _) in _SNAPSHOT_TYPES.items() if type(value) is type_)
+            dump = value if type(value) is str else (dict(value) if isinstance(value, dict) else list(value))
+            keys.append((key, kind, dump, self._expires.get(key)))
+        payload = json_codec.dumps({"keys": keys})
+        await asyncio.to_thread(self._write_snapshot, payload)
+
+    def _write_snapshot(self, payload):
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(payload.encode() if isinstance(payload, str) else payload)
+        os.replace(temp_path, self.snapshot_path)
+
+    def collect_metrics(self) -> dict:
+        return {"state_memory_keys": len(self._data), "state_memory_max_keys": self.max_keys}
+
+
+class _SortedSet(dict):
+    """Member -> score (a distinct type so WRONGTYPE checks tell it from a hash)"""
+
+
+# Snapshot type tag -> (stored type, constructor from the JSON value)
+_SNAPSHOT_TYPES = {
+    "string": (str, str),
+    "list": (deque, deque),
+    "zset": (_SortedSet, _SortedSet),
+    "hash": (dict, dict),
+    "set": (set, set),
+}
@@ -0,0 +1,127 @@
+"""
+In-process metrics registry (counters, gauges and histograms)
+Exported in Prometheus text format by the /metrics endpoint
+"""
+import bisect
+from typing import Callable, Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    """Turn a labels dict into a hashable, ordered key"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    """Render labels in Prometheus syntax"""
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets"""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+_counters: Dict[str, Dict[LabelKey, float]] = {}
+_gauges: Dict[str, Dict[LabelKey, float]] = {}
+_histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+_collectors: List[Callable[[], Dict[str, float]]] = []
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Increment a counter"""
+    series = _counters.setdefault(name, {})
+    key = _label_key(labels)
+    series[key] = series.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Set a gauge to an absolute value"""
+    _gauges.setdefault(name, {})[_label_key(labels)] = value
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels):
+    """Record an observation in a histogram"""
+    series = _histograms.setdefault(name, {})
+    key = _label_key(labels)
+    histogram = series.get(key)
+    if histogram is None:
+        histogram = series[key] = Histogram(buckets)
+    histogram.observe(value)
+
+
+def series(name: str, **labels) -> Tuple[str, LabelKey]:
+    """Key for a labelled gauge returned by a collector"""
+    return name, _label_key(labels)
+
+
+def register_collector(collector: Callable[[], Dict]):
+    """
+    Register a callable that returns gauge values at scrape time
+    Useful for values owned by another object (pool sizes, queue lengths).
+    Keys are metric names, or series(name, **labels) for labelled gauges.
+    """
+    _collectors.append(collector)
+
+
+def get_counter(name: str, **labels) -> float:
+    """Read the current value of a counter"""
+    return _counters.get(name, {}).get(_label_key(labels), 0)
+
+
+def render_prometheus() -> str:
+    """Render all metrics in Prometheus text exposition format"""
+    lines = []
+    for name, series in sorted(_counters.items()):
+        lines.append(f"# TYPE {name} counter")
+        for key, value in series.items():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+    gauges: Dict[str, Dict[LabelKey, float]] = {name: dict(series) for name, series in _gauges.items()}
+    for collector in _collectors:
+        try:
+            for name, value in collector().items():
+                name, key = name if isinstance(name, tuple) else (name, ())
+                gauges.setdefault(name, {})[key] = value
+        except Exception as e:
+            logger.error(f"Error collecting metrics: {e}")
+    for name, series in sorted(gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in series.items():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+    for name, series in sorted(_histograms.items()):
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in series.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(key)} {histogram.total}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,127 @@
+"""
+Inactivity reaper for abandoned pairs
+
+Ends pairs idle for PAIR_INACTIVITY_MINUTES or older than PAIR_EXPIRATION_HOURS.
+Idle pairs are found through idx_pairs_active_last_message and ended in
+batches by one UPDATE ... RETURNING; Redis state is cleared with pipelined
+deletes and both users are notified through a rate-limited sender.
+"""
+import asyncio
+from typing import List, Tuple
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+from bot.database import repository
+from bot.services.redis_client import get_redis
+from bot.services.pair_sessions import close_session, flush_pending_messages
+from bot.services import redis_keys
+from bot.services import metrics
+from config.constants import (
+    PAIR_INACTIVITY_MINUTES, PAIR_EXPIRATION_HOURS, PAIR_REAPER_INTERVAL,
+    PAIR_REAPER_BATCH, PAIR_REAPER_NOTIFY_RATE, PAIR_INACTIVE_MESSAGE, PAIR_EXPIRED_MESSAGE
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+REASON_INACTIVE = "inactive"
+REASON_EXPIRED = "expired"
+
+
+async def end_idle_pairs(batch_size: int = PAIR_REAPER_BATCH) -> List[Tuple[str, int, int, str]]:
+    """
+    End one batch of idle or expired pairs
+    Returns (pair_id, user_a, user_b, reason) for each pair ended by this call
+    """
+    rows = await repository.fetch(
+        "pairs.end_idle",
+        PAIR_INACTIVITY_MINUTES, PAIR_EXPIRATION_HOURS, batch_size, REASON_EXPIRED, REASON_INACTIVE
+    )
+    return [(str(row['pair_id']), row['user_a'], row['user_b'], row['reason']) for row in rows]
+
+
+async def clear_pair_state(pairs: List[Tuple[str, int, int, str]]):
+    """Drop Redis state and pair sessions for ended pairs in one round trip"""
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for pair_id, user_a, user_b, _ in pairs:
+            close_session(pair_id)
+            redis_keys.delete_pair_state(pipe, user_a, user_b, pair_id)
+            pipe.publish(redis_keys.SESSION_CLOSED_CHANNEL, pair_id)
+        await pipe.execute()
+
+
+class PairReaper:
+    """Periodically ends abandoned pairs and notifies their users"""
+
+    def __init__(self, bot: Bot, is_leader=lambda: True,
+                 interval: float = PAIR_REAPER_INTERVAL, notify_rate: float = PAIR_REAPER_NOTIFY_RATE):
+        self.bot = bot
+        self.is_leader = is_leader
+        self.interval = interval
+        self.notify_rate = notify_rate
+        self._notifications: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        metrics.register_collector(lambda: {"pair_reaper_notifications_queued": self._notifications.qsize()})
+
+    async def sweep(self) -> int:
+        """End all currently idle pairs; returns how many were ended"""
+        # Make sure last activity from this worker is persisted before judging idleness
+        await flush_pending_messages()
+        total = 0
+        while True:
+            pairs = await end_idle_pairs()
+            if not pairs:
+                break
+            await clear_pair_state(pairs)
+            for _, user_a, user_b, reason in pairs:
+                metrics.increment("pairs_reaped_total", reason=reason)
+                text = PAIR_EXPIRED_MESSAGE if reason == REASON_EXPIRED else PAIR_INACTIVE_MESSAGE
+                for user_id in {user_a, user_b}:
+                    self._notifications.put_nowait((user_id, text))
+            total += len(pairs)
+            if len(pairs) < PAIR_REAPER_BATCH:
+                break
+        if total:
+            logger.info(f"Reaped {total} inactive or expired pairs")
+        return total
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.is_leader():
+                continue
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Error reaping pairs: {e}")
+
+    async def _notify_loop(self):
+        """Send queued notifications at no more than notify_rate per second"""
+        delay = 1 / self.notify_rate
+        while True:
+            user_id, text = await self._notifications.get()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text)
+                metrics.increment("pair_reaper_notifications_total", result="sent")
+            except RetryAfter as e:
+                # Flood control: back off and retry this notification
+                self._notifications.put_nowait((user_id, text))
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramError as e:
+                # Blocked the bot, deleted account, etc.
+                logger.debug(f"Could not notify user {user_id}: {e}")
+                metrics.increment("pair_reaper_notifications_total", result="failed")
+            await asyncio.sleep(delay)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._sweep_loop()),
+                asyncio.create_task(self._notify_loop())
+            ]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
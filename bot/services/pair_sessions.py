@@ -0,0 +1,319 @@
+"""
+In-memory pair session actors for active chats
+
+One lightweight actor per active pair holds both user ids, display names,
+message counters, last activity and a small ring of recent messages. Jobs for
+a pair run sequentially through its mailbox. Message writes are persisted
+asynchronously in batches, off the relay path (write-behind).
+
+Sessions are opened by create_pair and closed by end_pair. Closing is broadcast
+over Redis pub/sub so every worker drops its copy; a worker that has no copy
+loads the session from Redis/Postgres on first use.
+
+Durability window: a relayed message is in Postgres within about
+PAIR_SESSION_FLUSH_INTERVAL seconds. A failed flush is put back at the head of
+the queue and retried, backing off up to PAIR_SESSION_FLUSH_MAX_BACKOFF
+seconds, for as long as the process runs, so a database outage only delays
+writes. Messages still queued when the process crashes are lost; on a clean
+shutdown the queue gets one last flush. Once a batch is
+committed it is also pushed onto a capped Redis list per pair (newest first,
+trimmed to the report excerpt size), so a report reads its excerpt in one
+LRANGE. The list expires with the pair's Redis state and is deleted when
+the pair ends.
+"""
+import asyncio
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from bot.database.connection import get_pool
+from bot.database import repository
+from bot.services.redis_client import get_redis
+from bot.services import redis_keys
+from bot.services.user_cache import get_user_profile
+from bot.services import metrics
+from bot.utils import json_codec
+from config.constants import (
+    PAIR_SESSION_RING_SIZE, PAIR_SESSION_FLUSH_INTERVAL, PAIR_SESSION_FLUSH_BATCH, PAIR_SESSION_FLUSH_MAX_BACKOFF,
+    REDIS_PAIR_TTL, REPORT_CONVERSATION_EXCERPT_SIZE
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PairSession:
+    """Actor for one active pair"""
+
+    __slots__ = (
+        "pair_id", "user_a", "user_b", "name_a", "name_b",
+        "messages_a", "messages_b", "started_at", "last_activity",
+        "recent", "_mailbox", "_drainer"
+    )
+
+    def __init__(self, pair_id: str, user_a: int, user_b: int,
+                 name_a: Optional[str] = None, name_b: Optional[str] = None):
+        self.pair_id = pair_id
+        self.user_a = user_a
+        self.user_b = user_b
+        self.name_a = name_a
+        self.name_b = name_b
+        self.messages_a = 0
+        self.messages_b = 0
+        self.started_at = time.time()
+        self.last_activity = self.started_at
+        self.recent = deque(maxlen=PAIR_SESSION_RING_SIZE)
+        self._mailbox = deque()
+        self._drainer = None
+
+    def partner_of(self, user_id: int) -> int:
+        return self.user_b if user_id == self.user_a else self.user_a
+
+    def display_name(self, user_id: int) -> Optional[str]:
+        return self.name_a if user_id == self.user_a else self.name_b
+
+    def record_message(self, from_id: int, content: str):
+        """Update counters, activity and the recent-message ring"""
+        now = time.time()
+        if from_id == self.user_a:
+            self.messages_a += 1
+        else:
+            self.messages_b += 1
+        self.last_activity = now
+        self.recent.append((from_id, content, now))
+
+    async def run(self, job: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a job in this pair's mailbox; jobs for the same pair never overlap"""
+        future = asyncio.get_running_loop().create_future()
+        self._mailbox.append((job, future))
+        if self._drainer is None:
+            self._drainer = asyncio.create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        try:
+            while self._mailbox:
+                job, future = self._mailbox.popleft()
+                try:
+                    result = await job()
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._drainer = None
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by this session"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.recent)
+        for entry in self.recent:
+            size += sys.getsizeof(entry) + sys.getsizeof(entry[1])
+        return size
+
+
+_sessions: Dict[str, PairSession] = {}
+_user_sessions: Dict[int, PairSession] = {}
+
+
+def open_session(pair_id: str, user_a: int, user_b: int,
+                 name_a: Optional[str] = None, name_b: Optional[str] = None) -> PairSession:
+    """Create the actor for a new pair"""
+    session = PairSession(pair_id, user_a, user_b, name_a, name_b)
+    _sessions[pair_id] = session
+    _user_sessions[user_a] = session
+    _user_sessions[user_b] = session
+    return session
+
+
+def close_session(pair_id: str) -> Optional[PairSession]:
+    """Tear down the actor for a pair (no-op if this worker has none)"""
+    session = _sessions.pop(pair_id, None)
+    if session:
+        for user_id in (session.user_a, session.user_b):
+            if _user_sessions.get(user_id) is session:
+                del _user_sessions[user_id]
+    return session
+
+
+def get_session(pair_id: str) -> Optional[PairSession]:
+    return _sessions.get(pair_id)
+
+
+async def get_user_session(user_id: int) -> Optional[PairSession]:
+    """
+    Get the session for a user's active pair
+    Served from memory; loaded from Redis/Postgres only on a miss
+    """
+    session = _user_sessions.get(user_id)
+    if session:
+        return session
+
+    from bot.services.matchmaking import get_user_pair
+    pair_id = await get_user_pair(user_id)
+    if not pair_id:
+        return None
+
+    pair_data = await repository.fetchrow("pairs.session", pair_id)
+    if not pair_data or not pair_data['is_active']:
+        return None
+    profile_a, profile_b = await asyncio.gather(
+        get_user_profile(pair_data['user_a']), get_user_profile(pair_data['user_b'])
+    )
+    return open_session(str(pair_id), pair_data['user_a'], pair_data['user_b'],
+                        profile_a.display_name if profile_a else None,
+                        profile_b.display_name if profile_b else None)
+
+
+async def run_invalidation_listener():
+    """Drop local sessions closed by other workers (runs for the process lifetime)"""
+    subscribed = False
+    while True:
+        try:
+            redis_client = await get_redis()
+            pubsub = redis_client.pubsub()
+            await pubsub.subscribe(redis_keys.SESSION_CLOSED_CHANNEL)
+            if subscribed:
+                # Sessions may have been closed while we were reconnecting; they reload on next use
+                _sessions.clear()
+                _user_sessions.clear()
+            subscribed = True
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    close_session(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Session invalidation listener error: {e}")
+            await asyncio.sleep(1)
+
+
+# Write-behind persistence: (pair_id, from_id, content, created_at)
+_pending_messages: List[Tuple[str, int, str, datetime]] = []
+_flush_task: Optional[asyncio.Task] = None
+# Early flushes in flight (referenced so they are not garbage collected)
+_flush_tasks: Set[asyncio.Task] = set()
+# Flushes failed in a row; sets the retry backoff
+_flush_failures = 0
+
+
+def persist_message(pair_id: str, from_id: int, content: str):
+    """Queue a message for batched, asynchronous persistence"""
+    global _flush_task
+    _pending_messages.append((pair_id, from_id, content, datetime.now(timezone.utc)))
+    if len(_pending_messages) >= PAIR_SESSION_FLUSH_BATCH and not _flush_failures:
+        task = asyncio.create_task(flush_pending_messages())
+        _flush_tasks.add(task)
+        task.add_done_callback(_flush_tasks.discard)
+    elif _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_later())
+
+
+async def _flush_later():
+    global _flush_task
+    try:
+        await asyncio.sleep(min(PAIR_SESSION_FLUSH_INTERVAL * 2 ** _flush_failures, PAIR_SESSION_FLUSH_MAX_BACKOFF))
+        await flush_pending_messages()
+    finally:
+        _flush_task = None
+    if _pending_messages:
+        # Queued during the flush, or put back after a failed one
+        _flush_task = asyncio.create_task(_flush_later())
+
+
+async def push_recent_messages(batch: List[Tuple[str, int, str, datetime]]):
+    """Append a batch to each pair's capped recent-message list in one round trip"""
+    by_pair: Dict[str, List[str]] = {}
+    for pair_id, from_id, content, created_at in batch:
+        by_pair.setdefault(pair_id, []).append(json_codec.dumps({
+            "from_id": from_id,
+            "content": content,
+            "created_at": created_at.isoformat()
+        }))
+    try:
+        redis_client = await get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for pair_id, entries in by_pair.items():
+                key = redis_keys.pair_messages(pair_id)
+                # Oldest first, so the newest message ends up at the head
+                pipe.lpush(key, *entries)
+                pipe.ltrim(key, 0, REPORT_CONVERSATION_EXCERPT_SIZE - 1)
+                pipe.expire(key, REDIS_PAIR_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Error pushing recent messages for {len(by_pair)} pairs: {e}")
+
+
+async def get_recent_messages(pair_id: str, limit: int = REPORT_CONVERSATION_EXCERPT_SIZE) -> List[dict]:
+    """A pair's most recent messages, newest first (empty if none are buffered)"""
+    redis_client = await get_redis()
+    entries = await redis_client.lrange(redis_keys.pair_messages(pair_id), 0, limit - 1)
+    return [json_codec.loads(entry) for entry in entries]
+
+
+async def flush_pending_messages(retry: bool = True):
+    """
+    Write queued messages, pair activity and sender counters in one transaction,
+    then push them onto the per-pair recent-message lists
+    A failed batch is queued again; with retry=False (shutdown) it is dropped.
+    """
+    global _flush_task, _flush_failures
+    if not _pending_messages:
+        return
+    batch = _pending_messages[:]
+    del _pending_messages[:]
+
+    last_activity: Dict[str, datetime] = {}
+    sent: Dict[int, int] = {}
+    for pair_id, from_id, _, created_at in batch:
+        last_activity[pair_id] = created_at
+        sent[from_id] = sent.get(from_id, 0) + 1
+
+    started = time.monotonic()
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await repository.executemany("messages.insert", batch, conn=conn)
+                # Sorted so concurrent flushes from other workers lock rows in the same order
+                await repository.executemany("pairs.touch", sorted(last_activity.items()), conn=conn)
+                await repository.executemany("user_counters.add_messages", sorted(sent.items()), conn=conn)
+        metrics.increment("pair_session_messages_persisted_total", len(batch))
+        metrics.observe("pair_session_flush_seconds", time.monotonic() - started)
+    except Exception as e:
+        metrics.increment("pair_session_persist_errors_total")
+        _flush_failures += 1
+        if not retry:
+            logger.error(f"Error persisting {len(batch)} messages on shutdown, they are lost: {e}")
+            metrics.increment("pair_session_messages_dropped_total", len(batch))
+            return
+        logger.warning(f"Error persisting {len(batch)} messages (attempt {_flush_failures}), will retry: {e}")
+        _pending_messages[:0] = batch
+        if _flush_task is None:
+            _flush_task = asyncio.create_task(_flush_later())
+        return
+    _flush_failures = 0
+    await push_recent_messages(batch)
+
+
+async def close_message_writer():
+    """Wait for flushes in flight, then write whatever is still queued (on shutdown)"""
+    if _flush_task is not None:
+        _flush_task.cancel()
+    if _flush_tasks:
+        await asyncio.gather(*_flush_tasks, return_exceptions=True)
+    await flush_pending_messages(retry=False)
+
+
+def get_session_stats() -> Dict:
+    """Live actor count and approximate memory use"""
+    return {
+        "pair_sessions_live": len(_sessions),
+        "pair_sessions_memory_bytes": sum(session.memory_bytes() for session in _sessions.values()),
+        "pair_sessions_pending_writes": len(_pending_messages)
+    }
+
+
+metrics.register_collector(get_session_stats)
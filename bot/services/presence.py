@@ -0,0 +1,84 @@
+"""
+Online presence
+
+Every processed update records its sender's last-seen time. Writes are
+batched per worker and flushed as one ZADD every PRESENCE_FLUSH_INTERVAL
+seconds. The waiting and chatting sets are maintained by the state helpers
+in redis_keys on each transition. Entries that have aged out of a set are
+pruned by the leader's periodic maintenance job. Each count is then one O(log n) ZCOUNT over its window,
+and the three are sent in one read-only pipeline.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+from bot.services.redis_client import get_redis
+from bot.services import redis_keys
+from config.constants import (
+    PRESENCE_ONLINE_MINUTES, PRESENCE_FLUSH_INTERVAL, PRESENCE_RETENTION_HOURS,
+    REDIS_WAITING_TTL, PAIR_EXPIRATION_HOURS
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# user_id -> last seen (unix time), not yet written to Redis
+_pending_seen: Dict[int, float] = {}
+_flush_task: Optional[asyncio.Task] = None
+
+
+def touch(user_id: int):
+    """Record that a user was just seen (written to Redis in the next batch)"""
+    global _flush_task
+    _pending_seen[user_id] = time.time()
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_later())
+
+
+async def _flush_later():
+    global _flush_task
+    try:
+        await asyncio.sleep(PRESENCE_FLUSH_INTERVAL)
+        await flush_presence()
+    finally:
+        _flush_task = None
+
+
+async def flush_presence():
+    """Write queued last-seen times in one ZADD"""
+    if not _pending_seen:
+        return
+    batch = dict(_pending_seen)
+    _pending_seen.clear()
+    try:
+        redis_client = await get_redis()
+        await redis_client.zadd(redis_keys.PRESENCE_LAST_SEEN_KEY, {str(user_id): seen for user_id, seen in batch.items()})
+    except Exception as e:
+        logger.error(f"Error flushing presence for {len(batch)} users: {e}")
+
+
+async def prune_presence():
+    """Drop entries that have aged out of each presence set (run periodically by the leader)"""
+    now = time.time()
+    try:
+        redis_client = await get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(redis_keys.PRESENCE_LAST_SEEN_KEY, "-inf", now - PRESENCE_RETENTION_HOURS * 3600)
+            # A waiting state lapses with its user_state key; pairs end within PAIR_EXPIRATION_HOURS
+            pipe.zremrangebyscore(redis_keys.PRESENCE_WAITING_KEY, "-inf", f"({now - REDIS_WAITING_TTL}")
+            pipe.zremrangebyscore(redis_keys.PRESENCE_CHATTING_KEY, "-inf", f"({now - PAIR_EXPIRATION_HOURS * 3600}")
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Error pruning presence: {e}")
+
+
+async def get_presence_counts(online_minutes: int = PRESENCE_ONLINE_MINUTES) -> Dict[str, int]:
+    """Users seen in the last online_minutes, waiting and chatting, in one round trip (read-only)"""
+    now = time.time()
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zcount(redis_keys.PRESENCE_LAST_SEEN_KEY, now - online_minutes * 60, "+inf")
+        # Same windows as prune_presence, so counts don't depend on when it last ran
+        pipe.zcount(redis_keys.PRESENCE_WAITING_KEY, now - REDIS_WAITING_TTL, "+inf")
+        pipe.zcount(redis_keys.PRESENCE_CHATTING_KEY, now - PAIR_EXPIRATION_HOURS * 3600, "+inf")
+        online, waiting, chatting = await pipe.execute()
+    return {"online": online, "waiting": waiting, "chatting": chatting}
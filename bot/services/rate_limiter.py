@@ -2,7 +2,8 @@
 Rate limiting service using Redis
 """
 from bot.services.redis_client import get_redis
-from config.constants import REDIS_RATE_LIMIT_PREFIX, MAX_MESSAGES_PER_MINUTE
+from bot.services import redis_keys
+from config.constants import MAX_MESSAGES_PER_MINUTE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,22 +16,16 @@ async def check_rate_limit(user_id: int, limit: int = MAX_MESSAGES_PER_MINUTE, w
     """
     try:
         redis_client = await get_redis()
-        key = f"{REDIS_RATE_LIMIT_PREFIX}:{user_id}"
+        key = redis_keys.rate_limit(user_id)
         
-        # Get current count
-        current = await redis_client.get(key)
-        if current is None:
-            # First request in window
-            await redis_client.setex(key, window_seconds, 1)
-            return True
+        # Start the window on the first request (SET NX keeps an existing TTL) and count
+        # this one, in one round trip
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(key, 0, ex=window_seconds, nx=True)
+            pipe.incr(key)
+            _, current_count = await pipe.execute()
         
-        current_count = int(current)
-        if current_count >= limit:
-            return False  # Rate limited
-        
-        # Increment count
-        await redis_client.incr(key)
-        return True
+        return current_count <= limit
     except Exception as e:
         logger.error(f"Error checking rate limit: {e}")
         return True  # Allow on error (fail open)
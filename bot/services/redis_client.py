@@ -1,21 +1,96 @@
 """
 Redis connection and utilities
+
+The client uses a blocking connection pool: when every connection of the
+worker's share is busy, a command waits up to REDIS_POOL_TIMEOUT for one
+instead of failing with "Too many connections". Idle connections are pinged
+before reuse once they have been idle for REDIS_HEALTH_CHECK_INTERVAL.
+
+Every command (and every pipeline, as one round trip) is timed into
+redis_command_seconds{command}; pool size and in-use connections are exported
+at scrape time.
+
+With STATE_BACKEND=memory, get_redis returns an in-process MemoryStore with the
+same API instead (single-node deployments, WEB_CONCURRENCY=1).
 """
+import os
+import time
 import redis.asyncio as redis
-from typing import Optional
-import json
-from config.settings import settings
+from redis.asyncio.client import Pipeline
+from typing import Optional, Union
+from bot.services import metrics
+from bot.services.memory_store import MemoryStore
+from config.settings import settings, per_worker_share
+from config.constants import REDIS_COMMAND_BUCKETS
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Global Redis client
-_redis_client: Optional[redis.Redis] = None
 
+def _record(command: str, started: float, failed: bool):
+    metrics.observe("redis_command_seconds", time.monotonic() - started, buckets=REDIS_COMMAND_BUCKETS, command=command)
+    if failed:
+        metrics.increment("redis_command_errors_total", command=command)
 
-async def get_redis() -> redis.Redis:
-    """Get or create Redis client"""
-    global _redis_client
+
+class InstrumentedPipeline(Pipeline):
+    """Pipeline timed as a single round trip"""
+
+    async def execute(self, raise_on_error: bool = True):
+        command = "multi" if self.is_transaction else "pipeline"
+        started = time.monotonic()
+        failed = True
+        try:
+            result = await super().execute(raise_on_error)
+            failed = False
+            return result
+        finally:
+            _record(command, started, failed)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client with per-command latency metrics"""
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).lower()
+        started = time.monotonic()
+        failed = True
+        try:
+            result = await super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            _record(command, started, failed)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# Per-process Redis client (recreated if the process forks after creating it)
+_redis_client: Optional[Union[redis.Redis, MemoryStore]] = None
+_redis_pid: Optional[int] = None
+
+
+def _create_memory_store() -> MemoryStore:
+    if settings.web_concurrency > 1:
+        error_msg = "❌ STATE_BACKEND=memory keeps state in one process and requires WEB_CONCURRENCY=1"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    store = MemoryStore(max_keys=settings.state_memory_max_keys, snapshot_path=settings.state_snapshot_path)
+    store.start()
+    logger.info("In-process state store created")
+    return store
+
+
+async def get_redis() -> Union[redis.Redis, MemoryStore]:
+    """Get or create Redis client (or the in-process store with STATE_BACKEND=memory)"""
+    global _redis_client, _redis_pid
+    if _redis_client is not None and _redis_pid != os.getpid():
+        # Inherited from the parent process: never share its sockets
+        _redis_client = None
+    if _redis_client is None and settings.state_backend == "memory":
+        _redis_client = _create_memory_store()
+        _redis_pid = os.getpid()
     if _redis_client is None:
         if not settings.redis_url:
             error_msg = (
@@ -31,12 +106,17 @@ async def get_redis() -> redis.Redis:
             logger.error(error_msg)
             raise ValueError(error_msg)
         
-        _redis_client = redis.from_url(
+        pool = redis.BlockingConnectionPool.from_url(
             settings.redis_url,
             decode_responses=True,
             socket_connect_timeout=5,
-            socket_keepalive=True
+            socket_keepalive=True,
+            health_check_interval=settings.redis_health_check_interval,
+            max_connections=per_worker_share(settings.redis_pool_budget),
+            timeout=settings.redis_pool_timeout or None
         )
+        _redis_client = InstrumentedRedis(connection_pool=pool)
+        _redis_pid = os.getpid()
         logger.info("Redis client created")
     return _redis_client
 
@@ -46,6 +126,29 @@ async def close_redis():
     global _redis_client
     if _redis_client:
         await _redis_client.close()
+        if isinstance(_redis_client, InstrumentedRedis):
+            # The client does not own a pool it was given
+            await _redis_client.connection_pool.disconnect()
         _redis_client = None
         logger.info("Redis connection closed")
 
+
+def get_redis_pool_metrics() -> dict:
+    """Size and in-use gauges for this process's Redis connection pool (or key counts of the memory store)"""
+    if _redis_client is None or _redis_pid != os.getpid():
+        return {}
+    if isinstance(_redis_client, MemoryStore):
+        return _redis_client.collect_metrics()
+    pool = _redis_client.connection_pool
+    in_use = len(getattr(pool, "_in_use_connections", ()))
+    idle = len(getattr(pool, "_available_connections", ()))
+    return {
+        "redis_pool_max": pool.max_connections,
+        "redis_pool_size": in_use + idle,
+        "redis_pool_in_use": in_use,
+        "redis_pool_idle": idle,
+    }
+
+
+metrics.register_collector(get_redis_pool_metrics)
+
@@ -0,0 +1,178 @@
+"""
+Redis key schema
+
+Every Redis key and pub/sub channel the bot uses is built here, next to the
+TTL it is written with, so the key layout can be read (and changed) in one
+place.
+
+Keys carry hash tags in preparation for Redis Cluster, but the bot still
+talks to a single Redis node (redis_client builds a plain client) and has not
+been run against a cluster. The part of a key in braces is its hash tag, and
+only the tag picks the slot. All of a user's keys are tagged with
+the user id, so per-user multi-key reads (the pending input MGET) stay on one
+slot. Each matchmaking queue is tagged with its gender/language bucket, so
+the queues spread across slots and a claim (LRANGE + LREM on one list) never
+leaves its slot. A host's routing keys share one tag because they are updated
+together, and so do the presence keys.
+
+    waiting:{gender:<g>:lang:<l>}  list    matchmaking queue (no TTL)
+    user_state:{<user>}            string  idle / waiting / chatting
+    user_pair:{<user>}             string  active pair id
+    pair_messages:{<pair>}         list    recent messages, newest first
+    user_profile:{<user>}          hash    cached profile
+    user_profile_version:{<user>}  string  bumped on every profile invalidation
+    rate_limit:{<user>}            string  messages in the current window
+    onboarding:{<user>}            string  onboarding state (JSON)
+    editing_<field>:{<user>}       string  settings prompt awaiting text input
+    admin_pending:{<user>}         string  admin action awaiting text input
+    {routing:<host>}:workers       hash    worker id -> socket path (one ring per host)
+    {routing:<host>}:heartbeat     zset    worker id -> last seen (unix time)
+    {presence}:last_seen           zset    user -> last update (unix time)
+    {presence}:waiting             zset    user -> joined a queue (unix time)
+    {presence}:chatting            zset    user -> joined a pair (unix time)
+
+The state helpers below keep the presence sets in step with user_state on
+every transition (waiting, chatting, idle, cleared).
+
+Not atomic: a pair touches two users, so pair create/end spans slots, and the
+pipeline helpers queue those writes without MULTI. Joining a queue (state,
+queue push, presence) is likewise several slots. Another worker can observe
+one user's keys updated before the other's. Postgres decides whether a pair
+exists (pairs.create / pairs.end are single statements); these keys are a
+cache of that decision and must not be used to make it.
+"""
+import time
+from typing import Iterator, Literal, Tuple, get_args
+from config.constants import (
+    GENDER_MAP, AVAILABLE_LANGUAGES,
+    REDIS_QUEUE_PREFIX, REDIS_USER_STATE_PREFIX, REDIS_USER_PAIR_PREFIX, REDIS_PAIR_MESSAGES_PREFIX,
+    REDIS_USER_PROFILE_PREFIX, REDIS_USER_PROFILE_VERSION_PREFIX, REDIS_RATE_LIMIT_PREFIX, REDIS_ONBOARDING_PREFIX, REDIS_ADMIN_PENDING_PREFIX,
+    REDIS_WAITING_TTL, REDIS_IDLE_TTL, REDIS_PAIR_TTL, USER_STATE_WAITING, USER_STATE_CHATTING, USER_STATE_IDLE
+)
+
+EditingField = Literal["profile_name", "profile_gender", "profile_age", "partner_pref"]
+
+# Singleton keys and channels
+LEADER_KEY = "leader:primary"
+SESSION_CLOSED_CHANNEL = "pair_sessions:closed"
+USER_INVALIDATED_CHANNEL = "user_cache:invalidate"
+PRESENCE_LAST_SEEN_KEY = "{presence}:last_seen"
+PRESENCE_WAITING_KEY = "{presence}:waiting"
+PRESENCE_CHATTING_KEY = "{presence}:chatting"
+
+
+def routing_workers(host: str) -> str:
+    return f"{{routing:{host}}}:workers"
+
+
+def routing_heartbeat(host: str) -> str:
+    return f"{{routing:{host}}}:heartbeat"
+
+
+def queue(gender: int, language: str) -> str:
+    return f"{REDIS_QUEUE_PREFIX}:{{gender:{gender}:lang:{language}}}"
+
+
+def all_queues() -> Iterator[Tuple[int, str, str]]:
+    """(gender, language, key) for every matchmaking queue"""
+    for gender in GENDER_MAP:
+        for language in AVAILABLE_LANGUAGES:
+            yield gender, language, queue(gender, language)
+
+
+def user_state(user_id: int) -> str:
+    return f"{REDIS_USER_STATE_PREFIX}:{{{user_id}}}"
+
+
+def user_pair(user_id: int) -> str:
+    return f"{REDIS_USER_PAIR_PREFIX}:{{{user_id}}}"
+
+
+def pair_messages(pair_id: str) -> str:
+    return f"{REDIS_PAIR_MESSAGES_PREFIX}:{{{pair_id}}}"
+
+
+def user_profile(user_id: int) -> str:
+    return f"{REDIS_USER_PROFILE_PREFIX}:{{{user_id}}}"
+
+
+def user_profile_version(user_id: int) -> str:
+    return f"{REDIS_USER_PROFILE_VERSION_PREFIX}:{{{user_id}}}"
+
+
+def rate_limit(user_id: int) -> str:
+    return f"{REDIS_RATE_LIMIT_PREFIX}:{{{user_id}}}"
+
+
+def onboarding(user_id: int) -> str:
+    return f"{REDIS_ONBOARDING_PREFIX}:{{{user_id}}}"
+
+
+def editing(field: EditingField, user_id: int) -> str:
+    return f"editing_{field}:{{{user_id}}}"
+
+
+def admin_pending(user_id: int) -> str:
+    return f"{REDIS_ADMIN_PENDING_PREFIX}:{{{user_id}}}"
+
+
+def user_keys(user_id: int) -> Tuple[str, ...]:
+    """Every key of one user (all in the user's slot)"""
+    return (
+        user_state(user_id), user_pair(user_id), user_profile(user_id), user_profile_version(user_id),
+        rate_limit(user_id),
+        onboarding(user_id), admin_pending(user_id),
+        *(editing(field, user_id) for field in get_args(EditingField)),
+    )
+
+
+def pending_input(user_id: int) -> Tuple[str, str, str, str]:
+    """Keys a plain text message is checked against before it is relayed (read with one MGET)"""
+    return (
+        onboarding(user_id),
+        editing("profile_name", user_id),
+        editing("profile_age", user_id),
+        admin_pending(user_id),
+    )
+
+
+def set_waiting(pipe, user_id: int, queue_key: str):
+    """Queue a user and mark them waiting"""
+    pipe.lpush(queue_key, str(user_id))
+    pipe.setex(user_state(user_id), REDIS_WAITING_TTL, USER_STATE_WAITING)
+    pipe.zadd(PRESENCE_WAITING_KEY, {str(user_id): time.time()})
+    pipe.zrem(PRESENCE_CHATTING_KEY, str(user_id))
+
+
+def clear_waiting(pipe, user_id: int):
+    """Drop a user from the waiting set (after leaving every queue)"""
+    pipe.zrem(PRESENCE_WAITING_KEY, str(user_id))
+
+
+def set_idle(pipe, user_id: int):
+    pipe.setex(user_state(user_id), REDIS_IDLE_TTL, USER_STATE_IDLE)
+    pipe.zrem(PRESENCE_WAITING_KEY, str(user_id))
+    pipe.zrem(PRESENCE_CHATTING_KEY, str(user_id))
+
+
+def set_pair_state(pipe, user_a: int, user_b: int, pair_id: str):
+    """Mark both users as chatting in pair_id"""
+    for user_id in (user_a, user_b):
+        pipe.setex(user_state(user_id), REDIS_PAIR_TTL, USER_STATE_CHATTING)
+        pipe.set(user_pair(user_id), pair_id, ex=REDIS_PAIR_TTL)
+    now = time.time()
+    pipe.zadd(PRESENCE_CHATTING_KEY, {str(user_a): now, str(user_b): now})
+    pipe.zrem(PRESENCE_WAITING_KEY, str(user_a), str(user_b))
+
+
+def delete_pair_state(pipe, user_a: int, user_b: int, pair_id: str):
+    """Drop both users' pair state and the pair's recent messages (one DEL per slot)"""
+    delete_user_state(pipe, user_a)
+    delete_user_state(pipe, user_b)
+    pipe.delete(pair_messages(pair_id))
+
+
+def delete_user_state(pipe, user_id: int):
+    pipe.delete(user_pair(user_id), user_state(user_id))
+    pipe.zrem(PRESENCE_WAITING_KEY, str(user_id))
+    pipe.zrem(PRESENCE_CHATTING_KEY, str(user_id))
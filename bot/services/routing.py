@@ -0,0 +1,235 @@
+"""
+Sticky routing of updates to worker processes
+
+Both members of a pair are routed to the same worker so pair state can live in
+process memory. The workers of one host form a consistent hash ring
+(membership kept in Redis under a per-host key, since the sockets are
+host-local); the routing key is the pair id once paired and the user id
+otherwise, so a new pair hands over to its owner shortly after it is created.
+Updates owned by another worker are forwarded to it over a per-worker Unix
+socket. User -> pair lookups are cached per worker for ROUTING_PAIR_CACHE_TTL
+seconds, so a relayed message usually costs no Redis round trip to route.
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import httpx
+import uvicorn
+from bot.services.redis_client import get_redis
+from bot.services import metrics
+from bot.services.redis_keys import routing_workers, routing_heartbeat, user_pair
+from bot.utils import json_codec
+from config.constants import ROUTING_PAIR_CACHE_SIZE, ROUTING_PAIR_CACHE_TTL
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: List[str] = (), replicas: int = 64):
+        self.replicas = replicas
+        self._hashes: List[int] = []
+        self._nodes: List[str] = []
+        self.set_nodes(nodes)
+
+    def set_nodes(self, nodes: List[str]):
+        points = sorted(
+            (_hash(f"{node}#{i}"), node)
+            for node in nodes
+            for i in range(self.replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def extract_user_id(data: dict) -> Optional[int]:
+    """Get the sender of a raw Telegram update"""
+    for field in ("message", "edited_message", "callback_query"):
+        payload = data.get(field)
+        if payload and payload.get("from"):
+            return payload["from"]["id"]
+    return None
+
+
+class _InternalServer(uvicorn.Server):
+    """Uvicorn server that leaves signal handling to the main server"""
+
+    def install_signal_handlers(self):
+        pass
+
+
+class StickyRouter:
+    """Routes updates to the worker that owns the sender's pair (or the sender)"""
+
+    def __init__(self, socket_dir: str, heartbeat_interval: float = 5.0, host: Optional[str] = None):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.host = host or socket.gethostname()
+        self.workers_key = routing_workers(self.host)
+        self.heartbeat_key = routing_heartbeat(self.host)
+        self.socket_path = os.path.join(socket_dir, f"krc-worker-{self.worker_id}.sock")
+        self.heartbeat_interval = heartbeat_interval
+        self.ring = ConsistentHashRing()
+        self._sockets: Dict[str, str] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._server: Optional[_InternalServer] = None
+        self._tasks: List[asyncio.Task] = []
+        # user_id -> (pair id or None, cached_at)
+        self._pairs: "OrderedDict[int, tuple]" = OrderedDict()
+        metrics.register_collector(lambda: {"routing_ring_workers": len(self._sockets)})
+
+    async def start(self, internal_app):
+        """Serve internal_app on this worker's socket and join the ring"""
+        self._server = _InternalServer(uvicorn.Config(
+            internal_app, uds=self.socket_path, lifespan="off", log_level="warning"
+        ))
+        self._tasks.append(asyncio.create_task(self._server.serve()))
+        await self._heartbeat()
+        self._tasks.append(asyncio.create_task(self._heartbeat_loop()))
+        logger.info(f"Worker {self.worker_id} joined routing ring at {self.socket_path}")
+
+    async def stop(self):
+        """Leave the ring and stop the internal server"""
+        try:
+            redis_client = await get_redis()
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.hdel(self.workers_key, self.worker_id)
+                pipe.zrem(self.heartbeat_key, self.worker_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error leaving routing ring: {e}")
+        if self._server:
+            self._server.should_exit = True
+        for task in self._tasks:
+            task.cancel()
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    async def _heartbeat(self):
+        """Refresh our membership and rebuild the ring from live workers"""
+        redis_client = await get_redis()
+        now = time.time()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(self.workers_key, self.worker_id, self.socket_path)
+            pipe.zadd(self.heartbeat_key, {self.worker_id: now})
+            pipe.zrangebyscore(self.heartbeat_key, now - self.heartbeat_interval * 3, "+inf")
+            pipe.hgetall(self.workers_key)
+            _, _, live, sockets = await pipe.execute()
+
+        members = {worker: sockets[worker] for worker in live if worker in sockets}
+        stale = [worker for worker in sockets if worker not in members]
+        if stale:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hdel(self.workers_key, *stale)
+                pipe.zrem(self.heartbeat_key, *stale)
+                await pipe.execute()
+        if members != self._sockets:
+            self._sockets = members
+            self.ring.set_nodes(sorted(members))
+            logger.info(f"Routing ring updated: {len(members)} workers")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                logger.error(f"Routing heartbeat error: {e}")
+
+    async def routing_key(self, data: dict) -> Optional[str]:
+        """Pair id once paired, user id otherwise"""
+        user_id = extract_user_id(data)
+        if user_id is None:
+            return None
+        pair_id = await self._pair_for(user_id)
+        return f"pair:{pair_id}" if pair_id else f"user:{user_id}"
+
+    async def _pair_for(self, user_id: int) -> Optional[str]:
+        """User's pair id, from the local cache while it is fresh"""
+        entry = self._pairs.get(user_id)
+        if entry and time.monotonic() - entry[1] < ROUTING_PAIR_CACHE_TTL:
+            return entry[0]
+        redis_client = await get_redis()
+        pair_id = await redis_client.get(user_pair(user_id))
+        self._pairs[user_id] = (pair_id, time.monotonic())
+        self._pairs.move_to_end(user_id)
+        while len(self._pairs) > ROUTING_PAIR_CACHE_SIZE:
+            self._pairs.popitem(last=False)
+        return pair_id
+
+    async def owner_for(self, data: dict) -> Optional[str]:
+        """
+        Worker that should process this update
+        Returns None if it should be processed locally
+        """
+        key = await self.routing_key(data)
+        if key is None:
+            return None
+        owner = self.ring.get_node(key)
+        if owner is None or owner == self.worker_id:
+            metrics.increment("routing_updates_total", destination="local")
+            return None
+        return owner
+
+    async def forward(self, owner: str, body: bytes) -> Optional[Tuple[int, dict]]:
+        """
+        Forward a raw update to its owner
+        Returns the owner's (status code, response body), or None if the update never
+        reached the owner and should be processed locally. Once the request may have
+        been sent (read timeout, dropped connection) the update counts as delivered:
+        processing it here too would duplicate messages and break per-pair ordering.
+        """
+        socket_path = self._sockets.get(owner)
+        if not socket_path:
+            return None
+        client = self._clients.get(socket_path)
+        if client is None:
+            client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=socket_path),
+                base_url="http://worker",
+                timeout=30
+            )
+            self._clients[socket_path] = client
+        try:
+            response = await client.post(
+                "/internal/update",
+                content=body,
+                headers={"content-type": "application/json"}
+            )
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            logger.warning(f"Worker {owner} unreachable, processing locally: {e}")
+            metrics.increment("routing_forward_errors_total", outcome="local")
+            return None
+        except httpx.TransportError as e:
+            logger.error(f"Update forwarded to worker {owner} without a response, not processing it again: {e}")
+            metrics.increment("routing_forward_errors_total", outcome="delivered")
+            return 200, {"status": "forwarded"}
+        metrics.increment("routing_updates_total", destination="forwarded")
+        try:
+            content = json_codec.loads(response.content)
+        except Exception as e:
+            logger.error(f"Worker {owner} returned a non-JSON response ({response.status_code}): {e}")
+            content = {"status": "forwarded"}
+        return response.status_code, content
@@ -2,7 +2,7 @@
 User statistics service
 """
 from typing import Dict
-from bot.database.connection import fetch_query, fetch_all
+from bot.database import repository
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,52 +11,15 @@ logger = logging.getLogger(__name__)
 async def get_user_stats(user_id: int) -> Dict:
     """Get comprehensive user statistics"""
     try:
-        # Get user data
-        user_data = await fetch_query(
-            """
-            SELECT 
-                id, username, display_name, created_at, last_active,
-                referrals_count, unlocked_features, is_banned
-            FROM users WHERE id = $1
-            """,
-            user_id
-        )
+        # User row and its counters: two primary-key lookups in one statement
+        user_data = await repository.fetchrow("users.stats_profile", user_id)
         
         if not user_data:
             return {}
         
-        # Count total pairs/chats
-        pairs_data = await fetch_query(
-            """
-            SELECT COUNT(*) as count 
-            FROM pairs 
-            WHERE user_a = $1 OR user_b = $1
-            """,
-            user_id
-        )
-        total_chats = pairs_data['count'] if pairs_data and 'count' in pairs_data else 0
-        
-        # Count active pairs
-        active_pairs_data = await fetch_query(
-            """
-            SELECT COUNT(*) as count 
-            FROM pairs 
-            WHERE (user_a = $1 OR user_b = $1) AND is_active = true
-            """,
-            user_id
-        )
-        active_chats = active_pairs_data['count'] if active_pairs_data and 'count' in active_pairs_data else 0
-        
-        # Count messages sent
-        messages_data = await fetch_query(
-            """
-            SELECT COUNT(*) as count 
-            FROM messages 
-            WHERE from_id = $1
-            """,
-            user_id
-        )
-        messages_sent = messages_data['count'] if messages_data and 'count' in messages_data else 0
+        total_chats = user_data['chats_total']
+        active_chats = user_data['chats_active']
+        messages_sent = user_data['messages_sent']
         
         # Get account age
         from datetime import datetime
@@ -104,33 +67,18 @@ async def get_user_stats(user_id: int) -> Dict:
 async def get_user_chat_count(user_id: int) -> int:
     """Count total pairs/chats for a user"""
     try:
-        pairs_data = await fetch_query(
-            """
-            SELECT COUNT(*) as count 
-            FROM pairs 
-            WHERE user_a = $1 OR user_b = $1
-            """,
-            user_id
-        )
-        return pairs_data['count'] if pairs_data else 0
+        counters = await repository.fetchrow("user_counters.get", user_id)
+        return counters['chats_total'] if counters else 0
     except Exception as e:
         logger.error(f"Error getting chat count: {e}")
         return 0
 
 
 async def get_user_message_count(user_id: int) -> int:
-    """Count messages sent by a user"""
+    """Count messages sent by a user (lifetime, not limited by message retention)"""
     try:
-        messages_data = await fetch_query(
-            """
-            SELECT COUNT(*) as count 
-            FROM messages 
-            WHERE from_id = $1
-            """,
-            user_id
-        )
-        return messages_data['count'] if messages_data else 0
+        counters = await repository.fetchrow("user_counters.get", user_id)
+        return counters['messages_sent'] if counters else 0
     except Exception as e:
         logger.error(f"Error getting message count: {e}")
         return 0
-
@@ -0,0 +1,232 @@
+"""
+Read-through user profile cache
+
+Profiles are served from a per-worker LRU, then a Redis hash, then Postgres.
+Every write to a cached column must call invalidate_user(); invalidations are
+broadcast over Redis pub/sub so all workers drop their local copy.
+
+A reader that loaded a row just before an invalidation must not cache it
+afterwards. invalidate_user() bumps a per-user version key; a cached hash
+records the version it was loaded under and is only served while that is
+still the current version. Workers likewise skip caching a profile locally if
+an invalidation arrived while it was being loaded.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from bot.database import repository
+from bot.services.redis_client import get_redis
+from bot.services import metrics
+from bot.services.redis_keys import USER_INVALIDATED_CHANNEL, user_profile, user_profile_version
+from bot.utils import json_codec
+from config.constants import USER_CACHE_SIZE, USER_CACHE_LOCAL_TTL, USER_CACHE_REDIS_TTL, USER_CACHE_VERSION_TTL
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UserProfile:
+    """Cached subset of a users row"""
+
+    __slots__ = (
+        "id", "username", "display_name", "gender", "gender_preference",
+        "language_preference", "age_range", "is_banned", "referrals_count",
+        "unlocked_features"
+    )
+
+    def __init__(self, id: int, username: Optional[str] = None, display_name: Optional[str] = None,
+                 gender: int = 0, gender_preference: int = 0, language_preference: str = "any",
+                 age_range: Optional[str] = None, is_banned: bool = False, referrals_count: int = 0,
+                 unlocked_features: Optional[Dict] = None):
+        self.id = id
+        self.username = username
+        self.display_name = display_name
+        self.gender = gender
+        self.gender_preference = gender_preference
+        self.language_preference = language_preference
+        self.age_range = age_range
+        self.is_banned = is_banned
+        self.referrals_count = referrals_count
+        self.unlocked_features = unlocked_features or {}
+
+    # Row-style access so code written against asyncpg records keeps working
+    def __getitem__(self, key: str) -> Any:
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    @classmethod
+    def from_row(cls, row) -> "UserProfile":
+        return cls(
+            id=row['id'],
+            username=row['username'],
+            display_name=row['display_name'],
+            gender=row['gender'] or 0,
+            gender_preference=row['gender_preference'] or 0,
+            language_preference=row['language_preference'] or "any",
+            age_range=row['age_range'],
+            is_banned=bool(row['is_banned']),
+            referrals_count=row['referrals_count'] or 0,
+            unlocked_features=row['unlocked_features']
+        )
+
+    def to_hash(self) -> Dict[str, str]:
+        """Encode for a Redis hash (None fields are omitted)"""
+        fields = {
+            "id": str(self.id),
+            "gender": str(self.gender),
+            "gender_preference": str(self.gender_preference),
+            "language_preference": self.language_preference,
+            "is_banned": "1" if self.is_banned else "0",
+            "referrals_count": str(self.referrals_count),
+            "unlocked_features": json_codec.dumps(self.unlocked_features)
+        }
+        for field in ("username", "display_name", "age_range"):
+            value = getattr(self, field)
+            if value is not None:
+                fields[field] = value
+        return fields
+
+    @classmethod
+    def from_hash(cls, fields: Dict[str, str]) -> "UserProfile":
+        return cls(
+            id=int(fields["id"]),
+            username=fields.get("username"),
+            display_name=fields.get("display_name"),
+            gender=int(fields.get("gender", 0)),
+            gender_preference=int(fields.get("gender_preference", 0)),
+            language_preference=fields.get("language_preference", "any"),
+            age_range=fields.get("age_range"),
+            is_banned=fields.get("is_banned") == "1",
+            referrals_count=int(fields.get("referrals_count", 0)),
+            unlocked_features=json_codec.loads(fields.get("unlocked_features", "{}"))
+        )
+
+
+# user_id -> (profile, cached_at)
+_local: "OrderedDict[int, tuple]" = OrderedDict()
+# Bumped on every invalidation seen by this worker
+_generation = 0
+
+
+def _remember(profile: UserProfile, generation: int):
+    if generation != _generation:
+        # Invalidated while we were loading it: serve it once, don't keep it
+        return
+    _local[profile.id] = (profile, time.monotonic())
+    _local.move_to_end(profile.id)
+    while len(_local) > USER_CACHE_SIZE:
+        _local.popitem(last=False)
+
+
+async def get_user_profile(user_id: int) -> Optional[UserProfile]:
+    """Get a user's profile, or None if the user isn't registered"""
+    entry = _local.get(user_id)
+    if entry and time.monotonic() - entry[1] < USER_CACHE_LOCAL_TTL:
+        _local.move_to_end(user_id)
+        metrics.increment("user_cache_lookups_total", source="local")
+        return entry[0]
+
+    generation = _generation
+    redis_client = await get_redis()
+    try:
+        # Same slot: one round trip
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(user_profile(user_id))
+            pipe.get(user_profile_version(user_id))
+            fields, version = await pipe.execute()
+        version = version or "0"
+    except Exception as e:
+        logger.error(f"Error reading cached profile for {user_id}: {e}")
+        fields, version = None, None
+    if fields and fields.get("version") == version:
+        profile = UserProfile.from_hash(fields)
+        _remember(profile, generation)
+        metrics.increment("user_cache_lookups_total", source="redis")
+        return profile
+
+    row = await repository.fetchrow("users.cache_profile", user_id)
+    if not row:
+        # Not cached: the user may be registering right now
+        metrics.increment("user_cache_lookups_total", source="missing")
+        return None
+    profile = UserProfile.from_row(row)
+    _remember(profile, generation)
+    metrics.increment("user_cache_lookups_total", source="database")
+    if version is None:
+        # Version unknown (Redis error): caching could outlive an invalidation
+        return profile
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(user_profile(user_id))
+            pipe.hset(user_profile(user_id), mapping={**profile.to_hash(), "version": version})
+            pipe.expire(user_profile(user_id), USER_CACHE_REDIS_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Error caching profile for {user_id}: {e}")
+    return profile
+
+
+async def user_exists(user_id: int) -> bool:
+    """Check whether a user is registered"""
+    return await get_user_profile(user_id) is not None
+
+
+async def invalidate_user(user_id: int):
+    """Drop a user's cached profile everywhere; call after every UPDATE users"""
+    global _generation
+    _generation += 1
+    _local.pop(user_id, None)
+    try:
+        redis_client = await get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            # A hash cached under an older version is never served again
+            pipe.incr(user_profile_version(user_id))
+            pipe.expire(user_profile_version(user_id), USER_CACHE_VERSION_TTL)
+            pipe.delete(user_profile(user_id))
+            pipe.publish(USER_INVALIDATED_CHANNEL, str(user_id))
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Error invalidating profile for {user_id}: {e}")
+
+
+async def run_invalidation_listener():
+    """Drop local profiles invalidated by other workers (runs for the process lifetime)"""
+    global _generation
+    while True:
+        try:
+            redis_client = await get_redis()
+            pubsub = redis_client.pubsub()
+            await pubsub.subscribe(USER_INVALIDATED_CHANNEL)
+            # Invalidations may have been missed while we were not listening
+            _generation += 1
+            _local.clear()
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _generation += 1
+                    _local.pop(int(message["data"]), None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"User cache invalidation listener error: {e}")
+            await asyncio.sleep(1)
+
+
+def get_cache_stats() -> Dict:
+    """Cache size and hit ratios"""
+    local = metrics.get_counter("user_cache_lookups_total", source="local")
+    redis_hits = metrics.get_counter("user_cache_lookups_total", source="redis")
+    database = metrics.get_counter("user_cache_lookups_total", source="database")
+    missing = metrics.get_counter("user_cache_lookups_total", source="missing")
+    total = local + redis_hits + database + missing
+    return {
+        "user_cache_local_entries": len(_local),
+        "user_cache_local_hit_ratio": local / total if total else 0,
+        "user_cache_hit_ratio": (local + redis_hits) / total if total else 0
+    }
+
+
+metrics.register_collector(get_cache_stats)
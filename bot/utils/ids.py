@@ -0,0 +1,43 @@
+"""
+Time-ordered UUIDs (version 7, RFC 9562) for primary keys
+
+The first 48 bits are the Unix time in milliseconds, so new ids sort after
+older ones and B-tree inserts land on the rightmost index pages instead of
+random ones. The 12 bits after the version are a counter within the
+millisecond, so ids from one process stay strictly increasing. The remaining
+62 bits are random. The result is an ordinary UUID for the existing columns.
+"""
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """Generate a UUIDv7 that sorts after every id this process generated before"""
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # Start low in the range so a busy millisecond has room to count up
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x1FF
+        else:
+            # Same millisecond (or the clock stepped back): keep counting
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+            ms = _last_ms
+        counter = _counter
+
+    value = (ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= int.from_bytes(os.urandom(8), "big") & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=value)
@@ -0,0 +1,54 @@
+"""
+Fast JSON codec shared by the webhook, asyncpg json/jsonb columns and Redis values
+"""
+from typing import Any
+import orjson
+
+# JSONB binary wire format is the JSON text prefixed with a version byte
+_JSONB_VERSION = b"\x01"
+
+_DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def loads(data) -> Any:
+    """Parse JSON from str, bytes or memoryview"""
+    return orjson.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to a JSON string"""
+    return orjson.dumps(obj, option=_DUMPS_OPTIONS).decode()
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize to JSON bytes (no str round trip)"""
+    return orjson.dumps(obj, option=_DUMPS_OPTIONS)
+
+
+def _encode_jsonb(obj: Any) -> bytes:
+    return _JSONB_VERSION + orjson.dumps(obj, option=_DUMPS_OPTIONS)
+
+
+def _decode_jsonb(data: bytes) -> Any:
+    return orjson.loads(data[1:])
+
+
+async def register_json_codecs(conn):
+    """
+    Register binary json/jsonb codecs on an asyncpg connection
+    Values are decoded to Python objects once, so callers never see raw JSON strings
+    """
+    await conn.set_type_codec(
+        "json",
+        encoder=dumps_bytes,
+        decoder=loads,
+        schema="pg_catalog",
+        format="binary"
+    )
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_encode_jsonb,
+        decoder=_decode_jsonb,
+        schema="pg_catalog",
+        format="binary"
+    )
@@ -37,6 +37,11 @@ MAX_DISPLAY_NAME_LENGTH = 32
 MAX_MESSAGES_PER_MINUTE = 10
 PAIR_INACTIVITY_MINUTES = 5  # Auto-disconnect after 5 min inactivity
 PAIR_EXPIRATION_HOURS = 24  # Cleanup pairs older than 24h
+PAIR_REAPER_INTERVAL = 60  # Seconds between inactive pair sweeps
+PAIR_REAPER_BATCH = 500  # Pairs ended per UPDATE
+PAIR_REAPER_NOTIFY_RATE = 20  # Notifications sent per second (Telegram allows ~30)
+PAIR_INACTIVE_MESSAGE = "⌛ Your chat was ended due to inactivity. Use /next to find someone new."
+PAIR_EXPIRED_MESSAGE = "⌛ Your chat has reached its time limit and was ended. Use /next to find someone new."
 
 # Referral system
 REFERRAL_UNLOCK_THRESHOLD = 5  # Number of referrals needed to unlock features
@@ -49,11 +54,73 @@ ADMIN_SESSION_DURATION_HOURS = 2
 
 # Moderation
 MESSAGE_RETENTION_DAYS = 7
+MESSAGE_PARTITION_DAYS_AHEAD = 3  # Daily messages partitions created ahead of time
+MESSAGE_PARTITION_MAINTENANCE_INTERVAL = 3600  # Seconds between partition maintenance runs
 PROFANITY_WARNING_THRESHOLD = 3  # Temp ban after 3 violations
 REPORT_CONVERSATION_EXCERPT_SIZE = 20  # Last N messages to include in report
 
-# Redis queue keys
+# Pair session actors
+PAIR_SESSION_RING_SIZE = 20  # Recent messages kept in memory per pair
+PAIR_SESSION_FLUSH_INTERVAL = 0.5  # Seconds between write-behind flushes; messages queued this long are lost on a crash
+PAIR_SESSION_FLUSH_BATCH = 200  # Flush early once this many messages are queued
+PAIR_SESSION_FLUSH_MAX_BACKOFF = 30  # Longest wait between retries of a failed flush (kept until shutdown)
+
+# Sticky routing
+ROUTING_PAIR_CACHE_SIZE = 10000  # User -> pair lookups kept in each worker
+ROUTING_PAIR_CACHE_TTL = 5  # Seconds a worker trusts a cached lookup
+
+# Presence
+PRESENCE_ONLINE_MINUTES = 5  # "Online" means an update within this many minutes
+PRESENCE_FLUSH_INTERVAL = 5  # Seconds between batched last-seen writes
+PRESENCE_RETENTION_HOURS = 24  # Last-seen entries older than this are pruned
+
+# User profile cache
+USER_CACHE_SIZE = 10000  # Profiles kept in each worker's LRU
+USER_CACHE_LOCAL_TTL = 30  # Seconds a worker trusts its own copy
+USER_CACHE_REDIS_TTL = 600  # Seconds a profile hash lives in Redis
+USER_CACHE_VERSION_TTL = 1200  # Seconds a profile version lives; must outlast USER_CACHE_REDIS_TTL
+
+# Database pool instrumentation and adaptive sizing
+DATABASE_POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DATABASE_POOL_ADAPT_INTERVAL = 10  # Seconds of acquire waits each sizing decision looks at
+DATABASE_POOL_GROW_WAIT = 0.02  # Grow the limit while the mean acquire wait is above this (seconds)
+DATABASE_POOL_SHRINK_WAIT = 0.001  # Shrink it while the mean wait is below this and the pool has headroom
+
+# Database schema
+SCHEMA_VERSION = "010_unique_active_member"  # Latest Alembic revision; bump with every migration
+PRE_VERSIONING_SCHEMA_VERSION = "002_add_gender_preference"  # What init_db created before it stamped a version
+
+# Read replica
+DATABASE_REPLICA_CHECK_INTERVAL = 5  # Seconds between replica health/lag checks
+DATABASE_REPLICA_CHECK_TIMEOUT = 2  # Seconds before a health check counts as failed
+
+# Webhook admission control
+HIGH_PRIORITY_COMMANDS = {"/stop"}  # Commands served ahead of menu navigation
+HIGH_PRIORITY_CALLBACKS = {"stop_chat"}
+WEBHOOK_BUSY_MESSAGE = "⏳ We're very busy right now. Please try again in a moment."
+
+# Redis key prefixes (keys are built by bot/services/redis_keys.py)
 REDIS_QUEUE_PREFIX = "waiting"
 REDIS_USER_STATE_PREFIX = "user_state"
+REDIS_USER_PAIR_PREFIX = "user_pair"
 REDIS_RATE_LIMIT_PREFIX = "rate_limit"
+REDIS_USER_PROFILE_PREFIX = "user_profile"
+REDIS_USER_PROFILE_VERSION_PREFIX = "user_profile_version"
+REDIS_PAIR_MESSAGES_PREFIX = "pair_messages"
+REDIS_ONBOARDING_PREFIX = "onboarding"
+REDIS_ADMIN_PENDING_PREFIX = "admin_pending"
+
+# Redis key TTLs (seconds)
+REDIS_WAITING_TTL = 300  # user_state while queued
+REDIS_IDLE_TTL = 300  # user_state after onboarding
+REDIS_PAIR_TTL = 3600  # user_state/user_pair while chatting, and the pair's recent messages
+REDIS_PROMPT_TTL = 300  # editing_* and admin_pending prompts awaiting text input
+REDIS_ONBOARDING_TTL = 3600
+
+# Redis client
+REDIS_COMMAND_BUCKETS = (0.0002, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
 
+# In-process state backend (STATE_BACKEND=memory)
+STATE_MEMORY_SWEEP_INTERVAL = 10  # Seconds between sweeps of expired keys
+STATE_SNAPSHOT_INTERVAL = 60  # Seconds between snapshots to STATE_SNAPSHOT_PATH
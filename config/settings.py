@@ -39,11 +39,61 @@ class Settings(BaseSettings):
     # Webhook URL (set in Railway dashboard)
     webhook_url: Optional[str] = None
     
+    # Webhook admission control (concurrent updates, queue length, queue wait in seconds)
+    webhook_max_concurrency: int = 20
+    webhook_max_queue: int = 50
+    webhook_queue_timeout: float = 2.0
+    
+    # Multi-process deployment (WEB_CONCURRENCY worker processes share the connection budgets)
+    web_concurrency: int = 1
+    database_pool_budget: int = 10
+    redis_pool_budget: int = 50
+    
+    # Redis client tuning (seconds; a command waits up to the pool timeout for a free connection)
+    redis_pool_timeout: float = 5.0
+    redis_health_check_interval: int = 30
+    
+    # State backend: "redis", or "memory" for a single-process deployment without Redis
+    state_backend: str = "redis"
+    state_memory_max_keys: int = 100000
+    state_snapshot_path: Optional[str] = None
+    
+    # Database pool tuning (per worker; min size defaults to half the worker's share)
+    database_pool_min_size: Optional[int] = None
+    database_pool_acquire_timeout: float = 10.0
+    database_command_timeout: float = 60.0
+    database_statement_cache_size: int = 100
+    database_max_inactive_lifetime: float = 300.0
+    # Adaptive mode: cap checkouts between min size and the worker's share based on acquire wait
+    database_pool_adaptive: bool = False
+    leader_lock_ttl: int = 30
+    
+    # Skip the startup schema version check (the schema is managed by migrations at deploy time)
+    skip_schema_check: bool = False
+    
+    # Optional read replica for staleness-tolerant reads (stats, admin views, report excerpts)
+    database_replica_url: Optional[str] = None
+    database_replica_pool_budget: int = 10
+    database_replica_max_lag: float = 10.0
+    
+    # Sticky routing: forward updates so both members of a pair land on the same worker
+    sticky_routing: bool = False
+    routing_socket_dir: str = "/tmp"
+    
+    # Admin statistics: take table totals from the planner's estimate (pg_class.reltuples)
+    admin_stats_estimates: bool = False
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
 
 
+def per_worker_share(budget: int, minimum: int = 1) -> int:
+    """Split a total connection budget evenly across worker processes"""
+    workers = max(1, settings.web_concurrency)
+    return max(minimum, budget // workers)
+
+
 # Global settings instance
 _bot_token = os.getenv("BOT_TOKEN", "").strip()
 _admin_secret = os.getenv("ADMIN_SECRET", "").strip()
@@ -4,16 +4,54 @@ Run this script to create all required tables
 """
 import asyncio
 import sys
+from datetime import timedelta
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 from bot.database.connection import get_pool, close_pool
+from bot.database.partitions import DEFAULT_PARTITION, create_message_partitions, utc_today
+from config.constants import MESSAGE_RETENTION_DAYS, MESSAGE_PARTITION_DAYS_AHEAD, SCHEMA_VERSION
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Secondary indexes for the pairs, messages and reports access paths
+ACCESS_PATH_INDEXES = [
+    # Active pair lookup by member (get_user_pair, get_user_pair_info)
+    "idx_pairs_user_a_active ON pairs(user_a, started_at DESC) WHERE is_active",
+    "idx_pairs_user_b_active ON pairs(user_b, started_at DESC) WHERE is_active",
+    # All pairs by member (get_user_stats, get_user_chat_count)
+    "idx_pairs_user_a ON pairs(user_a)",
+    "idx_pairs_user_b ON pairs(user_b)",
+    # Active pairs by last activity (admin stats, inactivity checks)
+    "idx_pairs_active_last_message ON pairs(last_message_at) WHERE is_active",
+    # Messages sent by a user (get_user_stats, get_user_message_count)
+    "idx_messages_from_id ON messages(from_id)",
+    # Latest messages of a pair (report excerpts)
+    "idx_messages_pair_created ON messages(pair_id, created_at DESC)",
+    # Pending reports (admin stats)
+    "idx_reports_pending ON reports(created_at) WHERE status = 'pending'",
+]
+
+# Tables with trigger-maintained global counters (same as migrations 008/009):
+# (table, total counter, subset counter, subset predicate, trigger events).
+# users and pairs have no UPDATE trigger: users.set_banned, pairs.end and
+# pairs.end_idle update users_banned / pairs_active themselves.
+COUNTED_TABLES = [
+    ("users", "users_total", "users_banned", "is_banned", ("INSERT", "DELETE")),
+    ("pairs", "pairs_total", "pairs_active", "is_active", ("INSERT", "DELETE")),
+    ("reports", "reports_total", "reports_pending", "status = 'pending'", ("INSERT", "UPDATE", "DELETE")),
+]
+
+# Transition tables each trigger event exposes to count_global_rows()
+COUNTER_TRIGGER_TRANSITIONS = {
+    "INSERT": "NEW TABLE AS new_rows",
+    "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "OLD TABLE AS old_rows",
+}
+
 
 async def init_database(close_pool_after: bool = True):
     """
@@ -27,112 +65,7 @@ async def init_database(close_pool_after: bool = True):
     
     try:
         async with pool.acquire() as conn:
-            logger.info("Creating database tables...")
-            
-            # UUID type is built-in in PostgreSQL, no extension needed
-            
-            # Create users table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id BIGINT PRIMARY KEY,
-                    username TEXT,
-                    display_name TEXT,
-                    gender SMALLINT DEFAULT 0,
-                    gender_preference SMALLINT DEFAULT 0,
-                    language_preference TEXT DEFAULT 'any',
-                    age_range TEXT,
-                    created_at TIMESTAMPTZ DEFAULT NOW(),
-                    last_active TIMESTAMPTZ DEFAULT NOW(),
-                    is_banned BOOLEAN DEFAULT false,
-                    is_admin BOOLEAN DEFAULT false,
-                    admin_session_expiry TIMESTAMPTZ,
-                    referral_by TEXT,
-                    referrals_count INT DEFAULT 0,
-                    unlocked_features JSONB DEFAULT '{}',
-                    blocked_users JSONB DEFAULT '[]'
-                )
-            """)
-            logger.info("Created users table")
-            
-            # Add gender_preference column if it doesn't exist (for existing databases)
-            await conn.execute("""
-                ALTER TABLE users ADD COLUMN IF NOT EXISTS gender_preference SMALLINT DEFAULT 0
-            """)
-            logger.info("Added gender_preference column if needed")
-            
-            # Create pairs table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS pairs (
-                    pair_id UUID PRIMARY KEY,
-                    user_a BIGINT REFERENCES users(id),
-                    user_b BIGINT REFERENCES users(id),
-                    started_at TIMESTAMPTZ DEFAULT NOW(),
-                    last_message_at TIMESTAMPTZ DEFAULT NOW(),
-                    is_active BOOLEAN DEFAULT true,
-                    language_used TEXT
-                )
-            """)
-            logger.info("Created pairs table")
-            
-            # Create referrals table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS referrals (
-                    id SERIAL PRIMARY KEY,
-                    referrer_id BIGINT REFERENCES users(id),
-                    referree_id BIGINT REFERENCES users(id),
-                    created_at TIMESTAMPTZ DEFAULT NOW(),
-                    UNIQUE(referrer_id, referree_id)
-                )
-            """)
-            logger.info("Created referrals table")
-            
-            # Create admin_logs table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS admin_logs (
-                    id SERIAL PRIMARY KEY,
-                    admin_id BIGINT REFERENCES users(id),
-                    action TEXT NOT NULL,
-                    metadata JSONB DEFAULT '{}',
-                    created_at TIMESTAMPTZ DEFAULT NOW()
-                )
-            """)
-            logger.info("Created admin_logs table")
-            
-            # Create messages table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id BIGSERIAL PRIMARY KEY,
-                    pair_id UUID REFERENCES pairs(pair_id),
-                    from_id BIGINT NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMPTZ DEFAULT NOW()
-                )
-            """)
-            logger.info("Created messages table")
-            
-            # Create index on messages.created_at
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at)
-            """)
-            logger.info("Created index on messages.created_at")
-            
-            # Create reports table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS reports (
-                    id SERIAL PRIMARY KEY,
-                    pair_id UUID REFERENCES pairs(pair_id),
-                    reported_by BIGINT REFERENCES users(id),
-                    reported_user BIGINT REFERENCES users(id),
-                    reason TEXT,
-                    conversation_excerpt JSONB DEFAULT '[]',
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMPTZ DEFAULT NOW()
-                )
-            """)
-            logger.info("Created reports table")
-            
-            logger.info("✅ Database initialization complete!")
-            
+            await create_schema(conn)
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
         raise
@@ -141,6 +74,259 @@ async def init_database(close_pool_after: bool = True):
             await close_pool()
 
 
+async def create_schema(conn):
+    """Create all tables and indexes on the given connection"""
+    logger.info("Creating database tables...")
+    
+    # UUID type is built-in in PostgreSQL, no extension needed
+    
+    # Create users table
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,
+            username TEXT,
+            display_name TEXT,
+            gender SMALLINT DEFAULT 0,
+            gender_preference SMALLINT DEFAULT 0,
+            language_preference TEXT DEFAULT 'any',
+            age_range TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            last_active TIMESTAMPTZ DEFAULT NOW(),
+            is_banned BOOLEAN DEFAULT false,
+            is_admin BOOLEAN DEFAULT false,
+            admin_session_expiry TIMESTAMPTZ,
+            referral_by TEXT,
+            referrals_count INT DEFAULT 0,
+            unlocked_features JSONB DEFAULT '{}',
+            blocked_users JSONB DEFAULT '[]'
+        )
+    """)
+    logger.info("Created users table")
+    
+    # Add gender_preference column if it doesn't exist (for existing databases)
+    await conn.execute("""
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS gender_preference SMALLINT DEFAULT 0
+    """)
+    logger.info("Added gender_preference column if needed")
+    
+    # Create pairs table
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS pairs (
+            pair_id UUID PRIMARY KEY,
+            user_a BIGINT REFERENCES users(id),
+            user_b BIGINT REFERENCES users(id),
+            started_at TIMESTAMPTZ DEFAULT NOW(),
+            last_message_at TIMESTAMPTZ DEFAULT NOW(),
+            is_active BOOLEAN DEFAULT true,
+            language_used TEXT
+        )
+    """)
+    logger.info("Created pairs table")
+    
+    # Create pair_members table (one row per user per pair, for per-user lookups)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS pair_members (
+            pair_id UUID NOT NULL REFERENCES pairs(pair_id),
+            user_id BIGINT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT true,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (pair_id, user_id)
+        )
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pair_members_user
+        ON pair_members(user_id, started_at DESC)
+    """)
+    # At most one active pair per user
+    await conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_pair_members_user_active
+        ON pair_members(user_id) WHERE is_active
+    """)
+    logger.info("Created pair_members table")
+    
+    # Create user_blocks table (one row per block; replaces users.blocked_users)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_blocks (
+            blocker_id BIGINT NOT NULL,
+            blocked_id BIGINT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (blocker_id, blocked_id)
+        )
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_blocks_blocked
+        ON user_blocks(blocked_id, blocker_id)
+    """)
+    logger.info("Created user_blocks table")
+    
+    # Create user_counters table (denormalised per-user statistics)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_counters (
+            user_id BIGINT PRIMARY KEY,
+            chats_total BIGINT NOT NULL DEFAULT 0,
+            chats_active INT NOT NULL DEFAULT 0,
+            messages_sent BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    logger.info("Created user_counters table")
+    
+    # Create referrals table
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS referrals (
+            id SERIAL PRIMARY KEY,
+            referrer_id BIGINT REFERENCES users(id),
+            referree_id BIGINT REFERENCES users(id),
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            UNIQUE(referrer_id, referree_id)
+        )
+    """)
+    logger.info("Created referrals table")
+    
+    # Create admin_logs table
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS admin_logs (
+            id SERIAL PRIMARY KEY,
+            admin_id BIGINT REFERENCES users(id),
+            action TEXT NOT NULL,
+            metadata JSONB DEFAULT '{}',
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    logger.info("Created admin_logs table")
+    
+    # Create messages table, range-partitioned by day (retention drops partitions)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id BIGSERIAL,
+            pair_id UUID REFERENCES pairs(pair_id),
+            from_id BIGINT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF messages DEFAULT
+    """)
+    today = utc_today()
+    await create_message_partitions(
+        conn,
+        today - timedelta(days=MESSAGE_RETENTION_DAYS),
+        today + timedelta(days=MESSAGE_PARTITION_DAYS_AHEAD)
+    )
+    logger.info("Created messages table and daily partitions")
+    
+    # Create reports table
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id SERIAL PRIMARY KEY,
+            pair_id UUID REFERENCES pairs(pair_id),
+            reported_by BIGINT REFERENCES users(id),
+            reported_user BIGINT REFERENCES users(id),
+            reason TEXT,
+            conversation_excerpt JSONB DEFAULT '[]',
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    logger.info("Created reports table")
+    
+    # Create global_counters table and the triggers that maintain it
+    # (16 shard rows per counter, picked by backend pid)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS global_counters (
+            name TEXT NOT NULL,
+            shard SMALLINT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, shard)
+        )
+    """)
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION bump_global_counter(counter TEXT, delta BIGINT) RETURNS void
+        LANGUAGE sql AS $$
+            INSERT INTO global_counters (name, shard, value)
+            VALUES (counter, pg_backend_pid() % 16, delta)
+            ON CONFLICT (name, shard) DO UPDATE SET value = global_counters.value + EXCLUDED.value
+        $$
+    """)
+    # Statement-level trigger: one counter update per statement, not per row
+    # (the reaper ends hundreds of pairs in one UPDATE)
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION count_global_rows() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            total_delta BIGINT := 0;
+            subset_delta BIGINT := 0;
+            rows_total BIGINT;
+            rows_subset BIGINT;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                EXECUTE format('SELECT COUNT(*), COUNT(*) FILTER (WHERE %s) FROM new_rows', TG_ARGV[2])
+                    INTO rows_total, rows_subset;
+                total_delta := total_delta + rows_total;
+                subset_delta := subset_delta + rows_subset;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                EXECUTE format('SELECT COUNT(*), COUNT(*) FILTER (WHERE %s) FROM old_rows', TG_ARGV[2])
+                    INTO rows_total, rows_subset;
+                total_delta := total_delta - rows_total;
+                subset_delta := subset_delta - rows_subset;
+            END IF;
+            IF total_delta <> 0 THEN
+                PERFORM bump_global_counter(TG_ARGV[0], total_delta);
+            END IF;
+            IF subset_delta <> 0 THEN
+                PERFORM bump_global_counter(TG_ARGV[1], subset_delta);
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+    for table, total, subset, predicate, events in COUNTED_TABLES:
+        for event in events:
+            referencing = COUNTER_TRIGGER_TRANSITIONS[event]
+            trigger = f"{table}_global_counters_{event.lower()}"
+            await conn.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+            await conn.execute(f"""
+                CREATE TRIGGER {trigger}
+                AFTER {event} ON {table}
+                REFERENCING {referencing}
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION count_global_rows('{total}', '{subset}', '{predicate.replace("'", "''")}')
+            """)
+        await conn.execute(f"""
+            INSERT INTO global_counters (name, shard, value)
+            SELECT counts.name, 0, counts.value
+            FROM (
+                SELECT '{total}' AS name, COUNT(*) AS value FROM {table}
+                UNION ALL
+                SELECT '{subset}', COUNT(*) FILTER (WHERE {predicate}) FROM {table}
+            ) counts
+            WHERE NOT EXISTS (SELECT 1 FROM global_counters g WHERE g.name = counts.name)
+        """)
+    logger.info("Created global_counters table and triggers")
+    
+    # Create indexes for the hot access paths (same as migration 003)
+    for index in ACCESS_PATH_INDEXES:
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+    logger.info("Created access path indexes")
+    
+    # Stamp the schema with the migration it matches, so startup can check it
+    # in one query and Alembic can upgrade it later
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS alembic_version (
+            version_num VARCHAR(32) NOT NULL PRIMARY KEY
+        )
+    """)
+    await conn.execute("""
+        INSERT INTO alembic_version (version_num)
+        SELECT $1 WHERE NOT EXISTS (SELECT 1 FROM alembic_version)
+    """, SCHEMA_VERSION)
+    logger.info(f"Stamped schema version {SCHEMA_VERSION}")
+    
+    logger.info("✅ Database initialization complete!")
+
+
 if __name__ == "__main__":
     asyncio.run(init_database(close_pool_after=True))
 
@@ -1,28 +1,36 @@
 """
 Main FastAPI application for Telegram Anonymous Chat Bot
 """
+import time
+
+_IMPORTS_STARTED = time.perf_counter()
+
 import os
 import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from telegram.ext import Application
 
+import asyncpg
 from config.settings import settings
-from bot.database.connection import get_pool, close_pool, execute_query
+from bot.database.connection import get_pool, close_pool
+from bot.database import repository
+from bot.database.partitions import maintain_message_partitions
 from bot.services.redis_client import get_redis, close_redis
-from bot.handlers.commands import (
-    handle_next, handle_stop, handle_report, handle_block,
-    handle_invite, handle_language, handle_policy
-)
-from bot.handlers.onboarding import handle_start
-from bot.handlers.chat import handle_message
-from bot.handlers.admin import handle_admin
-from bot.handlers.callbacks import handle_callback_query
-from telegram.ext import CallbackQueryHandler
-from config.constants import MESSAGE_RETENTION_DAYS
+from bot.services.admission import get_admission_controller, classify_update, build_busy_response
+from bot.services import metrics
+from bot.services.leader import LeaderElection
+from bot.services.pair_sessions import run_invalidation_listener, close_message_writer
+from bot.services import presence
+from bot.services.pair_reaper import PairReaper
+from bot.services import user_cache
+from bot.utils import json_codec
+from config.constants import MESSAGE_PARTITION_MAINTENANCE_INTERVAL, SCHEMA_VERSION, PRE_VERSIONING_SCHEMA_VERSION
+
+IMPORTS_SECONDS = time.perf_counter() - _IMPORTS_STARTED
 
 # Configure logging
 logging.basicConfig(
@@ -31,33 +39,74 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global Telegram application
-telegram_app: Application = None
-
 
-async def cleanup_old_messages():
-    """Background task to clean up old messages"""
+async def timed_phase(phases: dict, name: str, coro):
+    """Await a startup phase and record how long it took"""
+    started = time.perf_counter()
     try:
-        await execute_query(
-            f"""
-            DELETE FROM messages
-            WHERE created_at < NOW() - INTERVAL '{MESSAGE_RETENTION_DAYS} days'
-            """
-        )
-        logger.info("Cleaned up old messages")
-    except Exception as e:
-        logger.error(f"Error cleaning up messages: {e}")
+        return await coro
+    finally:
+        phases[name] = time.perf_counter() - started
+        metrics.set_gauge("startup_phase_seconds", phases[name], phase=name)
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Lifespan context manager for startup and shutdown"""
-    global telegram_app
-    
-    # Startup
-    logger.info("Starting application...")
+async def ensure_schema():
+    """
+    Check the schema version in one query; initialize the database if it is empty
+    A version mismatch fails startup: the named statements are prepared against
+    the current schema. A database created by init_db before it stamped a version
+    is stamped at PRE_VERSIONING_SCHEMA_VERSION first, so `alembic upgrade head`
+    runs the later migrations. SKIP_SCHEMA_CHECK bypasses this.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        try:
+            version = await repository.fetchval("schema.version", conn=conn)
+        except asyncpg.UndefinedTableError:
+            version = None
+        if version == SCHEMA_VERSION:
+            logger.info(f"Database ready - schema version {version}")
+            return
+        if version is not None:
+            raise RuntimeError(f"Database schema is at {version}, code expects {SCHEMA_VERSION}. Run: alembic upgrade head")
+        # Not stamped: either an empty database or one created before versioning
+        if await repository.fetchval("schema.table_exists", "users", conn=conn):
+            if await repository.fetchval("schema.table_exists", "pair_members", conn=conn):
+                # Newer than the pre-versioning schema, so its version can't be inferred
+                raise RuntimeError(
+                    "Database schema is not stamped and does not match the schema created before "
+                    "versioning. Check which migrations it matches, then run: alembic stamp <revision> "
+                    "&& alembic upgrade head"
+                )
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS alembic_version (
+                        version_num VARCHAR(32) NOT NULL PRIMARY KEY
+                    )
+                """)
+                await repository.execute("schema.stamp", PRE_VERSIONING_SCHEMA_VERSION, conn=conn)
+            logger.warning(f"Stamped the unversioned database at {PRE_VERSIONING_SCHEMA_VERSION}")
+            raise RuntimeError(
+                f"Database schema is at {PRE_VERSIONING_SCHEMA_VERSION}, code expects {SCHEMA_VERSION}. "
+                "Run: alembic upgrade head"
+            )
     
-    # Initialize database pool
+    logger.warning("Database tables not found. Auto-initializing database...")
+    try:
+        # Off the normal startup path, so only imported when needed
+        from init_db import init_database
+        await init_database(close_pool_after=False)
+        logger.info("✅ Database auto-initialized successfully!")
+    except ImportError as ie:
+        logger.error(f"Failed to import init_database: {ie}")
+        raise
+    except Exception as init_error:
+        logger.error(f"Database initialization error: {init_error}")
+        raise
+
+
+async def init_database_phase():
+    """Open the database pool and check the schema"""
     try:
         await get_pool()
         logger.info("Database connection pool initialized")
@@ -65,52 +114,47 @@ async def lifespan(app: FastAPI):
         logger.error(f"Failed to initialize database: {e}")
         raise
     
-    # Initialize Redis
+    if settings.skip_schema_check:
+        logger.info("Schema check skipped (SKIP_SCHEMA_CHECK)")
+        return
     try:
-        await get_redis()
-        logger.info("Redis connection initialized")
+        await ensure_schema()
     except Exception as e:
-        logger.error(f"Failed to initialize Redis: {e}")
+        logger.error(f"Database initialization failed: {e}")
+        logger.error("Please ensure DATABASE_URL is set and PostgreSQL is running.")
         raise
-    
-    # Initialize database tables if they don't exist
+
+
+async def init_redis_phase():
+    """Create the Redis client and open its first connection"""
     try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            # Check if users table exists
-            table_exists = await conn.fetchval("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'users'
-                )
-            """)
-            if not table_exists:
-                logger.warning("Database tables not found. Auto-initializing database...")
-                # Import and run initialization
-                try:
-                    from init_db import init_database
-                    await init_database(close_pool_after=False)
-                    logger.info("✅ Database auto-initialized successfully!")
-                except ImportError as ie:
-                    logger.error(f"Failed to import init_database: {ie}")
-                    raise
-                except Exception as init_error:
-                    logger.error(f"Database initialization error: {init_error}")
-                    raise
-            else:
-                logger.info("Database ready - all tables exist")
+        redis_client = await get_redis()
+        await redis_client.ping()
+        logger.info("Redis connection initialized")
     except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
-        logger.error("Please ensure DATABASE_URL is set and PostgreSQL is running.")
+        logger.error(f"Failed to initialize Redis: {e}")
         raise
-    
-    # Initialize Telegram bot
+
+
+async def init_telegram_phase() -> Application:
+    """Build the Telegram application, register handlers and validate the token"""
     try:
         if not settings.bot_token:
             raise ValueError("BOT_TOKEN is not set. Please configure it in Railway environment variables.")
         
         logger.info("Initializing Telegram bot...")
+        # Handler modules pull in most of the bot; importing them here overlaps
+        # with the database and Redis connects instead of delaying process start
+        from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, filters
+        from bot.handlers.commands import (
+            handle_next, handle_stop, handle_report, handle_block,
+            handle_invite, handle_language, handle_policy
+        )
+        from bot.handlers.onboarding import handle_start
+        from bot.handlers.chat import handle_message
+        from bot.handlers.admin import handle_admin
+        from bot.handlers.callbacks import handle_callback_query
+        
         telegram_app = Application.builder().token(settings.bot_token).build()
         
         # Register handlers (callback queries first for button clicks)
@@ -132,16 +176,7 @@ async def lifespan(app: FastAPI):
         # Initialize bot - this will validate the token with Telegram
         await telegram_app.initialize()
         logger.info("Telegram bot initialized successfully")
-        
-        # Set webhook if WEBHOOK_URL is configured
-        if settings.webhook_url:
-            try:
-                await telegram_app.bot.set_webhook(settings.webhook_url)
-                logger.info(f"✅ Webhook set to: {settings.webhook_url}")
-            except Exception as e:
-                logger.warning(f"Failed to set webhook: {e}. You can set it manually using the Telegram API.")
-        else:
-            logger.info("WEBHOOK_URL not set. Webhook will need to be set manually.")
+        return telegram_app
     except ValueError as e:
         logger.error(f"Configuration error: {e}")
         raise
@@ -165,20 +200,103 @@ async def lifespan(app: FastAPI):
         else:
             logger.error(f"Failed to initialize Telegram bot: {error_msg}")
         raise
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Lifespan context manager for startup and shutdown
+    Runs once per worker process; per-process resources live on app.state
+    """
+    telegram_app: Application = None
+    app.state.telegram_app = None
+    
+    # Startup
+    logger.info("Starting application...")
+    started = time.perf_counter()
+    phases = {"imports": IMPORTS_SECONDS}
+    metrics.set_gauge("startup_phase_seconds", IMPORTS_SECONDS, phase="imports")
+    
+    # Database, Redis and Telegram are independent: initialize them concurrently
+    _, _, telegram_app = await asyncio.gather(
+        timed_phase(phases, "database", init_database_phase()),
+        timed_phase(phases, "redis", init_redis_phase()),
+        timed_phase(phases, "telegram", init_telegram_phase())
+    )
+    app.state.telegram_app = telegram_app
+    background_started = time.perf_counter()
+    
+    # Only the elected process registers the webhook and runs periodic jobs
+    leader = LeaderElection(ttl_seconds=settings.leader_lock_ttl)
+    app.state.leader = leader
+    
+    async def register_webhook():
+        # Set webhook if WEBHOOK_URL is configured
+        if settings.webhook_url:
+            try:
+                await telegram_app.bot.set_webhook(settings.webhook_url)
+                logger.info(f"✅ Webhook set to: {settings.webhook_url}")
+            except Exception as e:
+                logger.warning(f"Failed to set webhook: {e}. You can set it manually using the Telegram API.")
+        else:
+            logger.info("WEBHOOK_URL not set. Webhook will need to be set manually.")
     
-    # Start background task for cleanup
+    leader.on_elected(register_webhook)
+    leader.on_elected(maintain_message_partitions)
+    leader.on_elected(presence.prune_presence)
+    leader.start()
+    
+    # Sticky routing between worker processes
+    router = None
+    if settings.sticky_routing and settings.web_concurrency > 1:
+        from bot.services.routing import StickyRouter
+        router = StickyRouter(settings.routing_socket_dir)
+        await router.start(internal_app)
+    app.state.router = router
+    
+    # Start background task for messages partition maintenance (creation ahead, retention)
     async def periodic_cleanup():
         while True:
-            await asyncio.sleep(86400)  # Run once per day
-            await cleanup_old_messages()
+            await asyncio.sleep(MESSAGE_PARTITION_MAINTENANCE_INTERVAL)
+            if leader.is_leader:
+                await maintain_message_partitions()
+                await presence.prune_presence()
     
     cleanup_task = asyncio.create_task(periodic_cleanup())
     
+    # End abandoned pairs (leader only)
+    reaper = PairReaper(telegram_app.bot, is_leader=lambda: leader.is_leader)
+    reaper.start()
+    
+    # Drop in-memory pair sessions ended by other workers
+    sessions_task = asyncio.create_task(run_invalidation_listener())
+    
+    # Drop cached user profiles updated by other workers
+    profiles_task = asyncio.create_task(user_cache.run_invalidation_listener())
+    
+    phases["background"] = time.perf_counter() - background_started
+    metrics.set_gauge("startup_phase_seconds", phases["background"], phase="background")
+    ready = time.perf_counter() - started
+    metrics.set_gauge("startup_seconds", IMPORTS_SECONDS + ready)
+    logger.info(
+        f"Startup complete in {IMPORTS_SECONDS + ready:.2f}s ("
+        + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items())
+        + ")"
+    )
+    
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
     cleanup_task.cancel()
+    reaper.stop()
+    sessions_task.cancel()
+    profiles_task.cancel()
+    await close_message_writer()
+    await presence.flush_presence()
+    await leader.stop()
+    if router:
+        await router.stop()
     
     if telegram_app:
         await telegram_app.shutdown()
@@ -210,7 +328,7 @@ async def health_check():
         # Check database
         pool = await get_pool()
         async with pool.acquire() as conn:
-            await conn.fetchval("SELECT 1")
+            await repository.fetchval("health.ping", conn=conn)
         
         # Check Redis
         redis_client = await get_redis()
@@ -228,10 +346,15 @@ async def health_check():
         )
 
 
-@app.post("/webhook")
-async def webhook(request: Request):
-    """Telegram webhook endpoint"""
-    global telegram_app
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metrics endpoint (Prometheus text format)"""
+    return PlainTextResponse(metrics.render_prometheus())
+
+
+async def process_update(data: dict):
+    """Process an update in this worker"""
+    telegram_app = app.state.telegram_app
     
     if not telegram_app:
         return JSONResponse(
@@ -239,9 +362,16 @@ async def webhook(request: Request):
             content={"error": "Bot not initialized"}
         )
     
+    # Admission control: shed low priority work with a cheap reply when overloaded
+    admission = get_admission_controller()
+    priority = classify_update(data)
+    if not await admission.acquire(priority):
+        return build_busy_response(data)
+    
     try:
-        data = await request.json()
         update = Update.de_json(data, telegram_app.bot)
+        if update.effective_user:
+            presence.touch(update.effective_user.id)
         await telegram_app.process_update(update)
         return {"status": "ok"}
     except Exception as e:
@@ -250,6 +380,44 @@ async def webhook(request: Request):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"error": str(e)}
         )
+    finally:
+        admission.release()
+
+
+@app.post("/webhook")
+async def webhook(request: Request):
+    """Telegram webhook endpoint"""
+    body = await request.body()
+    try:
+        data = json_codec.loads(body)
+    except Exception as e:
+        logger.error(f"Invalid webhook payload: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"error": "Invalid JSON"}
+        )
+    
+    # Forward to the worker that owns this user's pair, if it isn't us
+    router = getattr(request.app.state, "router", None)
+    if router:
+        owner = await router.owner_for(data)
+        if owner:
+            forwarded = await router.forward(owner, body)
+            if forwarded:
+                status_code, content = forwarded
+                return JSONResponse(status_code=status_code, content=content)
+    
+    return await process_update(data)
+
+
+# Internal app served on each worker's Unix socket for routed updates
+internal_app = FastAPI(title="Worker internal endpoint")
+
+
+@internal_app.post("/internal/update")
+async def internal_update(request: Request):
+    """Process an update forwarded by another worker"""
+    return await process_update(json_codec.loads(await request.body()))
 
 
 if __name__ == "__main__":